@@ -2,12 +2,21 @@ import json
 import logging
 import time
 from configparser import ConfigParser
-from contextlib import closing
+from typing import Dict, List, Optional, Tuple
 from urllib.error import HTTPError, URLError
-from urllib.request import urlopen
 
+from Aggregates import Aggregates
 from Aircraft import Aircraft
+from AircraftMetadata import AircraftMetadata, open_metadata
 from Database import Database
+from FlightJournal import FlightJournal
+from Metrics import metrics
+from PollScheduler import PollScheduler
+from Record import Record
+from Sources import open_source
+from StateSnapshot import StateSnapshot
+from Tracker import FlightTracker
+from TrafficSeries import TrafficSeries
 
 log = logging.getLogger(__name__)
 
@@ -15,6 +24,12 @@ log = logging.getLogger(__name__)
 class ADSBLogger:
     config: ConfigParser
     database: Database = None  # type: ignore
+    journal: Optional[FlightJournal] = None
+    # Failed database writes at the start of the journal segment
+    journal_errors: int = 0
+    state_snapshot: Optional[StateSnapshot] = None
+    # Registration and type of aircraft not provided by readsb
+    metadata: Optional[AircraftMetadata] = None
 
     # Timestamps
     time_json: int = 0
@@ -23,137 +38,388 @@ class ADSBLogger:
 
     # Aircraft lists
     current: list = []
-    tracked: list = []
+    current_count: int = 0
+    new_flights: int = 0
+    tracked: FlightTracker
+    # Tracked flights of the currently seen aircraft by hex
+    visible: Dict[str, Aircraft]
+    # Last data contained all seen aircraft, not only the updated ones
+    complete: bool = True
+    # Position of the last distance to the receiver in the aggregates
+    r_dst_last = Aggregates.column_list.index("r_dst_last")
+    # Memory budget of the tracked flights in bytes, None if unlimited
+    memory_budget: Optional[int] = None
 
-    # Observed record values
-    records: list = []
+    # Message counter of readsb in the last snapshot, and traffic per minute
+    messages: Optional[int] = None
+    traffic: TrafficSeries
+
+    # Message counter and tracked flight of the last snapshot by hex,
+    # and message counters of new or changed aircraft by hex
+    snapshot: Dict[str, Tuple[int, Aircraft]]
+    changed: Dict[str, int]
+
+    # Observed record values, and new records with the aircraft that set them
+    records: list
+    new_records: List[Tuple[Record, Aircraft]]
 
     def __init__(self, config: ConfigParser) -> None:
         log.info("Starting ADS-B Logger")
         self.config = config
+        self.tracked = FlightTracker()
+        self.visible = {}
+        self.snapshot = {}
+        self.changed = {}
+        self.records = []
+        self.new_records = []
+        memory_budget = self.config.get(
+            "PROCESSING", "memory_budget", fallback=""
+        ).strip()
+        self.memory_budget = (
+            int(float(memory_budget) * 1024**2) if memory_budget else None
+        )
+        # Holds the minutes between database writes
+        self.traffic = TrafficSeries(
+            int(self.config.getfloat("TIMEOUTS", "db_write") // 60) + 2
+        )
+
+        # Serve metrics for Prometheus
+        port = self.config.get("METRICS", "port", fallback="").strip()
+        if port:
+            metrics.serve(
+                int(port),
+                self.config.get("METRICS", "address", fallback="127.0.0.1").strip(),
+            )
+
+        # Schedule polls after the updates of the aircraft data
+        self.scheduler = PollScheduler(
+            self.config.getfloat("TIMEOUTS", "main_loop"),
+            self.config.getfloat("TIMEOUTS", "error_backoff", fallback=60),
+        )
+
+        # Set up aircraft database, the index is built at the first start
+        self.metadata = open_metadata(self.config)
 
         # Set up JSON path
         log.debug(f"JSON path: {self.config['PATHS']['json'].strip()}")
+        self.source = open_source(
+            self.config["PATHS"]["json"].strip(),
+            self.config.getfloat("TIMEOUTS", "http_read"),
+            self.config.getfloat("TIMEOUTS", "main_loop"),
+        )
         self.fetch_adsb_info()
 
         # Set up database
         self.database = Database(self.config)
 
-        # Read recent flights from database
+        # Store flights from the journal that were not written before a crash
+        journal_flights = []
+        path_journal = self.config.get("PATHS", "journal", fallback="").strip()
+        if path_journal:
+            log.debug(f"Journal path: {path_journal}")
+            self.journal = FlightJournal(path_journal)
+            journal_flights = self.journal.read()
+            if journal_flights:
+                log.info(f"Recovered {len(journal_flights)} flights from journal")
+                # The journal is kept for the next start if the write fails
+                self.database.write_flights(journal_flights, self.journal.clear)
+                self.database.flush()
+                self.journal_errors = self.database.write_errors
+            else:
+                self.journal.clear()
+
+        # Read recent flights and records from the state snapshot, which also
+        # keeps the end times and aggregates of the flights
+        # Streams and multiple receivers may not provide data immediately
         timestamp_min = int(
-            self.time_json - self.config["TIMEOUTS"].getfloat("unique_flight")
+            (self.time_json or time.time())
+            - self.config.getfloat("TIMEOUTS", "unique_flight")
         )
-        for t in self.database.read_recent_flights(timestamp_min):
-            self.tracked.append(t)
-        for r in self.database.read_records():
+        state = None
+        path_snapshot = self.config.get("PATHS", "snapshot", fallback="").strip()
+        if path_snapshot:
+            log.debug(f"State snapshot path: {path_snapshot}")
+            self.state_snapshot = StateSnapshot(path_snapshot)
+            state = self.state_snapshot.load(
+                self.database.path, self.database.schema_version, timestamp_min
+            )
+        if state is not None:
+            tracked, records = state
+            # Flights of the journal are newer after a crash
+            known = {(t.time_start, t.hex) for t in tracked}
+            tracked.extend(
+                t for t in journal_flights if (t.time_start, t.hex) not in known
+            )
+        else:
+            # Read recent flights and records from database
+            tracked = self.database.read_recent_flights(timestamp_min)
+            records = self.database.read_records()
+        for t in tracked:
+            if t.time_start is not None and t.time_start >= timestamp_min:
+                self.tracked.add(t)
+        for r in records:
             self.records.append(r)
 
     def loop(self):
-        if self.time_print_info < self.time_json - self.config["TIMEOUTS"].getfloat(
-            "print_info"
+        if self.time_print_info < self.time_json - self.config.getfloat(
+            "TIMEOUTS", "print_info"
         ):
             log.info(
-                f"{len(self.current)} currently seen flights, "
-                f"{len(self.tracked)} tracked recent flights"
+                f"{self.current_count} currently seen flights, "
+                f"{len(self.tracked)} tracked recent flights, "
+                f"{self.database.write_queue_depth} pending database writes, "
+                f"{self.scheduler.missed} missed updates"
             )
+            if self.config.getboolean("METRICS", "summary", fallback=True):
+                log.info(metrics.summary())
             self.time_print_info = self.time_json
 
-        if self.time_db_write < self.time_json - self.config["TIMEOUTS"].getfloat(
-            "db_write"
+        if self.time_db_write < self.time_json - self.config.getfloat(
+            "TIMEOUTS", "db_write"
         ):
-            self.database.write_records(self.records, False)
-            self.clean_tracked_flights()
+            with metrics.timer("write_records"):
+                self.database.write_records(self.records)
+            with metrics.timer("write_flights"):
+                self.clean_tracked_flights()
+            self.database.write_traffic(self.traffic.flush(self.time_json))
+            self.write_state_snapshot()
+            if self.metadata is not None:
+                self.metadata.refresh()
             self.time_db_write = self.time_json
 
         if self.fetch_adsb_info():
             return
 
-        self.check_records()
-        self.merge_flights()
+        with metrics.timer("check_records"):
+            self.check_records()
+        with metrics.timer("merge_flights"):
+            self.merge_flights()
+        self.record_traffic()
+        self.spill_tracked_flights()
+
+        metrics.set("current_aircraft", self.current_count)
+        metrics.set("tracked_flights", len(self.tracked))
+        metrics.set("tracked_flights_bytes", self.tracked.size)
+        metrics.set("write_queue_depth", self.database.write_queue_depth)
 
     def __del__(self) -> None:
         log.info("Stopping ADS-B Logger")
+        self.source.close()
+        metrics.close()
 
-        self.database.write_records(self.records, False)
+        self.database.write_records(self.records)
+        self.database.write_traffic(self.traffic.flush())
 
         # Write tracked (cached) flights to database
-        self.database.write_flights(self.tracked)
-        del self.database
+        journal = self.journal
+        self.database.write_flights(
+            self.tracked, None if journal is None else journal.clear
+        )
+        self.write_state_snapshot()
+        self.database.close()
 
     def clean_tracked_flights(self) -> None:
-        outdated = []
-        for t in self.tracked:
-            if t.time_start < self.time_json - self.config["TIMEOUTS"].getfloat(
-                "unique_flight"
-            ):
-                outdated.append(t)
-                self.tracked.remove(t)
-        self.database.write_flights(outdated)
+        time_min = self.time_json - self.config.getfloat("TIMEOUTS", "unique_flight")
+        expired = self.tracked.expire(time_min)
+        if self.journal is None:
+            self.database.write_flights(expired)
+            return
+
+        # Remove the old journal segment once the expired flights are stored,
+        # and if no flights (e.g., spilled ones) failed to be stored meanwhile
+        journal = self.journal
+        database = self.database
+        errors = self.journal_errors
+        segment = journal.rotate(self.tracked)
+        self.journal_errors = database.write_errors
+
+        def stored() -> None:
+            if segment is None:
+                return
+            if database.write_errors != errors:
+                log.warning(f"Keeping journal segment {segment} for the next start")
+                return
+            journal.remove(segment)
+
+        database.write_flights(expired, stored)
+
+    def spill_tracked_flights(self) -> None:
+        if self.memory_budget is None or self.tracked.size <= self.memory_budget:
+            return
+        # Spill a tenth of the budget, so flights are not written every poll
+        spilled = self.tracked.spill(self.memory_budget * 9 // 10)
+        log.warning(
+            f"Memory budget of {self.memory_budget / 1024**2:.3g} MiB for tracked "
+            f"flights exceeded, storing {len(spilled)} oldest flights in database"
+        )
+        metrics.count("spilled_flights_total", len(spilled))
+        self.database.write_flights(spilled)
+        # Unchanged aircraft must not extend the spilled flights
+        self.snapshot = {}
+
+    def write_state_snapshot(self) -> None:
+        if self.state_snapshot is None:
+            return
+        with metrics.timer("write_snapshot"):
+            data = self.state_snapshot.dump(
+                self.time_json,
+                self.database.path,
+                self.database.schema_version,
+                self.tracked,
+                self.records,
+            )
+        # Written after the pending database writes, which it includes
+        snapshot = self.state_snapshot
+        self.database.submit(lambda connection: snapshot.write(data))
 
     def fetch_adsb_info(self) -> bool:
         # Fetch newest JSON with ADS-B data
+        metrics.count("polls_total")
         try:
-            with closing(
-                urlopen(
-                    self.config["PATHS"]["json"].strip(),
-                    None,
-                    self.config["TIMEOUTS"].getfloat("http_read"),
-                )
-            ) as aircraft_file:
-                aircraft_data = json.load(aircraft_file)
-        except TimeoutError as e:
+            aircraft_data = self.source.fetch()
+        except (
+            TimeoutError,
+            HTTPError,
+            URLError,
+            ConnectionError,
+            json.JSONDecodeError,
+        ) as e:
             log.error(e)
-            return True
-        except (HTTPError, URLError, json.JSONDecodeError) as e:
-            log.error(e)
-            time.sleep(self.config["TIMEOUTS"].getfloat("http_read"))
+            metrics.count("fetch_errors_total")
+            self.scheduler.error()
             return True
 
         # Check if data is new
-        now = aircraft_data["now"]
-        if self.time_json >= now:
+        if aircraft_data is None or self.time_json >= aircraft_data["now"]:
+            metrics.count("stale_snapshots_total")
+            self.scheduler.stale()
             return True
-        self.time_json = now
+        self.time_json = aircraft_data["now"]
+        self.messages = aircraft_data.get("messages")
+        self.scheduler.update(self.time_json)
+
+        # Snapshots contain all seen aircraft, e.g., the aircraft.json file,
+        # while the updates of a stream only contain the changed aircraft
+        self.complete = getattr(self.source, "complete", True)
+        if self.complete:
+            self.visible = {}
+            self.current_count = len(aircraft_data["aircraft"])
 
-        # Parse all aircraft data
+        # Parse new or changed aircraft data
+        # Aircraft without new messages only extend their tracked flight
+        time_parse = time.perf_counter()
+        incremental = self.config.getboolean(
+            "PROCESSING", "incremental", fallback=False
+        )
+        time_min = self.time_json - self.config.getfloat("TIMEOUTS", "unique_flight")
+        snapshot = {}
+        self.changed = {}
         self.current = []
         for a in aircraft_data["aircraft"]:
-            aircraft = Aircraft()
-            aircraft.parse_data_dict(a)
+            messages = a.get("messages") if incremental else None
+            if messages is not None:
+                previous = self.snapshot.get(a.get("hex"))
+                if previous is not None and previous[0] == messages:
+                    tracked = previous[1]
+                    if tracked.time_start is not None and tracked.time_start > time_min:
+                        tracked.time_end = self.time_json
+                        snapshot[a.get("hex")] = previous
+                        self.visible[a.get("hex")] = tracked
+                        continue
+                self.changed[a.get("hex")] = messages
 
+            aircraft = Aircraft.from_data_dict(a)
             aircraft.time_start = self.time_json
             aircraft.time_end = self.time_json
 
             self.current.append(aircraft)
+        self.snapshot = snapshot
+        metrics.observe("parse", time.perf_counter() - time_parse)
         return False
 
     def check_records(self) -> None:
-        for c in self.current:
-            for r in self.records:
-                if r.compare_aircraft(c):
-                    r.timestamp = self.time_json
-                    r.aircraft = c
-                    r.is_stored = False
-                    m = "max" if r.is_max else "min"
-                    log.info(
-                        f"Registration {r.aircraft.registration} "
-                        f"set new record for {m} {r.record_key}: "
-                        f"{getattr(r.aircraft.states, r.record_key)}"
-                    )
-                    self.print_flight_info(c, "Record")
+        # Collect the values of each state key once for all current aircraft
+        columns: dict = {}
+        for r in self.records:
+            if r.record_key not in columns:
+                columns[r.record_key] = [
+                    (v, c)
+                    for c in self.current
+                    if (v := getattr(c.states, r.record_key)) is not None
+                ]
+
+        # Only the best aircraft of this poll can set a new record
+        self.new_records = []
+        for r in self.records:
+            c = r.best_aircraft(columns[r.record_key])
+            if c is not None and r.compare_aircraft(c):
+                if self.metadata is not None:
+                    self.metadata.fill(c)
+                r.timestamp = self.time_json
+                r.is_stored = False
+                self.new_records.append((r, c))
+                m = "max" if r.is_max else "min"
+                log.info(
+                    f"Registration {c.registration} "
+                    f"set new record for {m} {r.record_key}: "
+                    f"{getattr(c.states, r.record_key)}"
+                )
+                self.print_flight_info(c, "Record")
 
     def merge_flights(self) -> None:
         # Merge current flights with tracked (cached) flights
+        time_min = self.time_json - self.config.getfloat("TIMEOUTS", "unique_flight")
+        self.new_flights = 0
         for c in self.current:
-            for t in reversed(self.tracked):
-                if t.time_start > self.time_json - self.config["TIMEOUTS"].getfloat(
-                    "unique_flight"
-                ) and t.is_identical(c):
-                    t.merge(c)
-                    break
-            else:
-                self.tracked.append(c)
+            t = self.tracked.find(c, time_min)
+            if t is None:
+                if self.metadata is not None:
+                    self.metadata.fill(c)
+                t = self.tracked.add(c)
+                self.new_flights += 1
                 self.print_flight_info(c, "New")
+                if self.journal is not None:
+                    self.journal.append(t)
+            elif self.tracked.merge(t, c) and self.journal is not None:
+                self.journal.append(t)
+            if c.hex in self.changed:
+                self.snapshot[c.hex] = (self.changed[c.hex], t)
+            self.visible[c.hex] = t
+        if self.journal is not None:
+            self.journal.flush()
+
+        # Aircraft of a stream are seen until a timeout after their last update
+        if not self.complete:
+            time_visible = self.time_json - self.config.getfloat(
+                "TIMEOUTS", "visible", fallback=60
+            )
+            self.visible = {
+                hex: t
+                for hex, t in self.visible.items()
+                if t.time_end is not None and t.time_end >= time_visible
+            }
+            self.current_count = len(self.visible)
+
+        # Copy the aircraft of new records, with the identifiers of their merged
+        # tracked flights (e.g., the flight of a sample with only the hex)
+        for r, c in self.new_records:
+            r.assign_aircraft(c)
+
+    def record_traffic(self) -> None:
+        # Aircraft without new messages keep their distance of the last update
+        distances = [
+            d
+            for t in self.visible.values()
+            if t.aggregates is not None
+            and (d := t.aggregates.values[self.r_dst_last]) is not None
+        ]
+        self.traffic.record(
+            self.time_json,
+            self.current_count,
+            self.new_flights,
+            self.messages,
+            max(distances, default=None),
+        )
 
     def print_flight_info(
         self, aircraft: Aircraft, header: str, log_type: str = ""
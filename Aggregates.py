@@ -0,0 +1,71 @@
+import dataclasses
+import logging
+from operator import attrgetter
+from typing import ClassVar, List, Optional, Sequence, Tuple
+
+from States import States
+
+log = logging.getLogger(__name__)
+
+# Values of all state variables, in the order of the field list
+state_values = attrgetter(*States.field_list)
+
+
+@dataclasses.dataclass(slots=True)
+class Aggregates:
+    """Running minimum, maximum, last value, and number of samples of a flight
+
+    The values are kept for each state variable, in the order of the field
+    list of the states, in a single list in the order of the columns. Memory
+    does not grow with the number of samples.
+    """
+
+    # Names of the aggregates, each one stored as column <key>_<name>
+    # The column list is set once below the class definition
+    name_list: ClassVar[Tuple[str, ...]] = ("min", "max", "last", "count")
+    column_list: ClassVar[Tuple[str, ...]] = ()
+
+    values: List[Optional[float]]
+
+    @classmethod
+    def from_states(cls, states: Optional[States]) -> "Aggregates":
+        """Returns the aggregates of a single sample"""
+        if states is None:
+            return cls([None, None, None, 0] * len(States.field_list))
+        return cls(
+            [a for v in state_values(states) for a in (v, v, v, int(v is not None))]
+        )
+
+    @classmethod
+    def from_row(cls, row: Sequence) -> "Aggregates":
+        """Returns the aggregates of the columns of a database row"""
+        values = list(row)
+        values[3::4] = [c or 0 for c in row[3::4]]
+        return cls(values)
+
+    def row(self) -> tuple:
+        """Returns the values of the columns, in the order of the column list"""
+        return tuple(self.values)
+
+    def add(self, states: States) -> None:
+        """Adds the values of a sample of the states"""
+        values = self.values
+        for i, value in enumerate(state_values(states)):
+            if value is None:
+                continue
+            # Minimum, maximum, last value, and count of the state variable
+            j = 4 * i
+            if not values[j + 3]:
+                values[j] = value
+                values[j + 1] = value
+            elif value < values[j]:  # type: ignore
+                values[j] = value
+            elif value > values[j + 1]:  # type: ignore
+                values[j + 1] = value
+            values[j + 2] = value
+            values[j + 3] += 1  # type: ignore
+
+
+Aggregates.column_list = tuple(
+    f"{s}_{n}" for s in States.field_list for n in Aggregates.name_list
+)
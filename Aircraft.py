@@ -1,42 +1,85 @@
 import dataclasses
 import logging
-import numbers
-from typing import Optional
+from typing import ClassVar, Dict, List, Optional
 
+from Aggregates import Aggregates
 from States import States
 
 log = logging.getLogger(__name__)
 
+# Shared copies of the identifier strings, which repeat in every poll
+# The table is cleared when full, as unique values (e.g., flights) accumulate
+interned: Dict[str, str] = {}
+interned_max = 65536
 
-@dataclasses.dataclass
+
+def intern(value: Optional[str]) -> Optional[str]:
+    """Returns the shared copy of an identifier string"""
+    if value is None:
+        return None
+    shared = interned.get(value)
+    if shared is None:
+        if len(interned) >= interned_max:
+            interned.clear()
+        interned[value] = shared = value
+    return shared
+
+
+@dataclasses.dataclass(slots=True)
 class Aircraft:
-    unique_var = ["hex", "flight", "registration", "ac_type"]
-    overwrite_var = []  # type: ignore
+    unique_var: ClassVar[List[str]] = ["hex", "flight", "registration", "ac_type"]
+    overwrite_var: ClassVar[List[str]] = []
 
     hex: Optional[str] = None
     flight: Optional[str] = None
     registration: Optional[str] = None
 
     ac_type: Optional[str] = None
-    states: Optional[States] = None
+    states: Optional[States] = dataclasses.field(default_factory=States)
 
     time_start: Optional[int] = None
     time_end: Optional[int] = None
 
-    def __init__(self) -> None:
-        self.states = States()
+    # Aggregates of the states of all merged samples, created with the first merge
+    aggregates: Optional[Aggregates] = None
 
-    def parse_data_dict(self, data: dict) -> None:
-        self.hex = data.get("hex")
-        self.flight = data.get("flight")
-        self.registration = data.get("r")
-        self.ac_type = data.get("t")
+    @classmethod
+    def from_data_dict(cls, data: dict) -> "Aircraft":
+        """Returns the aircraft of an entry in the aircraft.json file"""
+        return cls(
+            intern(data.get("hex")),
+            intern(data.get("flight")),
+            intern(data.get("r")),
+            intern(data.get("t")),
+            States.from_data_dict(data),
+        )
 
-        if self.states is None:  # mypy fix
-            self.states = States()
-        for s in self.states.key_list:
-            if isinstance(data.get(s), numbers.Number):
-                setattr(self.states, s, data.get(s))
+    def parse_data_dict(self, data: dict) -> None:
+        self.hex = intern(data.get("hex"))
+        self.flight = intern(data.get("flight"))
+        self.registration = intern(data.get("r"))
+        self.ac_type = intern(data.get("t"))
+        self.states = States.from_data_dict(data)
+
+    def compact(self) -> "Aircraft":
+        """Returns a copy for tracking, with the states only in the aggregates
+
+        The states of the samples are not kept, e.g., for records.
+        """
+        return Aircraft(
+            intern(self.hex),
+            intern(self.flight),
+            intern(self.registration),
+            intern(self.ac_type),
+            None,
+            self.time_start,
+            self.time_end,
+            (
+                Aggregates.from_states(self.states)
+                if self.aggregates is None
+                else self.aggregates
+            ),
+        )
 
     def is_identical(self, data) -> bool:
         """Returns true if the unique identifiers are identical"""
@@ -45,19 +88,12 @@ class Aircraft:
         ), f"Cannot compare {type(self)} with {type(self)}"
 
         # Compare unique identifiers
-        if isinstance(self.unique_var, list):
-            identifiers = self.unique_var
-        else:
-            identifiers = [self.unique_var]
-        for identifier in identifiers:
-            if not (
-                getattr(self, identifier) is None
-                or getattr(data, identifier) is None
-                or getattr(self, identifier) == getattr(data, identifier)
-            ):
+        for identifier in self.unique_var:
+            own = getattr(self, identifier)
+            other = getattr(data, identifier)
+            if not (own is None or other is None or own == other):
                 return False
-        else:
-            return True
+        return True
 
     def merge(self, data):
         assert isinstance(
@@ -65,25 +101,23 @@ class Aircraft:
         ), f"Cannot compare {type(self)} with {type(self)}"
 
         # Merge variables two-way
-        if isinstance(self.unique_var, list):
-            vars = self.unique_var
-        else:
-            vars = [self.unique_var]
-        for var in vars:
+        for var in self.unique_var:
             if getattr(self, var) is None:
                 setattr(self, var, getattr(data, var))
             elif getattr(data, var) is None:
                 setattr(data, var, getattr(self, var))
 
         # Overwrite remaining variables
-        if isinstance(self.overwrite_var, list):
-            vars = self.overwrite_var
-        else:
-            vars = [self.overwrite_var]
-        for var in vars:
-            if not getattr(data, var) is None:
+        for var in self.overwrite_var:
+            if getattr(data, var) is not None:
                 setattr(self, var, getattr(data, var))
 
+        # Update the aggregates, which include the states of the first sample
+        if data.states is not None:
+            if self.aggregates is None:
+                self.aggregates = Aggregates.from_states(self.states)
+            self.aggregates.add(data.states)
+
         self.time_start = min(self.time_start, data.time_start)
         self.time_end = max(self.time_end, data.time_end)
 
@@ -0,0 +1,244 @@
+import gzip
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from configparser import ConfigParser
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from Aircraft import Aircraft, intern
+
+log = logging.getLogger(__name__)
+
+
+class AircraftMetadata:
+    """Registration and type of aircraft by hex, from the tar1090-db
+
+    The aircraft.csv.gz file of the tar1090-db is converted once into an
+    index file, which is memory-mapped, so processes share its pages and
+    the file is not loaded into memory. The index holds the sorted hex
+    values, the offsets of the registration and type of each aircraft, and
+    the null-terminated strings. It is rebuilt when the size or modification
+    time of the source file changes, in the background while running. The
+    index is a local cache in native byte order, a mismatch is detected with
+    the version.
+    """
+
+    magic = b"ADSBMETA"
+    version = 1
+    # Magic bytes, version, size and modification time of the source, count
+    header = struct.Struct("=8sIqqI")
+
+    file: Optional[BinaryIO] = None
+    mapping: Optional[mmap.mmap] = None
+    # Views of the sorted hex values and the offsets of the strings
+    keys: Optional[memoryview] = None
+    offsets: Optional[memoryview] = None
+    count: int = 0
+    strings_start: int = 0
+    source_version: Optional[Tuple[int, int]] = None
+    # Background rebuild after the source file has changed
+    builder: Optional[threading.Thread] = None
+    rebuilt: bool = False
+
+    def __init__(self, source: str, path: str) -> None:
+        self.source = source
+        self.path = path
+        if not self.open():
+            self.build()
+            if not self.open():
+                raise OSError(f"Invalid aircraft index {self.path}")
+
+    def __del__(self) -> None:
+        self.close()
+
+    def stat_source(self) -> Optional[Tuple[int, int]]:
+        """Returns the size and modification time of the source file"""
+        try:
+            stat = os.stat(self.source)
+        except OSError as e:
+            log.warning(f"Aircraft database not available: {e}")
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def open(self) -> bool:
+        """Maps the index, returns false if it is missing or outdated"""
+        self.close()
+        try:
+            self.file = open(self.path, "rb")
+            self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, size, mtime, count = self.header.unpack_from(self.mapping)
+        except (OSError, ValueError, struct.error):
+            self.close()
+            return False
+
+        # Without the source, an existing index is still used
+        source_version = self.stat_source()
+        start = self.header.size
+        middle = start + 4 * count
+        end = middle + 8 * count
+        if (
+            magic != self.magic
+            or version != self.version
+            or source_version not in [None, (size, mtime)]
+            or len(self.mapping) < end
+        ):
+            self.close()
+            return False
+
+        self.count = count
+        self.strings_start = end
+        self.source_version = (size, mtime)
+        self.keys = memoryview(self.mapping)[start:middle].cast("I")
+        self.offsets = memoryview(self.mapping)[middle:end].cast("I")
+        log.info(f"Opened aircraft index {self.path} with {count} aircraft")
+        return True
+
+    def build(self) -> None:
+        """Converts the source file into the index file"""
+        source_version = self.stat_source()
+        if source_version is None:
+            return
+        log.info(f"Building aircraft index {self.path} from {self.source}")
+        keys = array("I")
+        offsets = array("I")
+        # Offset 0 is the empty string, types are stored once
+        strings = bytearray(b"\0")
+        types: Dict[str, int] = {"": 0}
+
+        def append(value: str) -> int:
+            if not value:
+                return 0
+            offset = len(strings)
+            strings.extend(value.encode() + b"\0")
+            return offset
+
+        with gzip.open(
+            self.source, "rt", encoding="utf-8", errors="replace"
+        ) as source_file:
+            # Columns: hex;registration;type;flags;description;year;owner
+            for line in source_file:
+                fields = line.split(";", 3)
+                if len(fields) < 3:
+                    continue
+                try:
+                    key = int(fields[0], 16)
+                except ValueError:
+                    continue
+                if not 0 <= key < 2**24:
+                    continue
+                if fields[2] not in types:
+                    types[fields[2]] = append(fields[2])
+                keys.append(key)
+                offsets.append(append(fields[1]))
+                offsets.append(types[fields[2]])
+
+        # The tar1090-db is sorted by hex, other files are sorted here
+        if any(keys[i] > keys[i + 1] for i in range(len(keys) - 1)):
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            keys = array("I", (keys[i] for i in order))
+            offsets = array("I", (offsets[2 * i + j] for i in order for j in range(2)))
+
+        path_tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(path_tmp, "wb") as index_file:
+            index_file.write(
+                self.header.pack(self.magic, self.version, *source_version, len(keys))
+            )
+            index_file.write(keys.tobytes())
+            index_file.write(offsets.tobytes())
+            index_file.write(strings)
+        # Processes with the previous index keep their mapping
+        os.replace(path_tmp, self.path)
+        log.info(f"Stored {len(keys)} aircraft in aircraft index")
+
+    def rebuild(self) -> None:
+        try:
+            self.build()
+        except (OSError, EOFError, zlib.error) as e:
+            # E.g., the source file is being downloaded, retried later
+            log.error(f"Could not build aircraft index: {e}")
+            return
+        self.rebuilt = True
+
+    def refresh(self) -> None:
+        """Rebuilds the index in the background if the source file has changed
+
+        The rebuilt index is mapped by the next call after the rebuild.
+        """
+        if self.builder is not None:
+            if self.builder.is_alive():
+                return
+            self.builder = None
+            if self.rebuilt:
+                self.rebuilt = False
+                self.open()
+            return
+        source_version = self.stat_source()
+        if source_version is None or source_version == self.source_version:
+            return
+        self.builder = threading.Thread(target=self.rebuild, daemon=True)
+        self.builder.start()
+
+    def string(self, offset: int) -> Optional[str]:
+        if not offset or self.mapping is None:
+            return None
+        start = self.strings_start + offset
+        end = self.mapping.find(b"\0", start)
+        return self.mapping[start:end].decode()
+
+    def lookup(self, hex: Optional[str]) -> Optional[int]:
+        """Returns the position of the hex in the index, or None"""
+        if hex is None or self.keys is None:
+            return None
+        try:
+            key = int(hex, 16)
+        except ValueError:
+            # Non-ICAO addresses, e.g., with prefix ~ for TIS-B
+            return None
+        i = bisect_left(self.keys, key)  # type: ignore
+        if i < self.count and self.keys[i] == key:
+            return i
+        return None
+
+    def fill(self, aircraft: Aircraft) -> None:
+        """Sets the registration and type of the aircraft if not available"""
+        if aircraft.registration is not None and aircraft.ac_type is not None:
+            return
+        i = self.lookup(aircraft.hex)
+        if i is None or self.offsets is None:
+            return
+        if aircraft.registration is None:
+            aircraft.registration = intern(self.string(self.offsets[2 * i]))
+        if aircraft.ac_type is None:
+            aircraft.ac_type = intern(self.string(self.offsets[2 * i + 1]))
+
+    def close(self) -> None:
+        # Views have to be released before the mapping is closed
+        for view in [self.keys, self.offsets]:
+            if view is not None:
+                view.release()
+        self.keys = self.offsets = None
+        self.count = 0
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def open_metadata(config: ConfigParser) -> Optional[AircraftMetadata]:
+    """Returns the aircraft index of the configured tar1090-db, if any"""
+    source = config.get("PATHS", "aircraft_db", fallback="").strip()
+    if not source:
+        return None
+    path = config.get("PATHS", "aircraft_index", fallback="").strip()
+    try:
+        return AircraftMetadata(source, path or f"{source}.idx")
+    except (OSError, EOFError, zlib.error) as e:
+        log.error(f"Aircraft database not used: {e}")
+        return None
@@ -1,11 +1,16 @@
 import logging
 import os
+import pathlib
 import sqlite3
+from collections import Counter, OrderedDict
 from configparser import ConfigParser
-from datetime import datetime, time
-from typing import List
+from datetime import datetime, time, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from Aggregates import Aggregates
 from Aircraft import Aircraft
+from DatabaseWriter import DatabaseWriter
+from Metrics import metrics
 from Record import Record
 from States import States
 
@@ -15,32 +20,410 @@ log = logging.getLogger(__name__)
 class Database:
     db_connection: sqlite3.Connection = None  # type: ignore
     db_cursor: sqlite3.Cursor = None  # type: ignore
+    writer: Optional[DatabaseWriter] = None
+    schema_version: int = 0
+    # Flights are stored in monthly partition files if enabled
+    partitioned: bool = False
+
+    # Cached statistics by arguments, valid until the database is changed
+    cache: "OrderedDict[tuple, List[List[str]]]"
+    cache_size: int = 64
+    cache_version: Optional[int] = None
+
+    # Keys counted in the rollup tables, with value and condition for a row
+    rollup_keys: Dict[str, Tuple[str, str]] = {
+        "hex": ("{row}.hex", "{row}.hex IS NOT NULL"),
+        "flight": ("{row}.flight", "{row}.flight IS NOT NULL"),
+        "type": ("{row}.type", "{row}.type IS NOT NULL"),
+        "registration": ("{row}.registration", "{row}.registration IS NOT NULL"),
+        # Airline of flights with a call sign other than the registration
+        "airline": (
+            "substr({row}.flight, 1, 3)",
+            "{row}.flight IS NOT NULL AND {row}.registration IS NOT NULL "
+            "AND REPLACE({row}.registration, '-', '') "
+            "IS NOT REPLACE({row}.flight, ' ', '')",
+        ),
+    }
+
+    # Statements for rebuilding the daily rollup tables from the aircraft table
+    # Counts for the whole database are stored with day "*"
+    # Migrations keep their own statements for the keys of their schema version
+    rollup_rebuild: List[str] = [
+        "DELETE FROM rollup_days",
+        "DELETE FROM rollup_values",
+        "INSERT INTO rollup_days (day, entries) "
+        "SELECT date(time, 'unixepoch', 'localtime'), COUNT(*) FROM aircraft "
+        "GROUP BY 1",
+        "INSERT INTO rollup_days (day, entries) SELECT '*', COUNT(*) FROM aircraft",
+    ] + [
+        f"INSERT INTO rollup_values (day, key, value, count) "
+        f"SELECT {day}, '{key}', {value.format(row='aircraft')}, COUNT(*) "
+        f"FROM aircraft WHERE {condition.format(row='aircraft')} GROUP BY 1, 3"
+        for key, (value, condition) in rollup_keys.items()
+        for day in ["date(time, 'unixepoch', 'localtime')", "'*'"]
+    ]
+
+    # Statement for storing a flight row, including the aggregates of the states
+    flight_insert = (
+        "REPLACE INTO aircraft ( "
+        "'id', 'time', 'date', 'hex', 'registration', 'type', 'flight', "
+        + ", ".join(f"'{c}'" for c in Aggregates.column_list)
+        + " ) VALUES ("
+        + ", ".join(["?"] * (7 + len(Aggregates.column_list)))
+        + ");"
+    )
+
+    # Schema migrations with description and SQL statements
+    # Migrations are applied in order to databases with an older schema version
+    migrations: List[Tuple[str, List[str]]] = [
+        (
+            "Add indexes for recent flights and statistics",
+            [
+                # Covers the time range and distinct counts of evaluate_counts
+                "CREATE INDEX IF NOT EXISTS aircraft_time "
+                "ON aircraft (time, hex, flight, type)",
+                "CREATE INDEX IF NOT EXISTS aircraft_hex ON aircraft (hex)",
+                "CREATE INDEX IF NOT EXISTS aircraft_flight ON aircraft (flight)",
+                "CREATE INDEX IF NOT EXISTS aircraft_type ON aircraft (type)",
+                # Also covers the airline statistics
+                "CREATE INDEX IF NOT EXISTS aircraft_registration "
+                "ON aircraft (registration, flight)",
+            ],
+        ),
+        (
+            "Add daily rollup tables for statistics",
+            [
+                # Number of entries per local day
+                "CREATE TABLE rollup_days ( "
+                "day TEXT PRIMARY KEY, "
+                "entries INTEGER )",
+                # Number of entries per local day and distinct value of a key
+                "CREATE TABLE rollup_values ( "
+                "day TEXT, "
+                "key TEXT, "
+                "value TEXT, "
+                "count INTEGER, "
+                "PRIMARY KEY (day, key, value) ) WITHOUT ROWID",
+                # Replacing a flight deletes the old row, which requires the
+                # recursive_triggers setting to be enabled for the connection
+                "CREATE TRIGGER rollup_insert AFTER INSERT ON aircraft BEGIN "
+                "INSERT INTO rollup_days (day, entries) "
+                "SELECT day, 1 FROM ( "
+                "SELECT date(NEW.time, 'unixepoch', 'localtime') AS day "
+                "UNION ALL SELECT '*' ) WHERE true "
+                "ON CONFLICT (day) DO UPDATE SET entries = entries + 1; "
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT day, key, value, 1 FROM ( "
+                "SELECT date(NEW.time, 'unixepoch', 'localtime') AS day "
+                "UNION ALL SELECT '*' ), ( "
+                "SELECT 'hex' AS key, NEW.hex AS value "
+                "UNION ALL SELECT 'flight', NEW.flight "
+                "UNION ALL SELECT 'type', NEW.type ) "
+                "WHERE value IS NOT NULL "
+                "ON CONFLICT (day, key, value) DO UPDATE SET count = count + 1; "
+                "END",
+                "CREATE TRIGGER rollup_delete AFTER DELETE ON aircraft BEGIN "
+                "UPDATE rollup_days SET entries = entries - 1 "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*'); "
+                "UPDATE rollup_values SET count = count - 1 "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND ((key = 'hex' AND value = OLD.hex) "
+                "OR (key = 'flight' AND value = OLD.flight) "
+                "OR (key = 'type' AND value = OLD.type)); "
+                "DELETE FROM rollup_values "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND ((key = 'hex' AND value = OLD.hex) "
+                "OR (key = 'flight' AND value = OLD.flight) "
+                "OR (key = 'type' AND value = OLD.type)) "
+                "AND count <= 0; "
+                "END",
+                # Counts of the flights stored before the migration
+                "INSERT INTO rollup_days (day, entries) "
+                "SELECT date(time, 'unixepoch', 'localtime'), COUNT(*) FROM aircraft "
+                "GROUP BY 1",
+                "INSERT INTO rollup_days (day, entries) "
+                "SELECT '*', COUNT(*) FROM aircraft",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT date(time, 'unixepoch', 'localtime'), "
+                "'hex', hex, COUNT(*) FROM aircraft "
+                "WHERE hex IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT date(time, 'unixepoch', 'localtime'), "
+                "'flight', flight, COUNT(*) FROM aircraft "
+                "WHERE flight IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT date(time, 'unixepoch', 'localtime'), "
+                "'type', type, COUNT(*) FROM aircraft "
+                "WHERE type IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT '*', 'hex', hex, COUNT(*) FROM aircraft "
+                "WHERE hex IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT '*', 'flight', flight, COUNT(*) FROM aircraft "
+                "WHERE flight IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT '*', 'type', type, COUNT(*) FROM aircraft "
+                "WHERE type IS NOT NULL GROUP BY 1, 3",
+            ],
+        ),
+        (
+            "Add registrations and airlines to the rollup tables",
+            [
+                "DROP TRIGGER rollup_insert",
+                "DROP TRIGGER rollup_delete",
+                # Replacing a flight deletes the old row, which requires the
+                # recursive_triggers setting to be enabled for the connection
+                "CREATE TRIGGER rollup_insert AFTER INSERT ON aircraft BEGIN "
+                "INSERT INTO rollup_days (day, entries) "
+                "SELECT day, 1 FROM ( "
+                "SELECT date(NEW.time, 'unixepoch', 'localtime') AS day "
+                "UNION ALL SELECT '*' ) WHERE true "
+                "ON CONFLICT (day) DO UPDATE SET entries = entries + 1; "
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT day, 'hex', NEW.hex, 1 FROM ( "
+                "SELECT date(NEW.time, 'unixepoch', 'localtime') AS day "
+                "UNION ALL SELECT '*' ) WHERE NEW.hex IS NOT NULL "
+                "ON CONFLICT (day, key, value) DO UPDATE SET count = count + 1; "
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT day, 'flight', NEW.flight, 1 FROM ( "
+                "SELECT date(NEW.time, 'unixepoch', 'localtime') AS day "
+                "UNION ALL SELECT '*' ) WHERE NEW.flight IS NOT NULL "
+                "ON CONFLICT (day, key, value) DO UPDATE SET count = count + 1; "
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT day, 'type', NEW.type, 1 FROM ( "
+                "SELECT date(NEW.time, 'unixepoch', 'localtime') AS day "
+                "UNION ALL SELECT '*' ) WHERE NEW.type IS NOT NULL "
+                "ON CONFLICT (day, key, value) DO UPDATE SET count = count + 1; "
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT day, 'registration', NEW.registration, 1 FROM ( "
+                "SELECT date(NEW.time, 'unixepoch', 'localtime') AS day "
+                "UNION ALL SELECT '*' ) WHERE NEW.registration IS NOT NULL "
+                "ON CONFLICT (day, key, value) DO UPDATE SET count = count + 1; "
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT day, 'airline', substr(NEW.flight, 1, 3), 1 FROM ( "
+                "SELECT date(NEW.time, 'unixepoch', 'localtime') AS day "
+                "UNION ALL SELECT '*' ) WHERE NEW.flight IS NOT NULL "
+                "AND NEW.registration IS NOT NULL "
+                "AND REPLACE(NEW.registration, '-', '') "
+                "IS NOT REPLACE(NEW.flight, ' ', '') "
+                "ON CONFLICT (day, key, value) DO UPDATE SET count = count + 1; "
+                "END",
+                "CREATE TRIGGER rollup_delete AFTER DELETE ON aircraft BEGIN "
+                "UPDATE rollup_days SET entries = entries - 1 "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*'); "
+                "UPDATE rollup_values SET count = count - 1 "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND key = 'hex' AND value = OLD.hex "
+                "AND OLD.hex IS NOT NULL; "
+                "DELETE FROM rollup_values "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND key = 'hex' AND value = OLD.hex "
+                "AND count <= 0; "
+                "UPDATE rollup_values SET count = count - 1 "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND key = 'flight' AND value = OLD.flight "
+                "AND OLD.flight IS NOT NULL; "
+                "DELETE FROM rollup_values "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND key = 'flight' AND value = OLD.flight "
+                "AND count <= 0; "
+                "UPDATE rollup_values SET count = count - 1 "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND key = 'type' AND value = OLD.type "
+                "AND OLD.type IS NOT NULL; "
+                "DELETE FROM rollup_values "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND key = 'type' AND value = OLD.type "
+                "AND count <= 0; "
+                "UPDATE rollup_values SET count = count - 1 "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND key = 'registration' AND value = OLD.registration "
+                "AND OLD.registration IS NOT NULL; "
+                "DELETE FROM rollup_values "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND key = 'registration' AND value = OLD.registration "
+                "AND count <= 0; "
+                "UPDATE rollup_values SET count = count - 1 "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND key = 'airline' AND value = substr(OLD.flight, 1, 3) "
+                "AND OLD.flight IS NOT NULL "
+                "AND OLD.registration IS NOT NULL "
+                "AND REPLACE(OLD.registration, '-', '') "
+                "IS NOT REPLACE(OLD.flight, ' ', ''); "
+                "DELETE FROM rollup_values "
+                "WHERE day IN (date(OLD.time, 'unixepoch', 'localtime'), '*') "
+                "AND key = 'airline' AND value = substr(OLD.flight, 1, 3) "
+                "AND count <= 0; "
+                "END",
+                # Counts of the flights stored before the migration
+                "DELETE FROM rollup_days",
+                "DELETE FROM rollup_values",
+                "INSERT INTO rollup_days (day, entries) "
+                "SELECT date(time, 'unixepoch', 'localtime'), COUNT(*) FROM aircraft "
+                "GROUP BY 1",
+                "INSERT INTO rollup_days (day, entries) "
+                "SELECT '*', COUNT(*) FROM aircraft",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT date(time, 'unixepoch', 'localtime'), "
+                "'hex', aircraft.hex, COUNT(*) "
+                "FROM aircraft WHERE aircraft.hex IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT '*', 'hex', aircraft.hex, COUNT(*) "
+                "FROM aircraft WHERE aircraft.hex IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT date(time, 'unixepoch', 'localtime'), "
+                "'flight', aircraft.flight, COUNT(*) "
+                "FROM aircraft WHERE aircraft.flight IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT '*', 'flight', aircraft.flight, COUNT(*) "
+                "FROM aircraft WHERE aircraft.flight IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT date(time, 'unixepoch', 'localtime'), "
+                "'type', aircraft.type, COUNT(*) "
+                "FROM aircraft WHERE aircraft.type IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT '*', 'type', aircraft.type, COUNT(*) "
+                "FROM aircraft WHERE aircraft.type IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT date(time, 'unixepoch', 'localtime'), "
+                "'registration', aircraft.registration, COUNT(*) "
+                "FROM aircraft WHERE aircraft.registration IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT '*', 'registration', aircraft.registration, COUNT(*) "
+                "FROM aircraft WHERE aircraft.registration IS NOT NULL GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT date(time, 'unixepoch', 'localtime'), "
+                "'airline', substr(aircraft.flight, 1, 3), COUNT(*) "
+                "FROM aircraft WHERE aircraft.flight IS NOT NULL "
+                "AND aircraft.registration IS NOT NULL "
+                "AND REPLACE(aircraft.registration, '-', '') "
+                "IS NOT REPLACE(aircraft.flight, ' ', '') GROUP BY 1, 3",
+                "INSERT INTO rollup_values (day, key, value, count) "
+                "SELECT '*', 'airline', substr(aircraft.flight, 1, 3), COUNT(*) "
+                "FROM aircraft WHERE aircraft.flight IS NOT NULL "
+                "AND aircraft.registration IS NOT NULL "
+                "AND REPLACE(aircraft.registration, '-', '') "
+                "IS NOT REPLACE(aircraft.flight, ' ', '') GROUP BY 1, 3",
+            ],
+        ),
+        (
+            "Add catalog of monthly partition files",
+            [
+                # Time range of the stored flights and time of the last write
+                "CREATE TABLE partitions ( "
+                "name TEXT PRIMARY KEY, "
+                "time_min INTEGER, "
+                "time_max INTEGER, "
+                "time_written INTEGER )",
+            ],
+        ),
+        (
+            "Add aggregates of the states to the flights",
+            [
+                f"ALTER TABLE aircraft ADD COLUMN {c} "
+                f"{'INTEGER' if c.endswith('_count') else 'REAL'}"
+                for c in Aggregates.column_list
+            ],
+        ),
+        (
+            "Add traffic time series",
+            [
+                # Sums of the aircraft in view and new flights of all polls per
+                # minute, received messages, and maximum distance to the receiver
+                "CREATE TABLE traffic ( "
+                "time INTEGER PRIMARY KEY, "
+                "polls INTEGER, "
+                "aircraft INTEGER, "
+                "flights INTEGER, "
+                "messages INTEGER, "
+                "distance REAL )",
+            ],
+        ),
+    ]
 
     def __init__(self, config: ConfigParser, read_only: bool = False) -> None:
         self.config = config
+        self.cache = OrderedDict()
 
         # Setup and create database
         path_database = self.config["PATHS"]["database"].strip()
         log.debug(f"Database path: {path_database}")
+        self.path = os.path.abspath(path_database)
+        self.partitioned = self.config.getboolean(
+            "DATABASE", "partitioned", fallback=False
+        )
+        # Write-ahead logging allows reading while the writer thread writes
+        self.journal_mode = self.config.get(
+            "DATABASE", "journal_mode", fallback="WAL"
+        ).strip()
+        self.synchronous = self.config.get(
+            "DATABASE", "synchronous", fallback="NORMAL"
+        ).strip()
+
+        # URIs also allow attaching the partition files in read-only mode
+        uri = pathlib.Path(self.path).as_uri()
         if read_only:
+            # Read-only connections may be used by other threads, one at a time
             self.db_connection = sqlite3.connect(
-                os.path.abspath(path_database), uri=True
+                f"{uri}?mode=ro", uri=True, check_same_thread=False
             )
         else:
-            self.db_connection = sqlite3.connect(os.path.abspath(path_database))
+            self.db_connection = sqlite3.connect(uri, uri=True)
         self.db_cursor = self.db_connection.cursor()
+        self.db_cursor.execute("PRAGMA recursive_triggers = ON")
         if not read_only:
-            self.create_database()
+            self.db_cursor.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+            self.schema_version = self.create_database(self.db_cursor)
+            self.migrate_partitions()
+            self.writer = DatabaseWriter(
+                self.path,
+                self.config.getint("DATABASE", "write_queue", fallback=100),
+                self.synchronous,
+            )
+        else:
+            try:
+                self.schema_version = self.db_cursor.execute(
+                    "SELECT version FROM schema_version"
+                ).fetchone()[0]
+            except sqlite3.OperationalError:
+                log.debug("Schema version not available in database")
 
     def __del__(self) -> None:
-        # Close database
-        self.db_cursor.close()
-        self.db_connection.close()
+        self.close()
+
+    def close(self) -> None:
+        # Wait for pending writes and close database
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.db_connection is not None:
+            self.db_cursor.close()
+            self.db_connection.close()
+            self.db_connection = None  # type: ignore
+
+    def flush(self) -> None:
+        # Wait for pending writes
+        if self.writer is not None:
+            self.writer.flush()
+
+    @property
+    def write_queue_depth(self) -> int:
+        return 0 if self.writer is None else self.writer.depth
+
+    @property
+    def write_errors(self) -> int:
+        return 0 if self.writer is None else self.writer.errors
 
-    def create_database(self) -> None:
+    def submit(self, job) -> None:
+        if self.writer is None:
+            raise RuntimeError("Database opened in read-only mode")
+        self.writer.submit(job)
+
+    def create_database(self, cursor: sqlite3.Cursor) -> int:
+        """Creates the tables and applies the migrations, returns the version"""
         # table for seen aircraft
         try:
-            self.db_cursor.execute(
+            cursor.execute(
                 "CREATE TABLE aircraft ( "
                 "id TEXT PRIMARY KEY, "
                 "time INTEGER, "
@@ -56,7 +439,7 @@ class Database:
 
         # table for record values
         try:
-            self.db_cursor.execute(
+            cursor.execute(
                 "CREATE TABLE records ( "
                 "id TEXT PRIMARY KEY, "
                 "value REAL, "
@@ -71,11 +454,164 @@ class Database:
             log.debug("Created records table in database")
         except sqlite3.OperationalError:
             log.debug("Records table already exists in database")
-        return
+
+        return self.migrate(cursor)
+
+    def migrate(self, cursor: sqlite3.Cursor) -> int:
+        # table for schema version, databases without it have version 0
+        cursor.execute("CREATE TABLE IF NOT EXISTS schema_version ( version INTEGER )")
+        db_response = cursor.execute("SELECT version FROM schema_version").fetchone()
+        if db_response is None:
+            with cursor.connection:
+                cursor.execute("INSERT INTO schema_version VALUES (0)")
+            version = 0
+        else:
+            version = db_response[0]
+
+        for number, (description, statements) in enumerate(
+            self.migrations[version:], version + 1
+        ):
+            log.info(f"Migrating database to version {number}: {description}")
+            with cursor.connection:
+                cursor.execute("BEGIN")
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute("UPDATE schema_version SET version = ?", (number,))
+            version = number
+        log.debug(f"Database schema version {len(self.migrations)}")
+        return version
+
+    def rebuild_rollups(self) -> None:
+        """Rebuilds the daily rollup tables from the aircraft table
+
+        Required after the time zone of the system has changed.
+        """
+        log.info("Rebuilding daily rollup tables")
+        self.flush()
+        with self.db_connection:
+            self.db_cursor.execute("BEGIN")
+            for statement in self.rollup_rebuild:
+                self.db_cursor.execute(statement)
+        for name in self.partitions():
+            partition = self.open_partition(name)
+            with partition:
+                partition.execute("BEGIN")
+                for statement in self.rollup_rebuild:
+                    partition.execute(statement)
+            partition.close()
+        self.cache.clear()
+
+    def partition_path(self, name: str) -> str:
+        # Next to the database, e.g., adsb-logger-2024-05.db
+        return f"{os.path.splitext(self.path)[0]}-{name}.db"
+
+    @staticmethod
+    def partition_name(timestamp: float) -> str:
+        # Local month, so each local day is stored in one partition
+        return datetime.fromtimestamp(timestamp).strftime("%Y-%m")
+
+    def open_partition(self, name: str) -> sqlite3.Connection:
+        """Opens a partition file for writing, and creates or migrates it"""
+        path = self.partition_path(name)
+        created = not os.path.exists(path)
+        connection = sqlite3.connect(path)
+        cursor = connection.cursor()
+        if created:
+            # Archived partitions might be read-only with another journal mode
+            cursor.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        cursor.execute(f"PRAGMA synchronous = {self.synchronous}")
+        cursor.execute("PRAGMA recursive_triggers = ON")
+        self.create_database(cursor)
+        return connection
+
+    def migrate_partitions(self) -> None:
+        # Archived partitions are only migrated if they are still available
+        for name in self.partitions():
+            if not os.path.exists(self.partition_path(name)):
+                log.warning(f"Partition {name} not available")
+                continue
+            try:
+                self.open_partition(name).close()
+            except sqlite3.Error as e:
+                log.warning(f"Could not migrate partition {name}: {e}")
+
+    def partitions(
+        self, timestamp_min: float = 0, timestamp_max: float = float("inf")
+    ) -> List[str]:
+        """Returns the names of the partitions with flights in the time range"""
+        if self.schema_version < 4:
+            return []
+        db_response = self.db_cursor.execute(
+            "SELECT name FROM partitions WHERE time_max >= ? AND time_min < ? "
+            "ORDER BY name",
+            (timestamp_min, timestamp_max),
+        ).fetchall()
+        return [r[0] for r in db_response]
+
+    def shards(self, partitions: List[str]) -> Iterator[str]:
+        """Yields the schema of the database, and of each partition in turn
+
+        The partitions are attached one at a time in read-only mode, as the
+        number of attached databases is limited.
+        """
+        yield "main"
+        for name in partitions:
+            uri = pathlib.Path(self.partition_path(name)).as_uri()
+            try:
+                self.db_cursor.execute(
+                    "ATTACH DATABASE ? AS partition_month", (f"{uri}?mode=ro",)
+                )
+            except sqlite3.OperationalError as e:
+                log.warning(f"Partition {name} not available: {e}")
+                continue
+            try:
+                yield "partition_month"
+            finally:
+                self.db_cursor.execute("DETACH DATABASE partition_month")
+
+    def sum_shards(self, command: str, args: tuple, partitions: List[str]) -> int:
+        """Returns the sum of the value selected by the command in all shards"""
+        return sum(
+            self.db_cursor.execute(command.format(schema=s), args).fetchone()[0] or 0
+            for s in self.shards(partitions)
+        )
+
+    def count_shards(self, command: str, args: tuple, partitions: List[str]) -> int:
+        """Returns the number of distinct values selected by the command"""
+        if not partitions:
+            return self.db_cursor.execute(
+                f"SELECT COUNT(*) FROM ({command.format(schema='main')})", args
+            ).fetchone()[0]
+        values: set = set()
+        for schema in self.shards(partitions):
+            db_response = self.db_cursor.execute(command.format(schema=schema), args)
+            values.update(r[0] for r in db_response.fetchall())
+        return len(values)
+
+    def top_shards(
+        self, command: str, args: tuple, max_count: int, partitions: List[str]
+    ) -> List[Tuple[str, int]]:
+        """Returns the values with the highest sums of the counts"""
+        if not partitions:
+            return self.db_cursor.execute(
+                f"{command.format(schema='main')} ORDER BY 2 DESC, 1 LIMIT ?",
+                args + (max_count,),
+            ).fetchall()
+        counts: Counter = Counter()
+        for schema in self.shards(partitions):
+            db_response = self.db_cursor.execute(command.format(schema=schema), args)
+            for value, count in db_response.fetchall():
+                counts[value] += count
+        return sorted(counts.items(), key=lambda r: (-r[1], r[0]))[:max_count]
 
     def read_recent_flights(self, timestamp_min: int) -> List[Aircraft]:
-        db_command = f"SELECT * FROM aircraft WHERE time >= {timestamp_min}"
-        db_response = self.db_cursor.execute(db_command).fetchall()
+        db_response = []
+        for schema in self.shards(self.partitions(timestamp_min)):
+            db_response += self.db_cursor.execute(
+                f"SELECT * FROM {schema}.aircraft WHERE time >= ? ORDER BY time",
+                (timestamp_min,),
+            ).fetchall()
+        db_response.sort(key=lambda r: r[1])
         ac_list = []
 
         for r in db_response:
@@ -87,67 +623,104 @@ class Database:
             aircraft.registration = r[4]
             aircraft.ac_type = r[5]
             aircraft.flight = r[6]
+            # Aggregates continue with the next samples of the flight
+            if len(r) > 7:
+                aircraft.aggregates = Aggregates.from_row(r[7:])
 
             ac_list.append(aircraft)
 
         log.info(f"Read {len(ac_list)} recent flights from database")
         return ac_list
 
-    def write_flights(self, aircraft: List[Aircraft]) -> int:
-        db_counter = 0
-        for t in aircraft:
-            if not self.write_flight(t, False):
-                db_counter += 1
-        self.db_connection.commit()
-        log.info(f"Stored {db_counter} recent flights in database")
-        return db_counter
-
-    def write_flight(self, aircraft: Aircraft, commit_db: bool = True) -> bool:
-        try:
-            db_command = (
-                "REPLACE INTO aircraft ( "
-                "'id', 'time', 'date', 'hex', 'registration', 'type', 'flight'"
-                " ) VALUES (?, ?, ?, ?, ?, ?, ?);"
-            )
-            if aircraft.time_start is None:  # mypy fix
-                time_start_short_int = 0
+    def write_flights(
+        self, aircraft: Iterable[Aircraft], stored: Optional[Callable[[], None]] = None
+    ) -> int:
+        """Submits the flights for writing, returns the number of flights
+
+        The optional function stored is called by the writer thread once the
+        flights are committed, and not if the write fails.
+        """
+        rows = [self.flight_row(t) for t in aircraft]
+
+        def job(connection: sqlite3.Connection) -> None:
+            if self.partitioned:
+                self.write_partitions(connection, rows)
             else:
-                time_start_short_int = int(aircraft.time_start)
-            id = f"{time_start_short_int}_{aircraft.hex}"
-            self.db_cursor.execute(
-                db_command,
-                (
-                    id,
-                    time_start_short_int,
-                    datetime.utcfromtimestamp(time_start_short_int).strftime(
-                        "%Y-%m-%d"
-                    ),
-                    aircraft.hex,
-                    aircraft.registration,
-                    aircraft.ac_type,
-                    aircraft.flight,
-                ),
-            )
+                connection.executemany(self.flight_insert, rows)
+            connection.commit()
+            metrics.count('rows_written_total{table="aircraft"}', len(rows))
+            log.info(f"Stored {len(rows)} recent flights in database")
+            if stored is not None:
+                stored()
+
+        self.submit(job)
+        return len(rows)
+
+    def write_partitions(
+        self, connection: sqlite3.Connection, rows: List[tuple]
+    ) -> None:
+        """Writes the flight rows to the partitions of their local months
 
-        except sqlite3.IntegrityError as e:
-            log.error(
-                f"Error when storing flight {aircraft.flight} "
-                f"({aircraft.registration}/{aircraft.hex}) in database"
+        Executed by the writer thread. The catalog is committed before the
+        partitions are written, and the time of the write afterwards, which
+        changes the data version of the database for the readers.
+        """
+        partitions: Dict[str, List[tuple]] = {}
+        for row in rows:
+            partitions.setdefault(self.partition_name(row[1]), []).append(row)
+        connection.executemany(
+            "INSERT INTO partitions (name, time_min, time_max) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET "
+            "time_min = MIN(time_min, excluded.time_min), "
+            "time_max = MAX(time_max, excluded.time_max)",
+            [
+                (name, min(r[1] for r in p), max(r[1] for r in p))
+                for name, p in partitions.items()
+            ],
+        )
+        connection.commit()
+
+        for name, partition_rows in partitions.items():
+            partition = self.open_partition(name)
+            try:
+                with partition:
+                    partition.executemany(self.flight_insert, partition_rows)
+            finally:
+                partition.close()
+            connection.execute(
+                "UPDATE partitions SET time_written = ? WHERE name = ?",
+                (int(datetime.timestamp(datetime.now())), name),
             )
-            log.error(e)
-            return True
 
-        if commit_db:
-            self.db_connection.commit()
-        return False
+    @staticmethod
+    def flight_row(aircraft: Aircraft) -> tuple:
+        if aircraft.time_start is None:  # mypy fix
+            time_start_short_int = 0
+        else:
+            time_start_short_int = int(aircraft.time_start)
+        id = f"{time_start_short_int}_{aircraft.hex}"
+        aggregates = aircraft.aggregates
+        if aggregates is None:
+            # Flight with a single sample
+            aggregates = Aggregates.from_states(aircraft.states)
+        return (
+            id,
+            time_start_short_int,
+            datetime.utcfromtimestamp(time_start_short_int).strftime("%Y-%m-%d"),
+            aircraft.hex,
+            aircraft.registration,
+            aircraft.ac_type,
+            aircraft.flight,
+        ) + aggregates.row()
 
     def read_records(self) -> List[Record]:
         db_counter = 0
         rec_list = []
-        temp_ac = Aircraft()
-        if temp_ac.states is None:  # mypy fix
-            temp_ac.states = States()
-        for s in temp_ac.states.key_list:
+        # All records with a single query, by id
+        db_rows = {
+            r[0]: r for r in self.db_cursor.execute("SELECT * FROM records").fetchall()
+        }
+        for s in States.key_list:
             for m in ["min", "max"]:
                 record = Record()
                 if record.aircraft is None:  # mypy fix
@@ -155,11 +728,10 @@ class Database:
                 record.record_key = s
                 record.is_max = True if m == "max" else False
 
-                db_command = f"SELECT * FROM records WHERE id='{s}_{m}'"
-                db_response = self.db_cursor.execute(db_command).fetchone()
+                db_response = db_rows.get(f"{s}_{m}")
                 if db_response:
                     setattr(record.aircraft.states, s, db_response[1])
-                    record.aircraft.time_start = db_response[2].split("_")[0]
+                    record.aircraft.time_start = int(db_response[2].split("_")[0])
                     record.timestamp = db_response[3]
                     record.aircraft.hex = db_response[5]
                     record.aircraft.registration = db_response[6]
@@ -178,86 +750,151 @@ class Database:
         log.info(f"Read {db_counter} record flights from database")
         return rec_list
 
-    def write_records(self, records: List[Record], commit_db: bool = True) -> bool:
-        db_counter = 0
+    def write_records(self, records: List[Record]) -> int:
+        rows = []
         for r in records:
-            try:
-                if r.is_stored:
-                    continue
-                if r.aircraft is None:  # mypy fix
-                    r.aircraft = Aircraft()
-                db_command = (
-                    "REPLACE INTO records ( "
-                    "'id', 'value', 'id_aircraft', 'time', 'date', "
-                    "'hex', 'registration', 'type', 'flight' ) "
-                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);"
-                )
-                m = "max" if r.is_max else "min"
-                id = f"{r.record_key}_{m}"
-                if r.aircraft.time_start is None:  # mypy fix
-                    time_start_short_int = 0
-                else:
-                    time_start_short_int = int(r.aircraft.time_start)
-                aircraft_id = f"{time_start_short_int}_{r.aircraft.hex}"
-                self.db_cursor.execute(
-                    db_command,
-                    (
-                        id,
-                        getattr(r.aircraft.states, r.record_key),
-                        aircraft_id,
-                        int(r.timestamp),
-                        datetime.utcfromtimestamp(int(r.timestamp)).strftime(
-                            "%Y-%m-%d"
-                        ),
-                        r.aircraft.hex,
-                        r.aircraft.registration,
-                        r.aircraft.ac_type,
-                        r.aircraft.flight,
-                    ),
-                )
-                # Continues if no integrity error is thrown
-                db_counter += 1
-                log.debug(
-                    f"Stored {id} record with value "
-                    f"{getattr(r.aircraft.states, r.record_key)} in database"
+            if r.is_stored:
+                continue
+            if r.aircraft is None:  # mypy fix
+                r.aircraft = Aircraft()
+            m = "max" if r.is_max else "min"
+            if r.aircraft.time_start is None:  # mypy fix
+                time_start_short_int = 0
+            else:
+                time_start_short_int = int(r.aircraft.time_start)
+            rows.append(
+                (
+                    f"{r.record_key}_{m}",
+                    getattr(r.aircraft.states, r.record_key),
+                    f"{time_start_short_int}_{r.aircraft.hex}",
+                    int(r.timestamp),
+                    datetime.utcfromtimestamp(int(r.timestamp)).strftime("%Y-%m-%d"),
+                    r.aircraft.hex,
+                    r.aircraft.registration,
+                    r.aircraft.ac_type,
+                    r.aircraft.flight,
                 )
+            )
+            r.is_stored = True
 
-            except sqlite3.IntegrityError as e:
-                if r.aircraft is None:  # mypy fix
-                    r.aircraft = Aircraft()
-                log.error(
-                    f"Error when storing record {id} "
-                    f"({getattr(r.aircraft.states, r.record_key)}) in database"
-                )
-                log.error(e)
-                return True
+        def job(connection: sqlite3.Connection) -> None:
+            connection.executemany(
+                "REPLACE INTO records ( "
+                "'id', 'value', 'id_aircraft', 'time', 'date', "
+                "'hex', 'registration', 'type', 'flight' ) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                rows,
+            )
+            metrics.count('rows_written_total{table="records"}', len(rows))
+            for row in rows:
+                log.debug(f"Stored {row[0]} record with value {row[1]} in database")
+            log.info(f"Stored {len(rows)} record flights in database")
 
-        if commit_db:
-            self.db_connection.commit()
-        log.info(f"Stored {db_counter} record flights in database")
-        return False
+        self.submit(job)
+        return len(rows)
+
+    def write_traffic(self, rows: List[tuple]) -> int:
+        def job(connection: sqlite3.Connection) -> None:
+            # Minutes are only stored twice after a restart within the minute
+            connection.executemany(
+                "INSERT INTO traffic ( "
+                "time, polls, aircraft, flights, messages, distance ) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (time) DO UPDATE SET "
+                "polls = polls + excluded.polls, "
+                "aircraft = aircraft + excluded.aircraft, "
+                "flights = flights + excluded.flights, "
+                "messages = COALESCE(messages + excluded.messages, "
+                "messages, excluded.messages), "
+                "distance = MAX(COALESCE(distance, excluded.distance), "
+                "COALESCE(excluded.distance, distance))",
+                rows,
+            )
+            metrics.count('rows_written_total{table="traffic"}', len(rows))
+            log.debug(f"Stored traffic of {len(rows)} minutes in database")
+
+        self.submit(job)
+        return len(rows)
 
     def evaluate_counts(
         self, timestamp_min: float = 0, timestamp_max: float = 0
     ) -> List[List[str]]:
         if timestamp_max <= timestamp_min:
             timestamp_max = datetime.timestamp(datetime.now())
-        statistics = [["Database Keys", "Count"]]
-        commands = {
-            "Entries": "COUNT(id)",
-            "Addresses": "COUNT(DISTINCT hex)",
-            "Flights": "COUNT(DISTINCT flight)",
-            "Types": "COUNT(DISTINCT type)",
-        }
+        partitions = self.partitions(timestamp_min, timestamp_max)
+        day = self.rollup_day(timestamp_min, timestamp_max)
+        if day is not None:
+            return self.evaluate_rollup(day, partitions)
 
-        for name, cmd in commands.items():
+        statistics: List[list] = [["Database Keys", "Count"]]
+        args = (timestamp_min, timestamp_max)
+        db_command = (
+            "SELECT COUNT(id) FROM {schema}.aircraft WHERE time >= ? AND time < ?"
+        )
+        statistics.append(["Entries", self.sum_shards(db_command, args, partitions)])
+
+        columns = {"Addresses": "hex", "Flights": "flight", "Types": "type"}
+        for name, column in columns.items():
             db_command = (
-                f"SELECT {cmd} FROM aircraft "
-                f"WHERE time >= {timestamp_min} AND time < {timestamp_max}"
+                f"SELECT DISTINCT {column} FROM {{schema}}.aircraft "
+                f"WHERE time >= ? AND time < ? AND {column} IS NOT NULL"
+            )
+            statistics.append([name, self.count_shards(db_command, args, partitions)])
+
+        return statistics
+
+    def rollup_day(self, timestamp_min: float, timestamp_max: float) -> Optional[str]:
+        """Returns the rollup day matching the time range
+
+        Returns "*" if the range includes all entries, or the local date if the
+        range covers exactly one local day. Otherwise, None is returned.
+        """
+        if self.schema_version < 2:
+            return None
+
+        # Range including all entries, of the database and the partitions
+        db_command = (
+            "SELECT (SELECT MIN(time) FROM aircraft), (SELECT MAX(time) FROM aircraft)"
+        )
+        if self.schema_version >= 4:
+            db_command += (
+                " UNION ALL SELECT MIN(time_min), MAX(time_max) FROM partitions"
             )
-            db_response = self.db_cursor.execute(db_command).fetchone()
-            statistics.append([name, db_response[0]])
+        db_response = [
+            r for r in self.db_cursor.execute(db_command).fetchall() if r[0] is not None
+        ]
+        if not db_response or (
+            timestamp_min <= min(r[0] for r in db_response)
+            and timestamp_max > max(r[1] for r in db_response)
+        ):
+            return "*"
 
+        # Range including all (integer) timestamps of one local day
+        day_start = datetime.fromtimestamp(timestamp_min)
+        if day_start.time() != time.min:
+            return None
+        day_end = datetime.combine(day_start + timedelta(days=1), time.min)
+        if not (
+            datetime.timestamp(day_end) - 1
+            < timestamp_max
+            <= datetime.timestamp(day_end)
+        ):
+            return None
+        return day_start.strftime("%Y-%m-%d")
+
+    def evaluate_rollup(self, day: str, partitions: List[str]) -> List[List[str]]:
+        statistics: List[list] = [["Database Keys", "Count"]]
+        db_command = "SELECT SUM(entries) FROM {schema}.rollup_days WHERE day = ?"
+        statistics.append(["Entries", self.sum_shards(db_command, (day,), partitions)])
+
+        keys = {"Addresses": "hex", "Flights": "flight", "Types": "type"}
+        for name, key in keys.items():
+            db_command = (
+                "SELECT value FROM {schema}.rollup_values WHERE day = ? AND key = ?"
+            )
+            statistics.append(
+                [name, self.count_shards(db_command, (day, key), partitions)]
+            )
         return statistics
 
     def evaluate_days(self, day_count: int = 5) -> List[List[str]]:
@@ -292,40 +929,107 @@ class Database:
 
         return statistics
 
-    def evaluate_flights(self, key: str, max_count: int = 5) -> List[List[str]]:
-        if key == "flight":
-            db_command = (
-                "SELECT flight, COUNT(flight) FROM aircraft "
-                "GROUP BY flight "
-                "ORDER BY COUNT(flight) DESC"
-            )
-        elif key == "registration":
-            db_command = (
-                "SELECT registration, COUNT(registration) FROM aircraft "
-                "GROUP BY registration "
-                "ORDER BY COUNT(registration) DESC"
-            )
-        elif key == "type":
+    def evaluate_flights(
+        self,
+        key: str,
+        max_count: int = 5,
+        timestamp_min: float = 0,
+        timestamp_max: float = 0,
+    ) -> List[List[str]]:
+        if key not in ["flight", "registration", "type", "airline"]:
+            raise KeyError(f"Unknown database entry key {key}")
+        return self.cached(
+            ("flights", key, max_count, timestamp_min, timestamp_max),
+            lambda: self.query_flights(key, max_count, timestamp_min, timestamp_max),
+        )
+
+    def query_flights(
+        self, key: str, max_count: int, timestamp_min: float, timestamp_max: float
+    ) -> List[List[str]]:
+        if timestamp_max <= timestamp_min:
+            timestamp_max = datetime.timestamp(datetime.now())
+        value, condition = self.rollup_keys[key]
+        statistics: List[list] = [[key.capitalize(), "Count"]]
+
+        partitions = self.partitions(timestamp_min, timestamp_max)
+        day = None
+        if self.schema_version >= 3:
+            day = self.rollup_day(timestamp_min, timestamp_max)
+        if day is None:
             db_command = (
-                "SELECT type, COUNT(type) FROM aircraft "
-                "GROUP BY type "
-                "ORDER BY COUNT(type) DESC"
+                f"SELECT {value.format(row='aircraft')}, COUNT(*) "
+                f"FROM {{schema}}.aircraft WHERE time >= ? AND time < ? "
+                f"AND {condition.format(row='aircraft')} GROUP BY 1"
             )
-        elif key == "airline":
+            args: tuple = (timestamp_min, timestamp_max)
+        else:
             db_command = (
-                "SELECT substr(flight, 1, 3) as airline, COUNT(flight) as count, "
-                "REPLACE(registration,'-','') as registration_short, "
-                "REPLACE(flight,' ','') as flight_short FROM aircraft "
-                "WHERE registration_short is not NULL "
-                "AND registration_short is not flight_short "
-                "GROUP BY airline "
-                "ORDER BY count DESC"
+                "SELECT value, count FROM {schema}.rollup_values "
+                "WHERE day = ? AND key = ?"
             )
-        else:
-            raise KeyError(f"Unknown database entry key {key}")
-        statistics = [[key.capitalize(), "Count"]]
-        db_response = self.db_cursor.execute(db_command).fetchmany(max_count)
+            args = (day, key)
+        db_response = self.top_shards(db_command, args, max_count, partitions)
         statistics.extend([r[0], r[1]] for r in db_response)
+
+        # Flights without a value for the key are listed last with a count of 0
+        if len(db_response) < max_count:
+            if key == "airline":
+                condition_null = "flight IS NULL AND registration IS NOT NULL"
+            else:
+                condition_null = f"{key} IS NULL"
+            if day != "*":
+                condition_null += (
+                    f" AND time >= {timestamp_min} AND time < {timestamp_max}"
+                )
+            for schema in self.shards(partitions):
+                db_response = self.db_cursor.execute(
+                    f"SELECT EXISTS (SELECT 1 FROM {schema}.aircraft "
+                    f"WHERE {condition_null})"
+                ).fetchone()
+                if db_response[0]:
+                    statistics.append([None, 0])  # type: ignore
+                    break
+        return statistics
+
+    def cached(
+        self, arguments: tuple, evaluate: Callable[[], List[List[str]]]
+    ) -> List[List[str]]:
+        """Returns the cached statistics for the arguments, or evaluates them
+
+        The cache is cleared once another connection has changed the database.
+        """
+        version = self.db_cursor.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.cache_version:
+            self.cache.clear()
+            self.cache_version = version
+
+        if arguments in self.cache:
+            self.cache.move_to_end(arguments)
+        else:
+            self.cache[arguments] = evaluate()
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return [list(r) for r in self.cache[arguments]]
+
+    def evaluate_traffic(self, hour_count: int = 24) -> List[List[str]]:
+        statistics = [
+            ["Hour (local time)", "Aircraft", "New flights", "Messages/s", "Distance"]
+        ]
+        if self.schema_version < 6:
+            return statistics
+
+        # Average aircraft in view and messages per second, maximum distance
+        hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+        timestamp_min = datetime.timestamp(hour - timedelta(hours=hour_count - 1))
+        db_response = self.db_cursor.execute(
+            "SELECT strftime('%Y-%m-%d %H:00', time, 'unixepoch', 'localtime'), "
+            "ROUND(1.0 * SUM(aircraft) / SUM(polls), 1), SUM(flights), "
+            "ROUND(SUM(messages) / (60.0 * COUNT(messages)), 1), "
+            "ROUND(MAX(distance), 1) "
+            "FROM traffic WHERE time >= ? GROUP BY 1 ORDER BY 1 DESC",
+            (timestamp_min,),
+        ).fetchall()
+        statistics.extend(list(r) for r in db_response)
         return statistics
 
     def evaluate_records(self) -> List[List[str]]:
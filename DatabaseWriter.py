@@ -0,0 +1,125 @@
+import logging
+import queue
+import sqlite3
+import threading
+from collections import deque
+from typing import Callable, Deque, Optional
+
+from Metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Write job, executed with the connection of the writer thread
+Job = Callable[[sqlite3.Connection], None]
+
+
+class DatabaseWriter:
+    """Executes database writes in a background thread
+
+    Jobs are executed in the order of submission, each one in its own
+    transaction. If the bounded queue is full, jobs are kept in a backlog
+    and queued with the next submission. Submitting only blocks if the
+    backlog has reached the size of the queue as well, e.g., while the
+    database is locked by another program.
+    """
+
+    thread: Optional[threading.Thread] = None
+    # Number of failed jobs, e.g., while the database was locked
+    errors: int = 0
+
+    def __init__(
+        self, path: str, queue_size: int = 100, synchronous: str = "NORMAL"
+    ) -> None:
+        self.path = path
+        self.synchronous = synchronous
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self.backlog: Deque[Job] = deque()
+        self.backlog_size = queue_size
+
+        self.thread = threading.Thread(
+            target=self.run, name="DatabaseWriter", daemon=True
+        )
+        self.thread.start()
+
+    def __del__(self) -> None:
+        self.close()
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for execution"""
+        return self.queue.qsize() + len(self.backlog)
+
+    @property
+    def alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def submit(self, job: Job) -> None:
+        self.backlog.append(job)
+        while self.backlog:
+            try:
+                self.queue.put_nowait(self.backlog[0])
+            except queue.Full:
+                if len(self.backlog) <= self.backlog_size:
+                    log.warning(
+                        f"Database write queue is full, "
+                        f"{len(self.backlog)} jobs waiting"
+                    )
+                    return
+                # Limits the memory of the backlog
+                log.warning("Database write backlog is full, waiting for writes")
+                if not self.put(self.backlog[0]):
+                    self.backlog.clear()
+                    return
+            self.backlog.popleft()
+
+    def put(self, job: Optional[Job]) -> bool:
+        """Queues the job, blocking while the writer thread is running"""
+        while self.alive:
+            try:
+                self.queue.put(job, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        log.error("Database writer thread has stopped, discarding writes")
+        return False
+
+    def flush(self) -> None:
+        """Waits until all submitted jobs have been executed"""
+        while self.backlog:
+            if not self.put(self.backlog.popleft()):
+                self.backlog.clear()
+        # Does not wait for a stopped writer thread
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks and self.alive:
+                self.queue.all_tasks_done.wait(1)
+
+    def close(self) -> None:
+        if self.thread is None:
+            return
+        self.flush()
+        self.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def run(self) -> None:
+        connection = sqlite3.connect(self.path)
+        connection.execute(f"PRAGMA synchronous = {self.synchronous}")
+        # Replacing rows has to run the delete triggers of the rollup tables
+        connection.execute("PRAGMA recursive_triggers = ON")
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    break
+                with metrics.timer("commit"), connection:
+                    job(connection)
+            except sqlite3.Error as e:
+                self.errors += 1
+                log.error(f"Error when writing to database: {e}")
+            except Exception:
+                # E.g., an invalid row, the following jobs are still executed
+                self.errors += 1
+                log.exception("Unexpected error when writing to database")
+            finally:
+                self.queue.task_done()
+        connection.close()
@@ -0,0 +1,141 @@
+import glob
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, TextIO, Tuple
+
+from Aggregates import Aggregates
+from Aircraft import Aircraft
+
+log = logging.getLogger(__name__)
+
+
+class FlightJournal:
+    """Append-only journal of new and changed tracked flights
+
+    Each line holds the start time, identifiers, and aggregates of a flight
+    as JSON, so replayed flights do not overwrite stored aggregates.
+    The journal is flushed to the operating system once per poll and synced
+    to the storage in intervals. At each database write, the journal is
+    rotated: the new segment starts with all tracked flights, and the old
+    segment is removed once the expired flights are stored in the database.
+    Remaining segments are replayed into the database at startup.
+    """
+
+    file: Optional[TextIO] = None
+
+    def __init__(self, path: str, sync_interval: float = 10) -> None:
+        self.path = path
+        self.sync_interval = sync_interval
+        self.time_sync = 0.0
+
+    def __del__(self) -> None:
+        self.close()
+
+    def segments(self) -> List[str]:
+        """Returns the paths of all journal segments, oldest first"""
+        rotated = sorted(
+            (
+                p
+                for p in glob.glob(f"{glob.escape(self.path)}.*")
+                if p.rsplit(".", 1)[1].isdigit()
+            ),
+            key=lambda p: int(p.rsplit(".", 1)[1]),
+        )
+        if os.path.exists(self.path):
+            rotated.append(self.path)
+        return rotated
+
+    def read(self) -> List[Aircraft]:
+        """Returns the newest entry of each flight in all journal segments"""
+        entries: Dict[Tuple[int, str], list] = {}
+        for segment in self.segments():
+            with open(segment, encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line may be incomplete after a crash
+                        log.warning(f"Skipping invalid line in journal {segment}")
+                        continue
+                    entries[(entry[0], entry[1])] = entry
+
+        ac_list = []
+        for entry in entries.values():
+            time_start, hex, registration, ac_type, flight, *aggregates = entry
+            aircraft = Aircraft()
+            aircraft.time_start = time_start
+            aircraft.time_end = time_start
+            aircraft.hex = hex
+            aircraft.registration = registration
+            aircraft.ac_type = ac_type
+            aircraft.flight = flight
+            # Entries written before the aggregates were journaled have none
+            if aggregates:
+                aircraft.aggregates = Aggregates.from_row(aggregates[0])
+            ac_list.append(aircraft)
+        return ac_list
+
+    def clear(self) -> None:
+        self.close()
+        for segment in self.segments():
+            self.remove(segment)
+
+    def remove(self, segment: str) -> None:
+        try:
+            os.remove(segment)
+        except OSError as e:
+            log.error(f"Could not remove journal segment: {e}")
+
+    def open(self) -> None:
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def append(self, aircraft: Aircraft) -> None:
+        if self.file is None:
+            self.open()
+        assert self.file is not None  # mypy fix
+        entry = [
+            aircraft.time_start,
+            aircraft.hex,
+            aircraft.registration,
+            aircraft.ac_type,
+            aircraft.flight,
+            (
+                Aggregates.from_states(aircraft.states)
+                if aircraft.aggregates is None
+                else aircraft.aggregates
+            ).row(),
+        ]
+        self.file.write(json.dumps(entry) + "\n")
+
+    def flush(self) -> None:
+        if self.file is None:
+            return
+        self.file.flush()
+        if time.monotonic() - self.time_sync >= self.sync_interval:
+            os.fsync(self.file.fileno())
+            self.time_sync = time.monotonic()
+
+    def rotate(self, tracked: Iterable[Aircraft]) -> Optional[str]:
+        """Starts a new segment with the tracked flights, returns the old one"""
+        self.close()
+        segments = self.segments()
+        if not os.path.exists(self.path):
+            return None
+        number = 1
+        if len(segments) > 1:
+            number = int(segments[-2].rsplit(".", 1)[1]) + 1
+        segment = f"{self.path}.{number}"
+        os.replace(self.path, segment)
+
+        for t in tracked:
+            self.append(t)
+        self.flush()
+        return segment
@@ -0,0 +1,180 @@
+import http.server
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Number of observed durations (in seconds) per bucket"""
+
+    # Upper bounds of the buckets, the last bucket has no bound
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float, counts: List[int]) -> float:
+        """Returns the upper bound of the bucket containing the quantile"""
+        rank = q * sum(counts)
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Responds to requests of Prometheus for the metrics"""
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode()  # type: ignore
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class Metrics:
+    """Timing histograms of the processing stages, counters, and gauges
+
+    Names follow the Prometheus conventions, labels are part of the name.
+    Metrics are updated from the main loop and the database writer thread.
+    """
+
+    prefix = "adsb_logger"
+    server: Optional[http.server.ThreadingHTTPServer] = None
+
+    descriptions = {
+        "stage_seconds": "Duration of the processing stages",
+        "polls_total": "Processed snapshots of the aircraft data",
+        "stale_snapshots_total": "Polls without new aircraft data",
+        "fetch_errors_total": "Failed polls of the aircraft data",
+        "rows_written_total": "Rows written to the database",
+        "traffic_dropped_total": "Minutes of traffic dropped from the full buffer",
+        "current_aircraft": "Aircraft currently seen",
+        "tracked_flights": "Tracked recent flights",
+        "tracked_flights_bytes": "Estimated memory of the tracked flights",
+        "spilled_flights_total": "Flights stored early for the memory budget",
+        "write_queue_depth": "Pending database writes",
+    }
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        # Bucket counts and sum of the stages at the last summary
+        self.summarized: Dict[str, Tuple[List[int], float]] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - time_start)
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    def render(self) -> str:
+        """Returns all metrics in the text format of Prometheus"""
+        lines = []
+        with self.lock:
+            name = f"{self.prefix}_stage_seconds"
+            lines.append(f"# HELP {name} {self.descriptions['stage_seconds']}")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, h in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets + ("+Inf",), h.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(f'{name}_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {h.count}')
+
+            families: Dict[str, List[str]] = {}
+            for metric_type, values in [
+                ("counter", self.counters),
+                ("gauge", self.gauges),
+            ]:
+                for key, value in sorted(values.items()):
+                    family = key.split("{")[0]
+                    if family not in families:
+                        families[family] = [
+                            f"# HELP {self.prefix}_{family} "
+                            f"{self.descriptions.get(family, family)}",
+                            f"# TYPE {self.prefix}_{family} {metric_type}",
+                        ]
+                    families[family].append(f"{self.prefix}_{key} {value}")
+        for family_lines in families.values():
+            lines.extend(family_lines)
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Returns the mean and 95th percentile of each stage since the last call"""
+        parts = []
+        with self.lock:
+            for stage, h in self.stages.items():
+                previous, previous_sum = self.summarized.get(
+                    stage, ([0] * len(h.counts), 0.0)
+                )
+                counts = [c - p for c, p in zip(h.counts, previous)]
+                count = sum(counts)
+                self.summarized[stage] = (list(h.counts), h.sum)
+                if not count:
+                    continue
+                mean = (h.sum - previous_sum) / count
+                p95 = h.quantile(0.95, counts)
+                parts.append(f"{stage} {mean * 1000:.1f} ms (p95 <= {p95 * 1000:g} ms)")
+        return "Stage durations: " + ", ".join(parts)
+
+    def serve(self, port: int, address: str = "127.0.0.1") -> None:
+        """Serves the metrics at http://<address>:<port>/metrics"""
+        self.server = http.server.ThreadingHTTPServer((address, port), MetricsHandler)
+        self.server.metrics = self  # type: ignore
+        threading.Thread(
+            target=self.server.serve_forever, name="Metrics", daemon=True
+        ).start()
+        log.info(f"Serving metrics at http://{address}:{port}/metrics")
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+# Metrics of the running logger
+metrics = Metrics()
@@ -0,0 +1,86 @@
+import logging
+import statistics
+import time
+from collections import deque
+from typing import Deque, Optional
+
+from Metrics import metrics
+
+log = logging.getLogger(__name__)
+
+
+class PollScheduler:
+    """Schedules the polls just after the expected update of the aircraft data
+
+    The interval between updates is learned from the timestamps (now) of the
+    aircraft data. The lag between the timestamp and the reception of an
+    update includes the clock offset to the receiver and the fetch latency,
+    the lowest recent lag is used for planning. Without new data, the poll is
+    repeated shortly, and after errors, the time between polls increases.
+    """
+
+    # Intervals (seconds) of the aircraft data that are learned
+    interval_min = 0.1
+    interval_max = 60.0
+    # Time (seconds) after the expected update until the poll
+    margin = 0.05
+    interval: Optional[float] = None
+    now_last: Optional[float] = None
+
+    def __init__(self, interval_default: float, backoff_max: float = 60) -> None:
+        self.interval_default = interval_default
+        self.backoff_max = backoff_max
+        self.backoff = 0.0
+        self.missed = 0
+        # Differences between the timestamps of the recent updates, and lags
+        # between their timestamps and reception
+        self.differences: Deque[float] = deque(maxlen=9)
+        self.lags: Deque[float] = deque(maxlen=9)
+        self.time_next = time.time()
+
+    def update(self, now: float) -> None:
+        """Plans the next poll after new aircraft data was received"""
+        time_received = time.time()
+        self.backoff = 0.0
+        if self.now_last is not None and now > self.now_last:
+            difference = now - self.now_last
+            if self.interval is not None and difference >= 1.5 * self.interval:
+                # Updates between the polls were not received
+                missed = round(difference / self.interval) - 1
+                self.missed += missed
+                metrics.count("missed_updates_total", missed)
+                log.debug(f"Missed {missed} updates of the aircraft data")
+            # The median ignores single missed updates and outliers
+            self.differences.append(difference)
+            self.interval = min(
+                self.interval_max,
+                max(self.interval_min, statistics.median(self.differences)),
+            )
+            metrics.set("poll_interval_seconds", self.interval)
+        self.now_last = now
+
+        self.lags.append(time_received - now)
+
+        if self.interval is None:
+            self.time_next = time_received + self.interval_default
+        else:
+            # Polls immediately if the next update is already due
+            self.time_next = now + min(self.lags) + self.interval + self.margin
+
+    def stale(self) -> None:
+        """Plans the next poll after the aircraft data was not updated yet"""
+        self.backoff = 0.0
+        retry = self.interval_default if self.interval is None else self.interval / 10
+        self.time_next = time.time() + max(self.margin, retry)
+
+    def error(self) -> None:
+        """Plans the next poll after an error, with increasing delay"""
+        self.backoff = min(
+            self.backoff_max,
+            max(self.interval or self.interval_default, 2 * self.backoff),
+        )
+        self.time_next = time.time() + self.backoff
+
+    def delay(self) -> float:
+        """Returns the time (seconds) until the next poll"""
+        return min(self.backoff_max, max(0.0, self.time_next - time.time()))
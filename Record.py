@@ -1,10 +1,10 @@
 import dataclasses
 import logging
 import numbers
-from typing import Optional
+from operator import itemgetter
+from typing import List, Optional, Tuple
 
 from Aircraft import Aircraft
-from States import States
 
 log = logging.getLogger(__name__)
 
@@ -27,7 +27,8 @@ class Record:
 
         if not isinstance(getattr(ac.states, self.record_key), numbers.Number):
             return False
-        if not getattr(self.aircraft.states, self.record_key):
+        # Any value is a record if none is stored yet, while zero is a value
+        if getattr(self.aircraft.states, self.record_key) is None:
             return True
 
         if self.is_max is True:
@@ -42,9 +43,26 @@ class Record:
                 return True
         return False
 
+    def best_aircraft(self, column: List[Tuple[float, Aircraft]]) -> Optional[Aircraft]:
+        """Returns the aircraft with the highest/lowest value of the record key
+
+        The column contains the values and aircraft of one poll.
+        For equal values, the first aircraft is returned.
+        """
+        if not column or self.is_max is None:
+            return None
+        if self.is_max:
+            return max(column, key=itemgetter(0))[1]
+        return min(column, key=itemgetter(0))[1]
+
     def assign_aircraft(self, ac: Aircraft):
-        self.aircraft = Aircraft()
-        self.aircraft.merge(ac)
-        if self.aircraft.states is None:  # mypy fix
-            self.aircraft.states = States()
-        self.aircraft.states.import_data(ac.states)
+        # Copy, as tracked flights do not keep the states of their samples
+        self.aircraft = Aircraft(
+            ac.hex,
+            ac.flight,
+            ac.registration,
+            ac.ac_type,
+            ac.states,
+            ac.time_start,
+            ac.time_end,
+        )
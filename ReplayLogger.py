@@ -0,0 +1,204 @@
+import logging
+import os
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from configparser import ConfigParser
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ADSBLogger import ADSBLogger
+from Aircraft import Aircraft
+from AircraftMetadata import open_metadata
+from Database import Database
+from PollScheduler import PollScheduler
+from Record import Record
+from Sources import ReplaySource
+from States import States
+from Tracker import FlightTracker
+
+log = logging.getLogger(__name__)
+
+
+class ReplayLogger(ADSBLogger):
+    """Processes archived snapshots of one time range without a database
+
+    The snapshots of the period unique_flight before the range are processed
+    first, so flights continuing from the previous range are recognized.
+    Only flights starting within the range are returned.
+    """
+
+    def __init__(
+        self,
+        config: ConfigParser,
+        files: List[Tuple[float, str]],
+        time_begin: float,
+        time_end: float,
+    ) -> None:
+        self.config = config
+        self.time_begin = time_begin
+        self.time_end = time_end
+        self.tracked = FlightTracker()
+        self.visible = {}
+        self.snapshot = {}
+        self.changed = {}
+        self.flights: List[Aircraft] = []
+        self.scheduler = PollScheduler(0)
+        self.metadata = open_metadata(config)
+
+        self.records = []
+        for s in States.key_list:
+            for is_max in [False, True]:
+                record = Record()
+                record.record_key = s
+                record.is_max = is_max
+                self.records.append(record)
+
+        unique_flight = self.config.getfloat("TIMEOUTS", "unique_flight")
+        self.source = ReplaySource(files, time_begin - unique_flight, time_end)
+
+    def __del__(self) -> None:
+        pass
+
+    def run(self) -> Tuple[List[Aircraft], List[Record]]:
+        """Returns the flights of the time range and the records"""
+        db_write = self.config.getfloat("TIMEOUTS", "db_write")
+        while not self.source.done:
+            if self.fetch_adsb_info():
+                continue
+            self.check_records()
+            self.merge_flights()
+            if self.time_db_write < self.time_json - db_write:
+                self.clean_tracked_flights()
+                self.time_db_write = self.time_json
+
+        self.flights.extend(self.tracked)
+        flights = [
+            f
+            for f in self.flights
+            if f.time_start is not None
+            and self.time_begin <= f.time_start < self.time_end
+        ]
+        return flights, self.records
+
+    def clean_tracked_flights(self) -> None:
+        time_min = self.time_json - self.config.getfloat("TIMEOUTS", "unique_flight")
+        self.flights.extend(self.tracked.expire(time_min))
+
+
+def replay_partition(
+    settings: Dict[str, Dict[str, str]],
+    files: List[Tuple[float, str]],
+    time_begin: float,
+    time_end: float,
+) -> Tuple[float, List[Aircraft], List[Record]]:
+    # Executed in a separate process, which receives the settings as dict
+    config = ConfigParser()
+    config.read_dict(settings)
+    # New records are logged for each snapshot, which is too verbose here
+    logging.getLogger("ADSBLogger").setLevel(logging.WARNING)
+    flights, records = ReplayLogger(config, files, time_begin, time_end).run()
+    return time_begin, flights, records
+
+
+def snapshot_files(paths: Iterable[str]) -> List[str]:
+    """Returns all snapshot files, including the files within directories"""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for directory, _, names in os.walk(path):
+            files.extend(
+                os.path.join(directory, n)
+                for n in names
+                if n.endswith(".json") or n.endswith(".gz")
+            )
+    return files
+
+
+def day_partitions(time_first: float, time_last: float) -> List[Tuple[float, float]]:
+    """Returns the time ranges of all local days between the timestamps"""
+    partitions = []
+    day = date.fromtimestamp(time_first)
+    while True:
+        begin = datetime.timestamp(datetime.combine(day, time.min))
+        if begin > time_last:
+            break
+        day += timedelta(days=1)
+        partitions.append((begin, datetime.timestamp(datetime.combine(day, time.min))))
+    return partitions
+
+
+def replay(
+    config: ConfigParser,
+    database: Database,
+    paths: Iterable[str],
+    processes: Optional[int] = None,
+) -> int:
+    """Stores the flights and records of archived snapshots in the database
+
+    The local days are processed in parallel. Flights continuing from one
+    day to the next might be split differently than by the live logger.
+    Returns the number of stored flights.
+    """
+    # The aircraft index is built once and mapped by the worker processes
+    metadata = open_metadata(config)
+    if metadata is not None:
+        metadata.close()
+
+    files = snapshot_files(paths)
+    log.info(f"Reading times of {len(files)} snapshot files")
+    with ProcessPoolExecutor(processes) as executor:
+        ranges = sorted(
+            r
+            for r in executor.map(ReplaySource.time_range, files, chunksize=64)
+            if r is not None
+        )
+        if not ranges:
+            log.warning("No snapshots found")
+            return 0
+
+        # Each day also requires the snapshots of the previous unique_flight
+        unique_flight = config.getfloat("TIMEOUTS", "unique_flight")
+        span = max(last - first for first, last, _ in ranges)
+        times_first = [first for first, _, _ in ranges]
+        settings = {s: dict(config[s]) for s in config.sections()}
+        futures = []
+        for begin, end in day_partitions(ranges[0][0], ranges[-1][1]):
+            start = bisect_left(times_first, begin - unique_flight - span)
+            stop = bisect_left(times_first, end)
+            files_day = [
+                (first, path)
+                for first, last, path in ranges[start:stop]
+                if last >= begin - unique_flight
+            ]
+            futures.append(
+                executor.submit(replay_partition, settings, files_day, begin, end)
+            )
+
+        count = 0
+        records_days: Dict[float, List[Record]] = {}
+        for future in as_completed(futures):
+            time_begin, flights, records_days[time_begin] = future.result()
+            count += database.write_flights(flights)
+            log.info(
+                f"Replayed {len(flights)} flights of "
+                f"{datetime.fromtimestamp(time_begin).strftime('%Y-%m-%d')}"
+            )
+
+    # Keep the best records of the database and all days, in order of time
+    records = database.read_records()
+    for time_begin in sorted(records_days):
+        for r, candidate in zip(records, records_days[time_begin]):
+            assert r.record_key == candidate.record_key
+            assert r.is_max == candidate.is_max
+            if candidate.aircraft is None or not candidate.timestamp:
+                continue
+            if r.compare_aircraft(candidate.aircraft):
+                r.aircraft = candidate.aircraft
+                r.timestamp = candidate.timestamp
+                r.is_stored = False
+
+    database.write_records(records)
+    database.flush()
+    return count
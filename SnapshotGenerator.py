@@ -0,0 +1,205 @@
+import json
+import math
+import os
+import random
+import string
+from typing import Dict, List
+
+# Position of the simulated receiver
+receiver_lat = 48.35
+receiver_lon = 11.79
+
+# Optional fields of an aircraft in the aircraft.json file of readsb
+optional_fields = [
+    "alt_geom",
+    "gs",
+    "ias",
+    "tas",
+    "mach",
+    "wd",
+    "ws",
+    "oat",
+    "tat",
+    "track",
+    "roll",
+    "mag_heading",
+    "true_heading",
+    "baro_rate",
+    "geom_rate",
+    "squawk",
+    "emergency",
+    "category",
+    "nav_qnh",
+    "nav_altitude_mcp",
+    "nav_heading",
+    "lat",
+    "lon",
+    "nic",
+    "rc",
+    "seen_pos",
+    "r_dst",
+    "r_dir",
+    "version",
+    "nic_baro",
+    "nac_p",
+    "nac_v",
+    "sil",
+    "sil_type",
+    "gva",
+    "sda",
+]
+
+ac_types = ["A320", "A20N", "A321", "A319", "B738", "B38M", "E190", "A359", "C172"]
+airlines = ["DLH", "EWG", "SWR", "AUA", "RYR", "EZY", "UAE", "BAW", "AFR", "KLM"]
+
+
+class SnapshotGenerator:
+    """Generates realistic aircraft.json snapshots in the format of readsb
+
+    Aircraft fly straight lines around the receiver and climb or descend.
+    With each snapshot, the share churn of aircraft is replaced by new ones,
+    and most aircraft receive new messages. Each aircraft lacks the share
+    missing of the optional fields and identifiers, e.g., for older
+    transponders or aircraft without a known registration.
+    """
+
+    def __init__(
+        self,
+        count: int = 250,
+        churn: float = 0.01,
+        missing: float = 0.2,
+        seed: int = 0,
+        interval: float = 1.0,
+        now: float = 1700000000.0,
+    ) -> None:
+        self.count = count
+        self.churn = churn
+        self.missing = missing
+        self.interval = interval
+        self.now = now
+        self.messages = 0
+        self.rng = random.Random(seed)
+        self.aircraft: List[Dict] = [self.new_aircraft() for _ in range(count)]
+
+    def new_aircraft(self) -> dict:
+        rng = self.rng
+        airline = rng.choice(airlines)
+        flight = airline + str(rng.randrange(1, 10000))
+        a: dict = {
+            "hex": f"{rng.randrange(0x1000000):06x}",
+            "type": "adsb_icao",
+            "flight": f"{flight:<8}",
+            "r": "D-A" + "".join(rng.choices(string.ascii_uppercase, k=3)),
+            "t": rng.choice(ac_types),
+            "alt_baro": rng.randrange(0, 41000, 25),
+            "gs": rng.uniform(120, 520),
+            "track": rng.uniform(0, 360),
+            "baro_rate": rng.choice([-1600, -800, 0, 0, 0, 1200, 2400]),
+            "lat": receiver_lat + rng.uniform(-2, 2),
+            "lon": receiver_lon + rng.uniform(-3, 3),
+            "squawk": f"{rng.randrange(0o10000):04o}",
+            "emergency": "none",
+            "category": "A3",
+            "nav_qnh": 1013.6,
+            "nav_altitude_mcp": rng.randrange(0, 41000, 1000),
+            "version": 2,
+            "nic": 8,
+            "rc": 186,
+            "nic_baro": 1,
+            "nac_p": 9,
+            "nac_v": 1,
+            "sil": 3,
+            "sil_type": "perhour",
+            "gva": 2,
+            "sda": 2,
+            "mlat": [],
+            "tisb": [],
+            "messages": 0,
+            "seen": 0.0,
+            "rssi": rng.uniform(-30, -3),
+        }
+        if rng.random() < 0.05:
+            a["alt_baro"] = "ground"
+            a["gs"] = rng.uniform(0, 25)
+
+        # Missing fields are fixed for each aircraft
+        a["missing"] = {
+            f
+            for f in optional_fields + ["flight", "r", "t"]
+            if rng.random() < self.missing
+        }
+        self.update_aircraft(a)
+        return a
+
+    def update_aircraft(self, a: dict) -> None:
+        rng = self.rng
+        messages = rng.randrange(1, 20)
+        a["messages"] += messages
+        self.messages += messages
+        a["seen"] = rng.uniform(0, self.interval)
+        a["seen_pos"] = a["seen"]
+        a["rssi"] = min(-1.0, max(-40.0, a["rssi"] + rng.uniform(-1, 1)))
+
+        # Move along the track
+        distance = a["gs"] * self.interval / 3600 / 60  # degrees of latitude
+        a["lat"] += distance * math.cos(math.radians(a["track"]))
+        a["lon"] += (
+            distance
+            * math.sin(math.radians(a["track"]))
+            / math.cos(math.radians(a["lat"]))
+        )
+        if a["alt_baro"] != "ground":
+            a["alt_baro"] = min(
+                45000, max(0, int(a["alt_baro"] + a["baro_rate"] * self.interval / 60))
+            )
+            a["alt_geom"] = a["alt_baro"] + 275
+            a["geom_rate"] = a["baro_rate"] + rng.randrange(-64, 65, 32)
+            a["mach"] = round(a["gs"] / 1100 + a["alt_baro"] / 200000, 3)
+            a["tas"] = int(a["gs"] + rng.uniform(-30, 30))
+            a["ias"] = int(a["tas"] * (1 - a["alt_baro"] / 80000))
+            a["ws"] = rng.randrange(0, 80)
+            a["wd"] = rng.randrange(0, 360)
+            a["oat"] = int(15 - a["alt_baro"] / 500)
+            a["tat"] = a["oat"] + int(a["mach"] * 20)
+            a["roll"] = round(rng.uniform(-2, 2), 1)
+        a["true_heading"] = round(a["track"] + rng.uniform(-3, 3), 2) % 360
+        a["mag_heading"] = round(a["true_heading"] - 3.5, 2) % 360
+        a["nav_heading"] = round(a["track"], 1)
+
+        # Distance (nautical miles) and direction from the receiver
+        dlat = (a["lat"] - receiver_lat) * 60
+        dlon = (a["lon"] - receiver_lon) * 60 * math.cos(math.radians(receiver_lat))
+        a["r_dst"] = round(math.hypot(dlat, dlon), 3)
+        a["r_dir"] = round(math.degrees(math.atan2(dlon, dlat)) % 360, 1)
+
+    def snapshot(self) -> dict:
+        """Advances the time by one interval and returns the new snapshot"""
+        self.now += self.interval
+        for i, a in enumerate(self.aircraft):
+            if self.rng.random() < self.churn:
+                self.aircraft[i] = self.new_aircraft()
+            elif self.rng.random() < 0.9:
+                self.update_aircraft(a)
+            else:
+                a["seen"] += self.interval
+
+        return {
+            "now": self.now,
+            "messages": self.messages,
+            "aircraft": [
+                {
+                    k: round(v, 6) if isinstance(v, float) else v
+                    for k, v in a.items()
+                    if k != "missing" and k not in a["missing"]
+                }
+                for a in self.aircraft
+            ],
+        }
+
+    def write(self, path: str) -> bytes:
+        """Writes the next snapshot to a file, as readsb replaces the file"""
+        data = json.dumps(self.snapshot(), separators=(",", ":")).encode()
+        with open(path + ".tmp", "wb") as snapshot_file:
+            snapshot_file.write(data)
+        os.replace(path + ".tmp", path)
+        return data
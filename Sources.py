@@ -0,0 +1,509 @@
+import asyncio
+import gzip
+import heapq
+import http.client
+import itertools
+import json
+import logging
+import re
+import select
+import socket
+import threading
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import unquote, urljoin, urlsplit, urlunsplit
+from urllib.request import urlopen
+
+from Metrics import metrics
+
+try:
+    # Optional decoder, several times faster than the json module
+    from orjson import loads  # type: ignore
+except ImportError:
+    from json import loads  # type: ignore[assignment]
+
+log = logging.getLogger(__name__)
+
+
+class URLSource:
+    """Reads the complete aircraft.json file from a URL"""
+
+    def __init__(self, url: str, timeout: float) -> None:
+        self.url = url
+        self.timeout = timeout
+
+    def close(self) -> None:
+        pass
+
+    def fetch(self) -> Optional[dict]:
+        with metrics.timer("fetch"):
+            with closing(urlopen(self.url, None, self.timeout)) as aircraft_file:
+                body = aircraft_file.read()
+        with metrics.timer("decode"):
+            return loads(body)
+
+
+class HTTPSource:
+    """Polls the aircraft.json file over a persistent HTTP connection
+
+    Requests are conditional (ETag and Last-Modified), so an unchanged file
+    is not transferred and decoded again, and the file may be compressed.
+    Redirects are followed like by urlopen, permanent ones also by the next
+    polls. Credentials in the URL are sent with basic authentication.
+    """
+
+    # Redirects followed for one request, same limit as urlopen
+    redirects_max = 10
+    redirect_codes = [301, 302, 303, 307, 308]
+
+    connection: Optional[http.client.HTTPConnection] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    https: bool = False
+    host: str = ""
+    authorization: Optional[str] = None
+
+    def __init__(self, url: str, timeout: float) -> None:
+        self.timeout = timeout
+        self.locate(url)
+        # Without the credentials, as the URL is logged
+        self.url = self.location
+
+    def __del__(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def locate(self, url: str) -> None:
+        """Sets the location of the file, e.g., the target of a redirect"""
+        parts = urlsplit(url)
+        if parts.scheme not in ["http", "https"]:
+            raise URLError(f"Unsupported URL {url}")
+        host = parts.netloc.rpartition("@")[2]
+        https = parts.scheme == "https"
+        if (host, https) != (self.host, self.https):
+            # Credentials are only sent to the host of their URL
+            self.close()
+            self.authorization = None
+        if parts.username is not None:
+            credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+            self.authorization = "Basic " + b64encode(credentials.encode()).decode()
+        self.https = https
+        self.host = host
+        self.path = urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        self.location = urlunsplit((parts.scheme, host, self.path, "", ""))
+
+    def request(self, headers: Dict[str, str]) -> http.client.HTTPResponse:
+        if self.connection is None:
+            if self.https:
+                self.connection = http.client.HTTPSConnection(
+                    self.host, timeout=self.timeout
+                )
+            else:
+                self.connection = http.client.HTTPConnection(
+                    self.host, timeout=self.timeout
+                )
+        if self.authorization is not None:
+            headers = {**headers, "Authorization": self.authorization}
+        self.connection.request("GET", self.path, headers=headers)
+        return self.connection.getresponse()
+
+    def get(self, headers: Dict[str, str]) -> Tuple[http.client.HTTPResponse, bytes]:
+        try:
+            with metrics.timer("fetch"):
+                try:
+                    response = self.request(headers)
+                except (http.client.HTTPException, ConnectionError):
+                    # The receiver may have closed the idle connection, retry once
+                    self.close()
+                    response = self.request(headers)
+                return response, response.read()
+        except TimeoutError:
+            self.close()
+            raise
+        except (http.client.HTTPException, OSError) as e:
+            # Same exception as for urlopen
+            self.close()
+            raise URLError(e)
+
+    def fetch(self) -> Optional[dict]:
+        headers = {"Accept-Encoding": "gzip"}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+
+        # Location for the next poll, unless all redirects are permanent
+        origin = self.location
+        authorization = self.authorization
+        permanent = True
+        try:
+            for _ in range(self.redirects_max + 1):
+                response, body = self.get(headers)
+                target = response.getheader("Location")
+                if response.status not in self.redirect_codes or target is None:
+                    break
+                permanent = permanent and response.status in [301, 308]
+                self.locate(urljoin(self.location, target))
+            else:
+                raise HTTPError(
+                    self.url,
+                    response.status,
+                    "Too many redirects",
+                    response.headers,
+                    None,
+                )
+        finally:
+            if not permanent:
+                self.locate(origin)
+                self.authorization = authorization
+
+        # File not modified since the last request
+        if response.status == http.client.NOT_MODIFIED:
+            return None
+        if response.status != http.client.OK:
+            raise HTTPError(
+                self.url, response.status, response.reason, response.headers, None
+            )
+
+        self.etag = response.getheader("ETag")
+        self.last_modified = response.getheader("Last-Modified")
+        with metrics.timer("decode"):
+            if response.getheader("Content-Encoding", "").lower() == "gzip":
+                try:
+                    body = gzip.decompress(body)
+                except (OSError, EOFError) as e:
+                    raise URLError(e)
+            return loads(body)
+
+
+class StreamSource:
+    """Receives aircraft updates from the JSON network port of readsb
+
+    readsb sends one JSON object per line for each updated aircraft
+    (option --net-json-port). All updates received since the last fetch
+    are combined to a dict in the format of the aircraft.json file.
+    """
+
+    # Updates contain only the changed aircraft, not all seen aircraft
+    complete = False
+    connection: Optional[socket.socket] = None
+    # Closed by the receiver after the lines returned by the last call
+    closed: bool = False
+
+    def __init__(self, host: str, port: int, timeout: float) -> None:
+        self.url = f"tcp://{host}:{port}"
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.buffer = b""
+        self.now = 0.0
+
+    def __del__(self) -> None:
+        self.close()
+
+    def connect(self) -> None:
+        log.info(f"Connecting to JSON stream at {self.host}:{self.port}")
+        try:
+            self.connection = socket.create_connection(
+                (self.host, self.port), self.timeout
+            )
+        except (TimeoutError, ConnectionError):
+            raise
+        except OSError as e:
+            # Same exception as for urlopen, e.g., for an unknown host
+            raise URLError(e)
+        self.buffer = b""
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def receive(self) -> bytes:
+        """Returns all complete lines received since the last call
+
+        If the receiver has closed the connection, the complete lines are
+        returned first, and the error is raised by the next call.
+        """
+        if self.closed:
+            self.closed = False
+            raise ConnectionError(
+                f"JSON stream at {self.host}:{self.port} closed by receiver"
+            )
+        if self.connection is None:
+            self.connect()
+        assert self.connection is not None  # mypy fix
+
+        chunks = [self.buffer]
+        while select.select([self.connection], [], [], 0)[0]:
+            try:
+                chunk = self.connection.recv(65536)
+            except (TimeoutError, ConnectionError):
+                self.close()
+                raise
+            except OSError as e:
+                # Same exception as for urlopen, e.g., for an unreachable host
+                self.close()
+                raise URLError(e)
+            if not chunk:
+                self.close()
+                self.closed = True
+                break
+            chunks.append(chunk)
+        data = b"".join(chunks)
+        lines, _, self.buffer = data.rpartition(b"\n")
+        if self.closed and not lines:
+            # Nothing to return, so the error is raised now
+            return self.receive()
+        return lines
+
+    def fetch(self) -> Optional[dict]:
+        with metrics.timer("fetch"):
+            lines = self.receive()
+        if not lines:
+            return None
+
+        # Only keep the newest update of each aircraft
+        aircraft: Dict[str, dict] = {}
+        now = 0.0
+        with metrics.timer("decode"):
+            for line in lines.splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    a = loads(line)
+                except json.JSONDecodeError as e:
+                    log.warning(f"Skipping invalid line from JSON stream: {e}")
+                    continue
+                now = max(now, a.get("now", 0))
+                aircraft[a.get("hex")] = a
+        if not now:
+            now = time.time()
+
+        # Updates received after the last fetch are never outdated
+        self.now = max(now, self.now + 0.001)
+        return {"now": self.now, "aircraft": list(aircraft.values())}
+
+
+class MultiSource:
+    """Polls several receivers concurrently and merges their aircraft by hex
+
+    Each receiver is polled by its own task of an asyncio event loop running
+    in a background thread, so a slow receiver does not delay the others.
+    Fetching merges the most recent data of all receivers without waiting.
+    For aircraft seen by several receivers, the newest state is kept.
+    """
+
+    thread: Optional[threading.Thread] = None
+
+    def __init__(self, sources: list, timeout: float, interval: float) -> None:
+        self.sources = sources
+        self.timeout = timeout
+        self.interval = interval
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(len(sources))
+        # Last aircraft data and last error of each receiver
+        self.snapshots: List[Optional[dict]] = [None] * len(sources)
+        self.errors: List[Optional[Exception]] = [None] * len(sources)
+        self.now = 0.0
+        self.stopped = False
+
+    def __del__(self) -> None:
+        self.close()
+
+    def start(self) -> None:
+        for index in range(len(self.sources)):
+            self.loop.create_task(self.poll_source(index))
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        if self.thread is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(self.timeout)
+            self.thread = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for source in self.sources:
+            source.close()
+
+    async def stop(self) -> None:
+        # Tasks also end by themselves, as wait_for can swallow a cancellation
+        self.stopped = True
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def poll_source(self, index: int) -> None:
+        source = self.sources[index]
+        while not self.stopped:
+            time_start = self.loop.time()
+            try:
+                request = self.loop.run_in_executor(self.executor, source.fetch)
+            except RuntimeError:
+                # Executor has been shut down
+                return
+            try:
+                try:
+                    data = await asyncio.wait_for(asyncio.shield(request), self.timeout)
+                except asyncio.TimeoutError:
+                    log.warning(
+                        f"No response from {source.url} within {self.timeout} s"
+                    )
+                    self.snapshots[index] = None
+                    data = await request
+            except (OSError, ValueError) as e:
+                log.error(f"{source.url}: {e}")
+                self.snapshots[index] = None
+                self.errors[index] = e
+                await asyncio.sleep(self.timeout)
+                continue
+
+            self.errors[index] = None
+            if data is not None:
+                self.snapshots[index] = data
+            await asyncio.sleep(self.interval - (self.loop.time() - time_start))
+
+    def fetch(self) -> Optional[dict]:
+        if self.thread is None:
+            self.start()
+
+        snapshots = [s for s in self.snapshots if s is not None]
+        if not snapshots:
+            errors = [e for e in self.errors if e is not None]
+            if errors:
+                raise URLError(f"No receiver available: {errors[-1]}")
+            return None
+
+        # Merge aircraft of all receivers, keep the most recent message
+        aircraft: Dict[str, dict] = {}
+        received: Dict[str, float] = {}
+        now = 0.0
+        with metrics.timer("merge_receivers"):
+            for snapshot in snapshots:
+                now = max(now, snapshot["now"])
+                for a in snapshot["aircraft"]:
+                    hex = a.get("hex")
+                    time_message = snapshot["now"] - a.get("seen", 0)
+                    if hex not in received or time_message > received[hex]:
+                        aircraft[hex] = a
+                        received[hex] = time_message
+
+        if now <= self.now:
+            return None
+        self.now = now
+        return {"now": now, "aircraft": list(aircraft.values())}
+
+
+class ReplaySource:
+    """Reads archived snapshots of the aircraft.json file in order of time
+
+    Files may be compressed (gzip) and contain one snapshot, or several
+    snapshots as the chunks of tar1090 ({"files": [...]}). The files are
+    given with the time of their first snapshot, ordered by it, and are read
+    one after another. Only snapshots within the time range are returned.
+    """
+
+    # Start of a file with one snapshot, written by readsb
+    now_pattern = re.compile(rb'\s*\{\s*"now"\s*:\s*([0-9.]+)\s*,')
+
+    def __init__(
+        self, files: List[Tuple[float, str]], time_min: float, time_max: float
+    ) -> None:
+        self.url = "replay"
+        self.time_min = time_min
+        self.time_max = time_max
+        self.snapshots = self.ordered_snapshots(files)
+        self.done = False
+
+    def close(self) -> None:
+        pass
+
+    @staticmethod
+    def open(path: str):
+        if path.endswith(".gz"):
+            return gzip.open(path, "rb")
+        return open(path, "rb")
+
+    @classmethod
+    def read(cls, path: str) -> List[dict]:
+        """Returns all snapshots of a file, or none if it cannot be read"""
+        try:
+            with cls.open(path) as snapshot_file:
+                data = loads(snapshot_file.read())
+        except (OSError, EOFError, ValueError) as e:
+            log.warning(f"Skipping unreadable snapshot file {path}: {e}")
+            return []
+        snapshots = data.get("files", [data]) if isinstance(data, dict) else []
+        return [s for s in snapshots if "now" in s and "aircraft" in s]
+
+    @classmethod
+    def time_range(cls, path: str) -> Optional[Tuple[float, float, str]]:
+        """Returns the time of the first and last snapshot of a file
+
+        For files with one snapshot, only the start of the file is read.
+        """
+        try:
+            with cls.open(path) as snapshot_file:
+                match = cls.now_pattern.match(snapshot_file.read(256))
+        except (OSError, EOFError) as e:
+            log.warning(f"Skipping unreadable snapshot file {path}: {e}")
+            return None
+        if match is not None:
+            now = float(match.group(1))
+            return now, now, path
+
+        times = [s["now"] for s in cls.read(path)]
+        if not times:
+            return None
+        return min(times), max(times), path
+
+    def ordered_snapshots(self, files: List[Tuple[float, str]]) -> Iterator[dict]:
+        # Snapshots of all read files, the next file only has later snapshots
+        pending: List[Tuple[float, int, dict]] = []
+        counter = itertools.count()
+        for time_first, path in files:
+            while pending and pending[0][0] <= time_first:
+                yield heapq.heappop(pending)[2]
+            for snapshot in self.read(path):
+                heapq.heappush(pending, (snapshot["now"], next(counter), snapshot))
+        while pending:
+            yield heapq.heappop(pending)[2]
+
+    def fetch(self) -> Optional[dict]:
+        for snapshot in self.snapshots:
+            if self.time_min <= snapshot["now"] < self.time_max:
+                return snapshot
+        self.done = True
+        return None
+
+
+def open_source(url: str, timeout: float, interval: float):
+    """Returns the source for the aircraft data, depending on the URL scheme
+
+    Several URLs separated by spaces, commas, or lines are polled concurrently.
+    """
+    urls = url.replace(",", " ").split()
+    if len(urls) > 1:
+        return MultiSource(
+            [open_source(u, timeout, interval) for u in urls], timeout, interval
+        )
+
+    url = urls[0]
+    parts = urlsplit(url)
+    if parts.scheme == "tcp":
+        if parts.hostname is None or parts.port is None:
+            raise ValueError(f"Host and port required for JSON stream {url}")
+        return StreamSource(parts.hostname, parts.port, timeout)
+    if parts.scheme in ["http", "https"]:
+        return HTTPSource(url, timeout)
+    return URLSource(url, timeout)
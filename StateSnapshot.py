@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import struct
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+from Aggregates import Aggregates
+from Aircraft import Aircraft
+from Record import Record
+from States import States
+
+log = logging.getLogger(__name__)
+
+
+class StateSnapshot:
+    """Snapshot of the tracked flights and records for a fast restart
+
+    The file starts with a header (magic bytes, format version, CRC-32 and
+    length of the payload), followed by the compressed JSON payload. Flights
+    keep their end time and aggregates, which are not stored in the
+    database. A snapshot is only loaded if it is complete, was written for
+    the same database and states, and is recent enough.
+    """
+
+    magic = b"ADSBSNAP"
+    version = 1
+    header = struct.Struct("<8sHII")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @staticmethod
+    def aircraft_entry(aircraft: Aircraft) -> list:
+        return [
+            aircraft.time_start,
+            aircraft.time_end,
+            aircraft.hex,
+            aircraft.flight,
+            aircraft.registration,
+            aircraft.ac_type,
+            (
+                None
+                if aircraft.states is None
+                else [getattr(aircraft.states, s) for s in States.field_list]
+            ),
+            None if aircraft.aggregates is None else aircraft.aggregates.row(),
+        ]
+
+    @staticmethod
+    def aircraft_from_entry(entry: list) -> Aircraft:
+        aircraft = Aircraft(*entry[2:6])
+        aircraft.time_start, aircraft.time_end = entry[0:2]
+        # Tracked flights are compact copies without states
+        aircraft.states = None if entry[6] is None else States(*entry[6])
+        if entry[7] is not None:
+            aircraft.aggregates = Aggregates.from_row(entry[7])
+        return aircraft
+
+    def dump(
+        self,
+        time_json: float,
+        database: str,
+        schema_version: int,
+        tracked: Iterable[Aircraft],
+        records: List[Record],
+    ) -> bytes:
+        """Returns the snapshot of the tracked flights and records"""
+        state = {
+            "time": time_json,
+            "database": database,
+            "schema_version": schema_version,
+            "states": States.field_list,
+            "tracked": [self.aircraft_entry(t) for t in tracked],
+            "records": [
+                [
+                    r.record_key,
+                    r.is_max,
+                    r.timestamp,
+                    r.is_stored,
+                    None if r.aircraft is None else self.aircraft_entry(r.aircraft),
+                ]
+                for r in records
+            ],
+        }
+        payload = zlib.compress(json.dumps(state, separators=(",", ":")).encode())
+        return (
+            self.header.pack(
+                self.magic, self.version, zlib.crc32(payload), len(payload)
+            )
+            + payload
+        )
+
+    def write(self, data: bytes) -> None:
+        """Replaces the snapshot file, the previous one is kept until then"""
+        try:
+            with open(self.path + ".tmp", "wb") as snapshot_file:
+                snapshot_file.write(data)
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            log.error(f"Could not write state snapshot: {e}")
+
+    def load(
+        self, database: str, schema_version: int, time_min: float
+    ) -> Optional[Tuple[List[Aircraft], List[Record]]]:
+        """Returns the tracked flights and records, or None if not valid
+
+        Snapshots written before time_min are not valid.
+        """
+        try:
+            with open(self.path, "rb") as snapshot_file:
+                data = snapshot_file.read()
+        except FileNotFoundError:
+            log.debug("No state snapshot available")
+            return None
+        except OSError as e:
+            log.warning(f"Could not read state snapshot: {e}")
+            return None
+
+        try:
+            magic, version, crc, length = self.header.unpack_from(data)
+            size = self.header.size
+            payload = data[size:]
+            if magic != self.magic or version != self.version:
+                raise ValueError(f"unknown format {magic!r} version {version}")
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                raise ValueError("incomplete or corrupted")
+            state = json.loads(zlib.decompress(payload))
+            if state["database"] != database:
+                raise ValueError(f"written for database {state['database']}")
+            if state["schema_version"] != schema_version:
+                raise ValueError("written for another database schema")
+            if tuple(state["states"]) != States.field_list:
+                raise ValueError("written for other states")
+            if state["time"] < time_min:
+                raise ValueError("outdated")
+
+            tracked = [self.aircraft_from_entry(e) for e in state["tracked"]]
+            records = []
+            for record_key, is_max, timestamp, is_stored, entry in state["records"]:
+                record = Record()
+                record.record_key = record_key
+                record.is_max = is_max
+                record.timestamp = timestamp
+                record.is_stored = is_stored
+                if entry is not None:
+                    record.aircraft = self.aircraft_from_entry(entry)
+                records.append(record)
+            # Same order as the records read from the database
+            if [(r.record_key, r.is_max) for r in records] != [
+                (s, is_max) for s in States.key_list for is_max in [False, True]
+            ]:
+                raise ValueError("written for other records")
+        except (struct.error, zlib.error, ValueError, KeyError, TypeError) as e:
+            log.warning(f"Ignoring state snapshot: {e}")
+            return None
+
+        log.info(
+            f"Read {len(tracked)} tracked flights and {len(records)} records "
+            "from state snapshot"
+        )
+        return tracked, records
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.error(f"Could not remove state snapshot: {e}")
@@ -1,12 +1,17 @@
 import dataclasses
 import logging
-from typing import Optional
+from typing import ClassVar, Optional, Tuple
 
 log = logging.getLogger(__name__)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class States:
+    # Names of all state variables, set once below the class definition
+    # The key list is sorted, the field list is in the order of definition
+    key_list: ClassVar[Tuple[str, ...]] = ()
+    field_list: ClassVar[Tuple[str, ...]] = ()
+
     alt_baro: Optional[float] = None
     alt_geom: Optional[float] = None
     gs: Optional[float] = None
@@ -20,12 +25,16 @@ class States:
     oat: Optional[float] = None
     r_dst: Optional[float] = None
 
-    def __init__(self) -> None:
-        self.key_list = [
-            a
-            for a in dir(self)
-            if not callable(getattr(self, a)) and not a.startswith("__")
-        ]
+    @classmethod
+    def from_data_dict(cls, data: dict) -> "States":
+        """Returns the states of an aircraft in the aircraft.json file"""
+        # Decoded JSON numbers are int or float (faster than numbers.Number)
+        return cls(
+            *[
+                value if isinstance(value := data.get(s), (int, float)) else None
+                for s in cls.field_list
+            ]
+        )
 
     def import_data(self, data):
         assert isinstance(
@@ -33,12 +42,13 @@ class States:
         ), f"Cannot compare {type(self)} with {type(self)}"
 
         # Overwrite remaining variables
-        if isinstance(self.key_list, list):
-            vars = self.key_list
-        else:
-            vars = [self.key_list]
-        for var in vars:
-            if not getattr(data, var) is None:
-                setattr(self, var, getattr(data, var))
+        for var in self.key_list:
+            value = getattr(data, var)
+            if value is not None:
+                setattr(self, var, value)
 
         return self
+
+
+States.field_list = tuple(f.name for f in dataclasses.fields(States))
+States.key_list = tuple(sorted(States.field_list))
@@ -0,0 +1,189 @@
+import http.server
+import json
+import logging
+import math
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from configparser import ConfigParser
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from Database import Database
+
+log = logging.getLogger(__name__)
+
+
+class StatisticsHandler(http.server.BaseHTTPRequestHandler):
+    """Responds to requests for statistics with JSON
+
+    Endpoints: /counts, /days, /top/<key> (flight, registration, type, or
+    airline), /records, and /traffic (per hour). Time ranges are selected
+    with the parameters from and to (Unix timestamps), the number of rows
+    (or hours) with count.
+    """
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        parameters = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            arguments = self.server.service.arguments(  # type: ignore
+                url.path.rstrip("/"), parameters
+            )
+        except KeyError as e:
+            self.send_error(404, e.args[0])
+            return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        try:
+            body = self.server.service.response(arguments)  # type: ignore
+        except (sqlite3.Error, OverflowError) as e:
+            log.error(f"Evaluation of {self.path} failed: {e}")
+            self.send_error(500, "Evaluation of the statistics failed")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        log.debug(f"{self.address_string()} {format % args}")
+
+
+class StatisticsService:
+    """Serves the statistics of the database for dashboards
+
+    Queries are evaluated with a pool of read-only connections, so the logger
+    writing flights is not blocked. Responses are cached until the database
+    is changed or the cache_ttl has expired, e.g., for the current day.
+    """
+
+    server: Optional[http.server.ThreadingHTTPServer] = None
+    cache_size: int = 64
+    # Limit of rows per response
+    count_max: int = 1000
+
+    def __init__(self, config: ConfigParser) -> None:
+        self.config = config
+        self.cache_ttl = config.getfloat("STATISTICS", "cache_ttl", fallback=60)
+
+        # The data version of a connection changes with the commits of other
+        # connections, so one connection is reserved for detecting changes
+        self.monitor = Database(config, True)
+        self.pool: "queue.Queue[Database]" = queue.Queue()
+        for _ in range(config.getint("STATISTICS", "connections", fallback=4)):
+            self.pool.put(Database(config, True))
+
+        # Encoded responses with time of evaluation, by arguments
+        self.lock = threading.Lock()
+        self.cache: "OrderedDict[tuple, Tuple[float, bytes]]" = OrderedDict()
+        self.cache_version: Optional[int] = None
+
+    def arguments(self, path: str, parameters: Dict[str, str]) -> tuple:
+        """Returns the arguments of the evaluation for the request"""
+        count = min(self.count_max, int(parameters.get("count", 5)))
+        if count < 1:
+            raise ValueError(f"Invalid count {count}")
+        timestamp_min = self.timestamp(parameters.get("from", "0"))
+        timestamp_max = self.timestamp(parameters.get("to", "0"))
+        if path == "/counts":
+            return ("counts", timestamp_min, timestamp_max)
+        if path == "/days":
+            return ("days", count)
+        if path == "/records":
+            return ("records",)
+        if path == "/traffic":
+            return ("traffic", min(self.count_max, int(parameters.get("count", 24))))
+        if path.startswith("/top/"):
+            key = path.split("/", 2)[2]
+            if key not in ["flight", "registration", "type", "airline"]:
+                raise KeyError(f"Unknown database entry key {key}")
+            return ("flights", key, count, timestamp_min, timestamp_max)
+        raise KeyError(f"Unknown statistics {path}")
+
+    @staticmethod
+    def timestamp(value: str) -> float:
+        """Returns the Unix timestamp of a parameter, if it is a valid time"""
+        timestamp = float(value)
+        try:
+            if not math.isfinite(timestamp):
+                raise ValueError
+            datetime.fromtimestamp(timestamp)
+        except (ValueError, OverflowError, OSError):
+            raise ValueError(f"Invalid timestamp {value}") from None
+        return timestamp
+
+    @contextmanager
+    def connection(self) -> Iterator[Database]:
+        database = self.pool.get()
+        try:
+            yield database
+        finally:
+            self.pool.put(database)
+
+    def data_version(self) -> int:
+        """Returns the data version, which changes with each commit of the logger"""
+        cursor = self.monitor.db_cursor
+        return cursor.execute("PRAGMA data_version").fetchone()[0]
+
+    def evaluate(self, arguments: tuple) -> List[Dict[str, object]]:
+        """Evaluates the statistics, with one object per table row"""
+        name, *args = arguments
+        with self.connection() as database:
+            statistics = getattr(database, f"evaluate_{name}")(*args)
+        header = statistics[0]
+        return [dict(zip(header, row)) for row in statistics[1:]]
+
+    def response(self, arguments: tuple) -> bytes:
+        """Returns the cached response for the arguments, or evaluates it"""
+        with self.lock:
+            version = self.data_version()
+            if version != self.cache_version:
+                self.cache.clear()
+                self.cache_version = version
+            if arguments in self.cache:
+                time_evaluated, body = self.cache[arguments]
+                if time.time() - time_evaluated < self.cache_ttl:
+                    self.cache.move_to_end(arguments)
+                    return body
+
+        # Evaluated without the lock, so slow queries do not block others
+        time_evaluated = time.time()
+        body = json.dumps(self.evaluate(arguments), default=self.encode).encode()
+        with self.lock:
+            if version == self.cache_version:
+                self.cache[arguments] = (time_evaluated, body)
+                self.cache.move_to_end(arguments)
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return body
+
+    @staticmethod
+    def encode(value: object) -> str:
+        # Times of the records
+        if isinstance(value, datetime):
+            return value.isoformat()
+        raise TypeError(f"Cannot encode {type(value).__name__} as JSON")
+
+    def serve(self, port: int, address: str = "127.0.0.1") -> None:
+        """Serves the statistics at http://<address>:<port> until shutdown"""
+        self.server = http.server.ThreadingHTTPServer(
+            (address, port), StatisticsHandler
+        )
+        self.server.service = self  # type: ignore
+        log.info(f"Serving statistics at http://{address}:{port}")
+        self.server.serve_forever()
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.server_close()
+            self.server = None
+        self.monitor.close()
+        while not self.pool.empty():
+            self.pool.get().close()
@@ -0,0 +1,176 @@
+import logging
+import sys
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from Aggregates import Aggregates
+from Aircraft import Aircraft
+
+log = logging.getLogger(__name__)
+
+
+class FlightTracker:
+    """Tracked (cached) flights, indexed by hex, flight, and registration
+
+    Flights are tracked as compact copies, without the states of the samples.
+    """
+
+    # Identifiers used for looking up candidate flights, in order of preference
+    index_var = ["hex", "flight", "registration"]
+
+    # Memory per tracked flight in bytes, without the identifier strings:
+    # the flight, its aggregates with a float object for each value, the
+    # entries (insertion number and flight) in the deque and index, and the
+    # entry (object id, insertion number, and three pointers) in the sequence
+    flight_size = (
+        sys.getsizeof(Aircraft(states=None))
+        + sys.getsizeof(Aggregates.from_states(None))
+        + sys.getsizeof(Aggregates.from_states(None).values)
+        + len(Aggregates.column_list) * sys.getsizeof(0.0)
+        + (len(index_var) + 1) * (sys.getsizeof((0, None)) + 8)
+        + 2 * sys.getsizeof(2**40)
+        + 3 * 8
+    )
+
+    flights: Deque[Tuple[int, Aircraft]]
+    index: Dict[str, Dict[Optional[str], List[Tuple[int, Aircraft]]]]
+    sequence: Dict[int, int]
+
+    def __init__(self) -> None:
+        # Insertion number and flight, ordered by start time of the flight
+        self.flights = deque()
+        # Insertion number by object id of the tracked flight
+        self.sequence = {}
+        # Insertion number and flight by identifier value (None is a wildcard)
+        self.index = {var: {} for var in self.index_var}
+        self.counter = 0
+        # Memory of all tracked flights in bytes
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.flights)
+
+    def __iter__(self) -> Iterator[Aircraft]:
+        return iter([t for _, t in self.flights])
+
+    def add(self, aircraft: Aircraft) -> Aircraft:
+        """Adds a compact copy of the aircraft and returns the tracked flight"""
+        aircraft = aircraft.compact()
+        self.counter += 1
+        entry = (self.counter, aircraft)
+        time_start = self._time_start(aircraft)
+        if self.flights and self._time_start(self.flights[-1][1]) > time_start:
+            # Rare case of an older flight, e.g., read unsorted from the database
+            pos = len(self.flights)
+            while pos > 0 and self._time_start(self.flights[pos - 1][1]) > time_start:
+                pos -= 1
+            self.flights.insert(pos, entry)
+        else:
+            self.flights.append(entry)
+        self.sequence[id(aircraft)] = self.counter
+        for var in self.index_var:
+            self._index_add(var, aircraft)
+        self.size += self.measure(aircraft)
+        return aircraft
+
+    def expire(self, time_min: float) -> List[Aircraft]:
+        """Removes and returns all flights that started before time_min"""
+        expired = []
+        while self.flights and self._time_start(self.flights[0][1]) < time_min:
+            expired.append(self._remove_oldest())
+        return expired
+
+    def spill(self, size_max: int) -> List[Aircraft]:
+        """Removes and returns the oldest flights until the memory is below size_max"""
+        spilled = []
+        while self.flights and self.size > size_max:
+            spilled.append(self._remove_oldest())
+        return spilled
+
+    @classmethod
+    def measure(cls, aircraft: Aircraft) -> int:
+        """Returns the memory of a tracked flight in bytes
+
+        Identifier strings are counted for each flight, even if shared.
+        """
+        return cls.flight_size + sum(
+            cls._string_size(getattr(aircraft, var)) for var in aircraft.unique_var
+        )
+
+    def find(self, aircraft: Aircraft, time_min: float) -> Optional[Aircraft]:
+        """Returns the most recently added flight identical to the aircraft
+
+        Only flights that started after time_min are considered.
+        Matches the result of checking all tracked flights in reversed order.
+        """
+        for var in self.index_var:
+            value = getattr(aircraft, var)
+            if value is None:
+                continue
+            # Flights with an unknown value are wildcards and always candidates
+            index = self.index[var]
+            candidates = [index.get(value, []), index.get(None, [])]
+            break
+        else:
+            candidates = [sorted(self.flights, key=lambda entry: entry[0])]
+
+        match = None
+        match_seq = 0
+        for entries in candidates:
+            for seq, t in reversed(entries):
+                if seq <= match_seq:
+                    break
+                if self._time_start(t) > time_min and t.is_identical(aircraft):
+                    match, match_seq = t, seq
+                    break
+        return match
+
+    def merge(self, tracked: Aircraft, aircraft: Aircraft) -> bool:
+        """Merges the aircraft into a tracked flight and updates the index
+
+        Returns true if an identifier of the tracked flight has changed.
+        """
+        values = [getattr(tracked, var) for var in tracked.unique_var]
+        tracked.merge(aircraft)
+        changed = False
+        for var, value in zip(tracked.unique_var, values):
+            if getattr(tracked, var) == value:
+                continue
+            changed = True
+            self.size += self._string_size(getattr(tracked, var))
+            self.size -= self._string_size(value)
+            if var in self.index_var:
+                self._index_remove(var, self.sequence[id(tracked)], value)
+                self._index_add(var, tracked)
+        return changed
+
+    def _remove_oldest(self) -> Aircraft:
+        seq, aircraft = self.flights.popleft()
+        del self.sequence[id(aircraft)]
+        for var in self.index_var:
+            self._index_remove(var, seq, getattr(aircraft, var))
+        self.size -= self.measure(aircraft)
+        return aircraft
+
+    @staticmethod
+    def _time_start(aircraft: Aircraft) -> float:
+        if aircraft.time_start is None:  # mypy fix
+            return 0
+        return aircraft.time_start
+
+    @staticmethod
+    def _string_size(value: Optional[str]) -> int:
+        return 0 if value is None else sys.getsizeof(value)
+
+    def _index_add(self, var: str, aircraft: Aircraft) -> None:
+        entries = self.index[var].setdefault(getattr(aircraft, var), [])
+        seq = self.sequence[id(aircraft)]
+        # Keep the entries sorted by insertion number
+        entries.insert(bisect_left(entries, (seq,)), (seq, aircraft))
+
+    def _index_remove(self, var: str, seq: int, value: Optional[str]) -> None:
+        entries = self.index[var][value]
+        del entries[bisect_left(entries, (seq,))]
+        if not entries:
+            del self.index[var][value]
@@ -0,0 +1,90 @@
+import logging
+import math
+from array import array
+from typing import List, Optional
+
+from Metrics import metrics
+
+log = logging.getLogger(__name__)
+
+
+class TrafficSeries:
+    """Traffic per minute in a ring buffer of fixed size
+
+    Each poll adds the aircraft in view, the new flights, the received
+    messages (from the message counter of readsb), and the maximum distance
+    to the receiver to the minute of its timestamp. Complete minutes are
+    flushed to the database, each minute uses the slot of its number modulo
+    the capacity. Unknown message counts and distances are stored as -1 and
+    NaN in the arrays.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        # Start of the minute of each slot, 0 if empty
+        self.times = array("q", [0]) * capacity
+        self.polls = array("q", [0]) * capacity
+        self.aircraft = array("q", [0]) * capacity
+        self.flights = array("q", [0]) * capacity
+        self.messages = array("q", [-1]) * capacity
+        self.distance = array("d", [math.nan]) * capacity
+        # Message counter of the previous poll
+        self.counter: Optional[int] = None
+
+    def record(
+        self,
+        now: float,
+        aircraft: int,
+        flights: int,
+        counter: Optional[int],
+        distance: Optional[float],
+    ) -> None:
+        """Adds the counts of a poll"""
+        minute = int(now // 60)
+        slot = minute % self.capacity
+        if self.times[slot] != minute * 60:
+            if self.times[slot]:
+                log.warning("Traffic buffer is full, dropping the oldest minute")
+                metrics.count("traffic_dropped_total")
+            self.times[slot] = minute * 60
+            self.polls[slot] = 0
+            self.aircraft[slot] = 0
+            self.flights[slot] = 0
+            self.messages[slot] = -1
+            self.distance[slot] = math.nan
+
+        self.polls[slot] += 1
+        self.aircraft[slot] += aircraft
+        self.flights[slot] += flights
+        # Counters decrease when readsb restarts
+        if isinstance(counter, int):
+            if self.counter is not None and counter >= self.counter:
+                self.messages[slot] = (
+                    max(0, self.messages[slot]) + counter - self.counter
+                )
+            self.counter = counter
+        if distance is not None and not distance <= self.distance[slot]:
+            self.distance[slot] = distance
+
+    def flush(self, now: Optional[float] = None) -> List[tuple]:
+        """Removes and returns the rows of all minutes before the minute of now
+
+        All minutes are returned if now is None, e.g., at shutdown.
+        """
+        time_max = math.inf if now is None else int(now // 60) * 60
+        rows = []
+        for slot in range(self.capacity):
+            if not 0 < self.times[slot] < time_max:
+                continue
+            rows.append(
+                (
+                    self.times[slot],
+                    self.polls[slot],
+                    self.aircraft[slot],
+                    self.flights[slot],
+                    None if self.messages[slot] < 0 else self.messages[slot],
+                    None if math.isnan(self.distance[slot]) else self.distance[slot],
+                )
+            )
+            self.times[slot] = 0
+        return sorted(rows)
@@ -0,0 +1,532 @@
+import argparse
+import gzip
+import http.server
+import json
+import numbers
+import os
+import platform
+import random
+import statistics
+import string
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from configparser import ConfigParser
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from ADSBLogger import ADSBLogger
+from Aircraft import Aircraft
+from AircraftMetadata import AircraftMetadata
+from SnapshotGenerator import SnapshotGenerator
+from Sources import loads
+from States import States
+from Tracker import FlightTracker
+
+# Settings for the benchmark runs
+tracked_count = 10000
+current_count = 250
+unique_flight = 3600
+repetitions = 5
+
+# Results of all benchmark runs, in the format of pytest-benchmark
+results: List[dict] = []
+
+
+def random_aircraft(rng: random.Random, time_start: int) -> Aircraft:
+    aircraft = Aircraft()
+    aircraft.hex = f"{rng.randrange(0x1000000):06x}"
+    if rng.random() < 0.8:
+        aircraft.flight = "".join(rng.choices(string.ascii_uppercase, k=3)) + str(
+            rng.randrange(10000)
+        )
+    if rng.random() < 0.7:
+        aircraft.registration = "D-" + "".join(rng.choices(string.ascii_uppercase, k=4))
+    if rng.random() < 0.7:
+        aircraft.ac_type = rng.choice(["A320", "B738", "A20N", "C172", "E190"])
+    aircraft.time_start = time_start
+    aircraft.time_end = time_start
+    return aircraft
+
+
+def copy_identity(aircraft: Aircraft, time_start: int) -> Aircraft:
+    copy = Aircraft()
+    for var in aircraft.unique_var:
+        setattr(copy, var, getattr(aircraft, var))
+    copy.time_start = time_start
+    copy.time_end = time_start
+    return copy
+
+
+def make_flights(seed: int = 0):
+    """Returns tracked flights and current flights (half of them already tracked)"""
+    rng = random.Random(seed)
+    now = 100000
+    tracked = [
+        random_aircraft(rng, now - unique_flight + i * unique_flight // tracked_count)
+        for i in range(tracked_count)
+    ]
+    current = [
+        (
+            copy_identity(rng.choice(tracked), now)
+            if i % 2
+            else random_aircraft(rng, now)
+        )
+        for i in range(current_count)
+    ]
+    return tracked, current, now
+
+
+def merge_linear(tracked: List[Aircraft], current: List[Aircraft], now: int) -> None:
+    # Reference implementation: scan of all tracked flights for each aircraft
+    for c in current:
+        for t in reversed(tracked):
+            if t.time_start > now - unique_flight and t.is_identical(c):  # type: ignore
+                t.merge(c)
+                break
+        else:
+            tracked.append(c)
+
+
+def merge_tracker(tracker: FlightTracker, current: List[Aircraft], now: int) -> None:
+    time_min = now - unique_flight
+    for c in current:
+        t = tracker.find(c, time_min)
+        if t is None:
+            tracker.add(c)
+        else:
+            tracker.merge(t, c)
+
+
+def measure(name: str, setup: Callable, run: Callable) -> float:
+    durations = []
+    for _ in range(repetitions):
+        args = setup()
+        start = time.perf_counter()
+        run(*args)
+        durations.append(time.perf_counter() - start)
+    best = min(durations)
+    print(f"{name:<40} {best * 1000:10.3f} ms")
+    record(name, durations)
+    return best
+
+
+def record(name: str, durations: List[float], **extra_info) -> dict:
+    """Adds the statistics of the durations (in seconds) to the results"""
+    stats: Optional[dict] = None
+    if durations:
+        quantiles = statistics.quantiles(
+            durations * (2 if len(durations) < 2 else 1), n=100, method="inclusive"
+        )
+        stats = {
+            "min": min(durations),
+            "max": max(durations),
+            "mean": statistics.mean(durations),
+            "stddev": statistics.stdev(durations) if len(durations) > 1 else 0.0,
+            "median": statistics.median(durations),
+            "p95": quantiles[94],
+            "p99": quantiles[98],
+            "rounds": len(durations),
+        }
+    result = {"name": name, "stats": stats, "extra_info": extra_info}
+    results.append(result)
+    return result
+
+
+def setup_linear():
+    tracked, current, now = make_flights()
+    return tracked, current, now
+
+
+def setup_tracker():
+    tracked, current, now = make_flights()
+    tracker = FlightTracker()
+    for t in tracked:
+        tracker.add(t)
+    return tracker, current, now
+
+
+def benchmark_merge() -> None:
+    print(f"Merging {current_count} current flights into {tracked_count} tracked:")
+    linear = measure(
+        "Linear scan (previous implementation)", setup_linear, merge_linear
+    )
+    indexed = measure("Indexed flight tracker", setup_tracker, merge_tracker)
+    print(f"Speedup: {linear / indexed:.1f}x")
+
+
+def benchmark_memory() -> None:
+    rng = random.Random(0)
+    data = [
+        {
+            "hex": f"{rng.randrange(0x1000000):06x}",
+            "flight": "DLH" + str(rng.randrange(10000)),
+            "r": "D-" + "".join(rng.choices(string.ascii_uppercase, k=4)),
+            "t": "A320",
+            "alt_baro": rng.randrange(40000),
+            "gs": rng.random() * 500,
+            "rssi": -rng.random() * 30,
+            "r_dst": rng.random() * 200,
+        }
+        for _ in range(tracked_count)
+    ]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracker = FlightTracker()
+    for d in data:
+        aircraft = Aircraft()
+        aircraft.parse_data_dict(d)
+        aircraft.time_start = aircraft.time_end = 100000
+        tracker.add(aircraft)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(s.size_diff for s in after.compare_to(before, "filename"))
+    print(f"Memory per tracked flight: {size / tracked_count:.0f} bytes")
+    record("Memory per tracked flight", [], bytes=size / tracked_count)
+
+
+def parse_reference(body: bytes) -> List[Aircraft]:
+    # Reference implementation: json module and check of each state key
+    ac_list = []
+    for a in json.loads(body)["aircraft"]:
+        aircraft = Aircraft()
+        aircraft.hex = a.get("hex")
+        aircraft.flight = a.get("flight")
+        aircraft.registration = a.get("r")
+        aircraft.ac_type = a.get("t")
+        for s in States.key_list:
+            value = a.get(s)
+            if isinstance(value, numbers.Number):
+                setattr(aircraft.states, s, value)
+        ac_list.append(aircraft)
+    return ac_list
+
+
+def parse_projected(body: bytes) -> List[Aircraft]:
+    return [Aircraft.from_data_dict(a) for a in loads(body)["aircraft"]]
+
+
+def benchmark_decode(aircraft_count: int = 500, rounds: int = 50) -> None:
+    body = json.dumps(SnapshotGenerator(aircraft_count).snapshot()).encode()
+    print(
+        f"Decoding a snapshot of {aircraft_count} aircraft ({len(body) // 1024} kB) "
+        f"with {loads.__module__}:"
+    )
+    parsers = {
+        "Decoding (previous implementation)": parse_reference,
+        "Decoding to aircraft": parse_projected,
+    }
+    for name, parse in parsers.items():
+        durations = []
+        for _ in range(rounds):
+            time_start = time.perf_counter()
+            parse(body)
+            durations.append(time.perf_counter() - time_start)
+
+        # Memory allocated while decoding, and for the resulting aircraft
+        tracemalloc.start()
+        ac_list = parse(body)
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{name:<40} {min(durations) * 1000:10.3f} ms, "
+            f"peak {peak / 1024:.0f} kB, result {size / 1024:.0f} kB"
+        )
+        record(name, durations, bytes=peak)
+
+    assert parse_reference(body) == ac_list
+
+
+def benchmark_metadata(aircraft_count: int = 500000, lookups: int = 10000) -> None:
+    rng = random.Random(0)
+    keys = sorted(rng.sample(range(0x1000000), aircraft_count))
+    print(f"Aircraft index of {aircraft_count} aircraft:")
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "aircraft.csv.gz")
+        with gzip.open(source, "wt", encoding="utf-8") as source_file:
+            for key in keys:
+                registration = "D-" + "".join(rng.choices(string.ascii_uppercase, k=4))
+                source_file.write(f"{key:06x};{registration};A320;00;;;;\n")
+
+        time_start = time.perf_counter()
+        metadata = AircraftMetadata(source, os.path.join(directory, "aircraft.idx"))
+        duration = time.perf_counter() - time_start
+        print(f"{'Building the index':<40} {duration * 1000:10.3f} ms")
+        record("Building the aircraft index", [duration])
+
+        hexes = [f"{k:06x}" for k in rng.choices(keys, k=lookups)]
+        durations = []
+        for _ in range(repetitions):
+            time_start = time.perf_counter()
+            for hex in hexes:
+                metadata.fill(Aircraft(hex))
+            durations.append((time.perf_counter() - time_start) / lookups)
+        print(f"{'Filling an aircraft':<40} {min(durations) * 1e6:10.3f} us")
+        record("Filling an aircraft from the index", durations)
+        metadata.close()
+
+
+class SnapshotHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the latest snapshot like the web server of a receiver"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        body, etag = self.server.snapshot  # type: ignore
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def logger_config(directory: str, url: str) -> ConfigParser:
+    config = ConfigParser()
+    config.read(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings.ini")
+    )
+    config["PATHS"]["database"] = os.path.join(directory, "adsb-logger.db")
+    config["PATHS"]["json"] = url
+    config["PATHS"]["journal"] = os.path.join(directory, "adsb-logger.journal")
+    config["PATHS"]["snapshot"] = os.path.join(directory, "adsb-logger.snapshot")
+    return config
+
+
+def run_logger(args: argparse.Namespace, traced: bool) -> Dict[str, List[float]]:
+    """Drives the logger with generated snapshots, returns durations per stage"""
+    stages: Dict[str, List[float]] = {
+        "fetch_adsb_info": [],
+        "check_records": [],
+        "merge_flights": [],
+        "write_flights (per database write)": [],
+        "write_flights (all tracked, until stored)": [],
+        "read_recent_flights": [],
+        "write_state_snapshot": [],
+        "load_state_snapshot": [],
+    }
+    generator = SnapshotGenerator(args.aircraft, args.churn, args.missing, args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path_json = os.path.join(directory, "aircraft.json")
+        server: Optional[http.server.ThreadingHTTPServer] = None
+        if args.source == "http":
+            server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SnapshotHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}/aircraft.json"
+        else:
+            url = f"file://{path_json}"
+
+        def publish() -> None:
+            body = generator.write(path_json)
+            if server is not None:
+                server.snapshot = (body, f'"{generator.now}"')  # type: ignore
+
+        publish()
+        if traced:
+            tracemalloc.start()
+        logger = ADSBLogger(logger_config(directory, url))
+        for poll in range(args.warmup + args.polls):
+            publish()
+            time_start = time.perf_counter()
+            stale = logger.fetch_adsb_info()
+            time_fetched = time.perf_counter()
+            if stale:
+                continue
+            logger.check_records()
+            time_checked = time.perf_counter()
+            logger.merge_flights()
+            time_merged = time.perf_counter()
+
+            if poll < args.warmup:
+                continue
+            stages["fetch_adsb_info"].append(time_fetched - time_start)
+            stages["check_records"].append(time_checked - time_fetched)
+            stages["merge_flights"].append(time_merged - time_checked)
+
+            # Database writes of the main loop, executed in the background
+            if poll % args.db_write == 0:
+                time_start = time.perf_counter()
+                logger.database.write_records(logger.records)
+                logger.clean_tracked_flights()
+                stages["write_flights (per database write)"].append(
+                    time.perf_counter() - time_start
+                )
+
+        timestamp_min = int(logger.time_json - unique_flight)
+        for _ in range(repetitions):
+            time_start = time.perf_counter()
+            logger.database.write_flights(logger.tracked)
+            logger.database.flush()
+            stages["write_flights (all tracked, until stored)"].append(
+                time.perf_counter() - time_start
+            )
+            time_start = time.perf_counter()
+            logger.database.read_recent_flights(timestamp_min)
+            stages["read_recent_flights"].append(time.perf_counter() - time_start)
+            time_start = time.perf_counter()
+            logger.write_state_snapshot()
+            logger.database.flush()
+            stages["write_state_snapshot"].append(time.perf_counter() - time_start)
+            time_start = time.perf_counter()
+            logger.state_snapshot.load(  # type: ignore
+                logger.database.path, logger.database.schema_version, timestamp_min
+            )
+            stages["load_state_snapshot"].append(time.perf_counter() - time_start)
+
+        if traced:
+            stages["peak_memory"] = [tracemalloc.get_traced_memory()[1]]
+            tracemalloc.stop()
+        # Stores the tracked flights and closes the database
+        del logger
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    return stages
+
+
+def benchmark_logger(args: argparse.Namespace) -> None:
+    print(
+        f"Processing {args.polls} snapshots of {args.aircraft} aircraft "
+        f"from {args.source} source (percentiles in ms):"
+    )
+    stages = run_logger(args, traced=False)
+    print(f"{'Stage':<44} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, durations in stages.items():
+        stats = record(name, durations)["stats"]
+        # E.g., no database writes in a short run
+        if stats is None:
+            print(f"{name:<44} " + " ".join(f"{'n/a':>8}" for _ in range(4)))
+            continue
+        print(
+            f"{name:<44} "
+            + " ".join(
+                f"{stats[k] * 1000:8.3f}" for k in ["median", "p95", "p99", "max"]
+            )
+        )
+
+    # Separate run, as tracing memory allocations slows down the processing
+    peak = run_logger(args, traced=True)["peak_memory"][0]
+    print(f"Peak memory: {peak / 1024 ** 2:.1f} MiB")
+    record("Peak memory", [], bytes=peak)
+
+
+def commit_info() -> dict:
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(
+            ["git", "-C", directory, "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "-C", directory, "status", "--porcelain", "--untracked=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    return {"id": commit, "dirty": dirty}
+
+
+def save_results(path: str, args: argparse.Namespace) -> None:
+    settings = {k: v for k, v in vars(args).items() if k not in ["json", "compare"]}
+    data = {
+        "machine_info": {
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+        },
+        "commit_info": commit_info(),
+        "datetime": datetime.now().isoformat(),
+        "settings": settings,
+        "benchmarks": results,
+    }
+    with open(path, "w", encoding="utf-8") as results_file:
+        json.dump(data, results_file, indent=2)
+    print(f"Saved results to {path}")
+
+
+def compare_results(path: str) -> None:
+    """Prints the change of medians and memory compared to saved results"""
+    with open(path, encoding="utf-8") as results_file:
+        previous = {b["name"]: b for b in json.load(results_file)["benchmarks"]}
+    print(f"Comparison with {path} (median or bytes, previous -> current):")
+    for result in results:
+        before = previous.get(result["name"])
+        if before is None:
+            continue
+        if result["stats"] is not None and before["stats"] is not None:
+            old = before["stats"]["median"] * 1000
+            new = result["stats"]["median"] * 1000
+            unit = "ms"
+        elif "bytes" in result["extra_info"] and "bytes" in before["extra_info"]:
+            old = before["extra_info"]["bytes"]
+            new = result["extra_info"]["bytes"]
+            unit = "B"
+        else:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        print(
+            f"{result['name']:<44} {old:12.3f} -> {new:12.3f} {unit:<2} "
+            f"({change:+.1f} %)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the ADS-B Logger")
+    parser.add_argument(
+        "--only",
+        choices=["merge", "memory", "decode", "metadata", "logger"],
+        action="append",
+        help="run only the given benchmarks",
+    )
+    parser.add_argument("--aircraft", type=int, default=250, help="aircraft count")
+    parser.add_argument(
+        "--churn", type=float, default=0.01, help="share of new aircraft per snapshot"
+    )
+    parser.add_argument(
+        "--missing", type=float, default=0.2, help="share of missing fields"
+    )
+    parser.add_argument("--polls", type=int, default=300, help="measured snapshots")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured snapshots")
+    parser.add_argument(
+        "--db-write", type=int, default=60, help="snapshots between database writes"
+    )
+    parser.add_argument("--source", choices=["file", "http"], default="http")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="save results to a JSON file")
+    parser.add_argument("--compare", help="compare with results from a JSON file")
+    args = parser.parse_args()
+
+    if not args.only or "merge" in args.only:
+        benchmark_merge()
+    if not args.only or "memory" in args.only:
+        benchmark_memory()
+    if not args.only or "decode" in args.only:
+        benchmark_decode()
+    if not args.only or "metadata" in args.only:
+        benchmark_metadata()
+    if not args.only or "logger" in args.only:
+        benchmark_logger(args)
+    if args.json:
+        save_results(args.json, args)
+    if args.compare:
+        compare_results(args.compare)
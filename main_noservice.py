@@ -1,15 +1,16 @@
 import signal
+import threading
 import time
 
 from ADSBLogger import ADSBLogger
 from settings import config, log
 
-terminate = False
+# Set on shutdown, also ends waiting for the next poll
+terminate = threading.Event()
 
 
 def terminate_handler(signal_number, stack_frame):
-    global terminate
-    terminate = True
+    terminate.set()
 
 
 signal.signal(signal.SIGINT, terminate_handler)
@@ -18,9 +19,9 @@ signal.signal(signal.SIGTERM, terminate_handler)
 adsb = ADSBLogger(config)
 log.warning("Not running as service. Press CTRL + C once to shutdown ADS-B Logger.")
 
-while not terminate:
+while not terminate.is_set():
     adsb.loop()
-    time.sleep(config["TIMEOUTS"].getfloat("main_loop"))
+    terminate.wait(adsb.scheduler.delay())
 
 del adsb
 time.sleep(1)
@@ -1,4 +1,5 @@
 import signal
+import threading
 import time
 
 import sdnotify  # type: ignore
@@ -6,12 +7,12 @@ import sdnotify  # type: ignore
 from ADSBLogger import ADSBLogger
 from settings import config
 
-terminate = False
+# Set on shutdown, also ends waiting for the next poll
+terminate = threading.Event()
 
 
 def terminate_handler(signal_number, stack_frame):
-    global terminate
-    terminate = True
+    terminate.set()
 
 
 signal.signal(signal.SIGINT, terminate_handler)
@@ -21,9 +22,9 @@ n = sdnotify.SystemdNotifier()
 adsb = ADSBLogger(config)
 
 n.notify("READY=1")
-while not terminate:
+while not terminate.is_set():
     adsb.loop()
-    time.sleep(config["TIMEOUTS"].getfloat("main_loop"))
+    terminate.wait(adsb.scheduler.delay())
 
 n.notify("STOPPING=1")
 del adsb
@@ -0,0 +1,10 @@
+from Database import Database
+from settings import config
+
+# Load database, pending schema migrations are applied when opening it
+database = Database(config)
+
+# Rebuild daily statistics from all stored flights
+database.rebuild_rollups()
+database.close()
+print("Rebuilt statistics tables of ADS-B Logger database")
@@ -0,0 +1,30 @@
+import argparse
+
+from Database import Database
+from ReplayLogger import replay
+from settings import config, log
+from StateSnapshot import StateSnapshot
+
+# Guard required for the worker processes, which import this file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Stores flights and records of archived aircraft.json files"
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="snapshot files (.json or .gz) or directories"
+    )
+    parser.add_argument(
+        "--processes", type=int, help="number of worker processes (default: CPUs)"
+    )
+    args = parser.parse_args()
+
+    # Load database, pending schema migrations are applied when opening it
+    database = Database(config)
+    count = replay(config, database, args.paths, args.processes)
+    database.close()
+    log.info(f"Stored {count} replayed flights in database")
+
+    # The records of the state snapshot are outdated after the replay
+    path_snapshot = config.get("PATHS", "snapshot", fallback="").strip()
+    if path_snapshot:
+        StateSnapshot(path_snapshot).remove()
@@ -0,0 +1,20 @@
+import signal
+import sys
+
+from settings import config, log
+from StatisticsService import StatisticsService
+
+# Terminate the server like CTRL + C, e.g., when running as service
+signal.signal(signal.SIGTERM, lambda signal_number, stack_frame: sys.exit(0))
+
+# Load database in read-only mode
+service = StatisticsService(config)
+try:
+    service.serve(
+        config.getint("STATISTICS", "port", fallback=8090),
+        config.get("STATISTICS", "address", fallback="127.0.0.1").strip(),
+    )
+except KeyboardInterrupt:
+    log.info("Statistics service terminated")
+finally:
+    service.close()
@@ -19,6 +19,7 @@ database = Database(config, True)
 # Settings for printing the statistics
 table_format = "outline"
 count = 5
+hour_count = 24
 
 print("Evaluating statistics for ADS-B Logger database ...")
 
@@ -64,3 +65,9 @@ if True:
     result = database.evaluate_records()
     table = tabulate(result[1:], headers=result[0], tablefmt=table_format)
     print_table(table, "Record values")
+
+# Table for traffic per hour, e.g., aircraft in view and received messages
+if True:
+    result = database.evaluate_traffic(hour_count)
+    table = tabulate(result[1:], headers=result[0], tablefmt=table_format)
+    print_table(table, "Traffic per hour")
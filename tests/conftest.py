@@ -0,0 +1,48 @@
+import json
+import os
+import pathlib
+from configparser import ConfigParser
+from typing import List
+
+import pytest
+
+settings_path = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "settings.ini"
+)
+
+
+class AircraftFile:
+    """aircraft.json file of readsb, written by the tests"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.url = pathlib.Path(path).as_uri()
+        self.messages = 0
+
+    def write(self, now: float, aircraft: List[dict]) -> None:
+        self.messages += len(aircraft)
+        with open(self.path, "w", encoding="utf-8") as aircraft_file:
+            json.dump(
+                {"now": now, "messages": self.messages, "aircraft": aircraft},
+                aircraft_file,
+            )
+
+
+@pytest.fixture
+def aircraft_file(tmp_path) -> AircraftFile:
+    return AircraftFile(str(tmp_path / "aircraft.json"))
+
+
+@pytest.fixture
+def config(tmp_path, aircraft_file: AircraftFile) -> ConfigParser:
+    """Default settings with all files in the temporary directory"""
+    config = ConfigParser()
+    config.read(settings_path)
+    config["PATHS"]["database"] = str(tmp_path / "adsb-logger.db")
+    config["PATHS"]["json"] = aircraft_file.url
+    config["PATHS"]["journal"] = str(tmp_path / "adsb-logger.journal")
+    config["PATHS"]["snapshot"] = ""
+    config["PATHS"]["aircraft_db"] = ""
+    config["PATHS"]["aircraft_index"] = ""
+    config["METRICS"]["port"] = ""
+    return config
@@ -0,0 +1,71 @@
+import random
+from typing import List, Optional
+
+import pytest
+
+from Aggregates import Aggregates
+from Aircraft import Aircraft
+from States import States
+
+
+def random_states(rng: random.Random) -> States:
+    # Few distinct values, so equal minimum and maximum values are frequent
+    return States(
+        *[rng.choice([None, -2, 0, 0.5, 3, rng.random()]) for _ in States.field_list]
+    )
+
+
+def expected(samples: List[States]) -> List[Optional[float]]:
+    """Returns the aggregates, computed from all samples"""
+    values: List[Optional[float]] = []
+    for s in States.field_list:
+        column = [v for states in samples if (v := getattr(states, s)) is not None]
+        if column:
+            values.extend([min(column), max(column), column[-1], len(column)])
+        else:
+            values.extend([None, None, None, 0])
+    return values
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_aggregates_of_samples(seed: int) -> None:
+    rng = random.Random(seed)
+    samples = [random_states(rng) for _ in range(rng.randrange(1, 30))]
+    aggregates = Aggregates.from_states(samples[0])
+    for states in samples[1:]:
+        aggregates.add(states)
+    assert aggregates.values == expected(samples)
+    assert len(aggregates.values) == len(Aggregates.column_list)
+
+
+def test_aggregates_of_merged_flight() -> None:
+    rng = random.Random(0)
+    samples = [random_states(rng) for _ in range(10)]
+    tracked = Aircraft("3c6444", states=samples[0], time_start=0, time_end=0)
+    for i, states in enumerate(samples[1:]):
+        tracked.merge(Aircraft("3c6444", states=states, time_start=i, time_end=i))
+    assert tracked.aggregates is not None
+    assert tracked.aggregates.values == expected(samples)
+
+    # Compact copies for tracking keep the aggregates, but not the states
+    compact = tracked.compact()
+    assert compact.states is None
+    assert compact.aggregates is tracked.aggregates
+
+
+def test_aggregates_without_samples() -> None:
+    aggregates = Aggregates.from_states(None)
+    assert aggregates.values == expected([])
+    aggregates.add(States(alt_baro=1000))
+    assert aggregates.values[:4] == [1000, 1000, 1000, 1]
+    assert aggregates.values[4:] == expected([])[4:]
+
+
+def test_aggregates_of_row() -> None:
+    aggregates = Aggregates.from_states(States(alt_baro=1000, gs=300))
+    aggregates.add(States(alt_baro=1200))
+    assert Aggregates.from_row(aggregates.row()) == aggregates
+
+    # Rows of flights stored before the aggregates have no values
+    row = [None] * len(Aggregates.column_list)
+    assert Aggregates.from_row(row) == Aggregates.from_states(None)
@@ -0,0 +1,107 @@
+import gzip
+import os
+from configparser import ConfigParser
+
+import pytest
+
+from Aircraft import Aircraft
+from AircraftMetadata import AircraftMetadata, open_metadata
+
+# Lines of the aircraft.csv.gz file of the tar1090-db, not sorted by hex
+source_lines = [
+    "4b1805;HB-JCA;BCS3;00;AIRBUS A220-300;;;",
+    "3c6444;D-AIAB;A321;00;AIRBUS A-321;;;",
+    "invalid line",
+    "xyz;D-XXXX;C172;00;;;;",
+    "1000000;D-YYYY;C172;00;;;;",
+    "3c4b26;D-ABYA;B748;00;BOEING 747-8;;;",
+    "3c0001;;;00;;;;",
+]
+
+# Valid gzip header, but invalid compressed data
+corrupted = gzip.compress(b"")[:10] + b"\xff" * 64
+
+
+def write_source(path: str, lines) -> None:
+    with gzip.open(path, "wt", encoding="utf-8") as source_file:
+        source_file.write("".join(f"{line}\n" for line in lines))
+
+
+@pytest.fixture
+def metadata(tmp_path):
+    source = str(tmp_path / "aircraft.csv.gz")
+    write_source(source, source_lines)
+    metadata = AircraftMetadata(source, str(tmp_path / "aircraft.idx"))
+    yield metadata
+    metadata.close()
+
+
+def identifiers(metadata: AircraftMetadata, hex: str, **known) -> tuple:
+    aircraft = Aircraft(hex, **known)
+    metadata.fill(aircraft)
+    return aircraft.registration, aircraft.ac_type
+
+
+def test_lookup(metadata: AircraftMetadata) -> None:
+    assert metadata.count == 4
+    assert identifiers(metadata, "3c6444") == ("D-AIAB", "A321")
+    assert identifiers(metadata, "4b1805") == ("HB-JCA", "BCS3")
+    assert identifiers(metadata, "3c4b26") == ("D-ABYA", "B748")
+    # Empty values, unknown or non-ICAO addresses
+    assert identifiers(metadata, "3c0001") == (None, None)
+    assert identifiers(metadata, "3c6445") == (None, None)
+    assert identifiers(metadata, "~3c6444") == (None, None)
+    # Values provided by readsb are kept
+    assert identifiers(metadata, "3c6444", registration="D-AIAC") == (
+        "D-AIAC",
+        "A321",
+    )
+
+
+def test_index_reused(metadata: AircraftMetadata) -> None:
+    mtime = os.stat(metadata.path).st_mtime_ns
+    reopened = AircraftMetadata(metadata.source, metadata.path)
+    assert os.stat(metadata.path).st_mtime_ns == mtime
+    assert identifiers(reopened, "3c6444") == ("D-AIAB", "A321")
+
+    # Without the source, the existing index is still used
+    os.remove(metadata.source)
+    reopened = AircraftMetadata(metadata.source, metadata.path)
+    assert identifiers(reopened, "3c6444") == ("D-AIAB", "A321")
+    reopened.close()
+
+
+def refresh(metadata: AircraftMetadata) -> None:
+    metadata.refresh()
+    assert metadata.builder is not None
+    metadata.builder.join()
+    metadata.refresh()
+
+
+def test_rebuild(metadata: AircraftMetadata) -> None:
+    write_source(metadata.source, source_lines + ["3c6445;D-AIAC;A321;00;;;;"])
+    refresh(metadata)
+    assert metadata.count == 5
+    assert identifiers(metadata, "3c6445") == ("D-AIAC", "A321")
+
+    # Unchanged source, no rebuild
+    metadata.refresh()
+    assert metadata.builder is None
+
+
+def test_rebuild_corrupted(metadata: AircraftMetadata, caplog) -> None:
+    with open(metadata.source, "wb") as source_file:
+        source_file.write(corrupted)
+    refresh(metadata)
+    assert "Could not build aircraft index" in caplog.text
+    assert identifiers(metadata, "3c6444") == ("D-AIAB", "A321")
+
+
+@pytest.mark.parametrize("data", [b"no gzip", corrupted])
+def test_open_corrupted(tmp_path, data: bytes) -> None:
+    source = str(tmp_path / "aircraft.csv.gz")
+    with open(source, "wb") as source_file:
+        source_file.write(data)
+    config = ConfigParser()
+    config.read_dict({"PATHS": {"aircraft_db": source, "aircraft_index": ""}})
+    assert open_metadata(config) is None
@@ -0,0 +1,79 @@
+from configparser import ConfigParser
+from typing import Iterator, List
+
+import pytest
+
+from Aircraft import Aircraft
+from Database import Database
+
+# Start of a local day, statistics of shorter ranges are read from the flights
+time_start = 1700000000
+
+
+@pytest.fixture
+def database(tmp_path) -> Iterator[Database]:
+    config = ConfigParser()
+    config.read_dict({"PATHS": {"database": str(tmp_path / "adsb-logger.db")}})
+    database = Database(config)
+    flights = []
+    for i in range(100):
+        aircraft = Aircraft(f"{i:06x}", f"DLH{i % 7}", f"D-A{i % 13:03d}", "A320")
+        aircraft.time_start = aircraft.time_end = time_start + 60 * i
+        flights.append(aircraft)
+    database.write_flights(flights)
+    database.flush()
+    yield database
+    database.close()
+
+
+def query_plans(database: Database, evaluate) -> List[List[str]]:
+    """Returns the query plans of the statements on flights of the evaluation"""
+    statements: List[str] = []
+    database.db_connection.set_trace_callback(statements.append)
+    evaluate()
+    database.db_connection.set_trace_callback(None)
+    return [
+        [row[3] for row in database.db_cursor.execute(f"EXPLAIN QUERY PLAN {s}")]
+        for s in statements
+        if s.lstrip().upper().startswith("SELECT") and ".aircraft" in s
+    ]
+
+
+def assert_indexed(plans: List[List[str]]) -> None:
+    assert plans
+    for plan in plans:
+        # Searches or scans of an index instead of the table of flights
+        steps = [
+            s
+            for s in plan
+            if s.startswith(("SCAN", "SEARCH"))
+            and s.split()[1].split(".")[-1] == "aircraft"
+        ]
+        assert steps, plan
+        assert all("INDEX aircraft_" in s for s in steps), plan
+
+
+def test_counts_use_time_index(database: Database) -> None:
+    plans = query_plans(
+        database,
+        lambda: database.evaluate_counts(time_start + 600, time_start + 3600),
+    )
+    assert_indexed(plans)
+    assert all(any("aircraft_time" in s for s in plan) for plan in plans)
+
+
+@pytest.mark.parametrize("key", ["flight", "registration", "type", "airline"])
+def test_top_flights_use_indexes(database: Database, key: str) -> None:
+    plans = query_plans(
+        database,
+        lambda: database.query_flights(key, 5, time_start + 600, time_start + 3600),
+    )
+    assert_indexed(plans)
+
+
+def test_recent_flights_use_time_index(database: Database) -> None:
+    plans = query_plans(
+        database, lambda: database.read_recent_flights(time_start + 3000)
+    )
+    assert_indexed(plans)
+    assert all(any("aircraft_time" in s for s in plan) for plan in plans)
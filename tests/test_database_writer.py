@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+
+from DatabaseWriter import DatabaseWriter, Job
+
+
+def execute(command: str, *args) -> Job:
+    def job(connection: sqlite3.Connection) -> None:
+        connection.execute(command, args)
+
+    return job
+
+
+def insert(value) -> Job:
+    return execute("INSERT INTO test (value) VALUES (?)", value)
+
+
+def values(path) -> list:
+    with sqlite3.connect(path) as connection:
+        return [r[0] for r in connection.execute("SELECT value FROM test")]
+
+
+def test_errors_do_not_stop_writer(tmp_path) -> None:
+    path = str(tmp_path / "test.db")
+    writer = DatabaseWriter(path)
+    writer.submit(execute("CREATE TABLE test (value)"))
+    writer.submit(insert(1))
+    # E.g., a malformed row
+    writer.submit(insert(object()))
+    writer.submit(lambda connection: None.execute())  # type: ignore
+    writer.submit(insert(2))
+    writer.flush()
+    assert writer.alive
+    writer.close()
+    assert values(path) == [1, 2]
+
+
+def test_backlog_is_bounded(tmp_path) -> None:
+    path = str(tmp_path / "test.db")
+    writer = DatabaseWriter(path, queue_size=2)
+    writer.submit(execute("CREATE TABLE test (value)"))
+    writer.flush()
+
+    # Writes are blocked until the event is set
+    started = threading.Event()
+    event = threading.Event()
+
+    def wait(connection: sqlite3.Connection) -> None:
+        started.set()
+        event.wait(10)
+
+    writer.submit(wait)
+    assert started.wait(10)
+    for i in range(4):
+        writer.submit(insert(i))
+    assert writer.queue.full()
+    assert len(writer.backlog) == writer.backlog_size
+
+    # Submitting blocks once the backlog is full, until the writes continue
+    submitter = threading.Thread(target=writer.submit, args=(insert(4),))
+    submitter.start()
+    submitter.join(0.1)
+    assert submitter.is_alive()
+    assert len(writer.backlog) == writer.backlog_size + 1
+    event.set()
+    submitter.join(10)
+    assert not submitter.is_alive()
+    for i in range(5, 10):
+        writer.submit(insert(i))
+        assert len(writer.backlog) <= writer.backlog_size + 1
+    writer.close()
+    assert values(path) == list(range(10))
+
+
+def test_flush_returns_after_writer_stopped(tmp_path) -> None:
+    writer = DatabaseWriter(str(tmp_path / "test.db"))
+    writer.submit(execute("SELECT 1"))
+    writer.flush()
+    # Stop the writer thread without executing the queued job
+    writer.put(None)
+    writer.thread.join()  # type: ignore
+    writer.queue.put(insert(1))
+    writer.flush()
+    writer.close()
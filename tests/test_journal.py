@@ -0,0 +1,110 @@
+import gc
+import sqlite3
+from configparser import ConfigParser
+from typing import Dict
+
+import pytest
+
+from ADSBLogger import ADSBLogger
+from Database import Database
+from FlightJournal import FlightJournal
+
+time_start = 1700000000.0
+
+
+def poll(logger: ADSBLogger, aircraft_file, now: float, altitude: int) -> None:
+    aircraft_file.write(
+        now,
+        [
+            {"hex": "3c6444", "flight": "DLH1", "alt_baro": altitude},
+            {"hex": "4b1805", "flight": "SWR2", "alt_baro": altitude + 100},
+        ],
+    )
+    logger.loop()
+
+
+class CrashedLogger(ADSBLogger):
+    def __del__(self) -> None:
+        pass
+
+
+def crash(logger: ADSBLogger) -> None:
+    """Stops the logger without storing the tracked flights"""
+    assert logger.journal is not None
+    logger.journal.flush()
+    logger.database.close()
+    logger.__class__ = CrashedLogger
+
+
+def stored_flights(config: ConfigParser) -> Dict[str, int]:
+    """Returns the number of altitude samples of the stored flights by hex"""
+    with sqlite3.connect(config["PATHS"]["database"]) as connection:
+        return dict(connection.execute("SELECT hex, alt_baro_count FROM aircraft"))
+
+
+def test_restart_after_crash(config, aircraft_file) -> None:
+    logger = ADSBLogger(config)
+    for i in range(3):
+        poll(logger, aircraft_file, time_start + i, 1000 + i)
+    crash(logger)
+    del logger
+    gc.collect()
+    assert stored_flights(config) == {}
+
+    # The journal holds the aggregates of the flights when they were journaled
+    logger = ADSBLogger(config)
+    assert stored_flights(config) == {"3c6444": 1, "4b1805": 1}
+    assert FlightJournal(config["PATHS"]["journal"]).segments() == []
+    assert len(logger.tracked) == 2
+    del logger
+    gc.collect()
+
+
+def test_journal_kept_if_write_fails(config, aircraft_file, monkeypatch) -> None:
+    logger = ADSBLogger(config)
+    poll(logger, aircraft_file, time_start, 1000)
+    crash(logger)
+    del logger
+    gc.collect()
+
+    # E.g., a locked or full database
+    monkeypatch.setattr(Database, "flight_insert", "INSERT INTO missing VALUES (?)")
+    logger = ADSBLogger(config)
+    del logger
+    gc.collect()
+    assert stored_flights(config) == {}
+    assert FlightJournal(config["PATHS"]["journal"]).segments() != []
+
+    monkeypatch.undo()
+    logger = ADSBLogger(config)
+    assert stored_flights(config) == {"3c6444": 1, "4b1805": 1}
+    del logger
+    gc.collect()
+    assert FlightJournal(config["PATHS"]["journal"]).segments() == []
+
+
+@pytest.mark.parametrize("fails", [False, True])
+def test_segment_removed_after_write(config, aircraft_file, monkeypatch, fails) -> None:
+    logger = ADSBLogger(config)
+    poll(logger, aircraft_file, time_start, 1000)
+    assert logger.journal is not None
+
+    # Expire the tracked flights
+    if fails:
+        monkeypatch.setattr(Database, "flight_insert", "INSERT INTO missing VALUES (?)")
+    logger.time_json += config.getfloat("TIMEOUTS", "unique_flight") + 1
+    logger.clean_tracked_flights()
+    logger.database.flush()
+    assert len(logger.tracked) == 0
+    # The new segment is empty, without tracked flights
+    assert bool(logger.journal.segments()) is fails
+    crash(logger)
+    del logger
+    gc.collect()
+    monkeypatch.undo()
+
+    # Flights of a kept segment are stored at the next start
+    logger = ADSBLogger(config)
+    assert stored_flights(config) == {"3c6444": 1, "4b1805": 1}
+    del logger
+    gc.collect()
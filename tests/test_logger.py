@@ -0,0 +1,121 @@
+import gc
+import random
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from ADSBLogger import ADSBLogger
+from Aircraft import Aircraft
+from Record import Record
+from States import States
+
+time_start = 1700000000.0
+
+
+class UpdateSource:
+    """Source with the updates of a stream, which contain only changed aircraft"""
+
+    complete = False
+
+    def __init__(self) -> None:
+        self.updates: List[dict] = []
+
+    def close(self) -> None:
+        pass
+
+    def fetch(self) -> dict:
+        return self.updates.pop(0)
+
+
+def aircraft(*hexes: str) -> List[dict]:
+    return [{"hex": hex, "alt_baro": 1000} for hex in hexes]
+
+
+def test_count_of_snapshot(config, aircraft_file) -> None:
+    logger = ADSBLogger(config)
+    aircraft_file.write(time_start, aircraft("3c6444", "4b1805", "4400ab"))
+    logger.loop()
+    assert logger.current_count == 3
+
+    # Aircraft missing in the next snapshot are no longer seen
+    aircraft_file.write(time_start + 1, aircraft("4b1805"))
+    logger.loop()
+    assert logger.current_count == 1
+    assert list(logger.visible) == ["4b1805"]
+    del logger
+    gc.collect()
+
+
+def test_count_of_stream(config) -> None:
+    logger = ADSBLogger(config)
+    logger.source.close()
+    source = logger.source = UpdateSource()
+    source.updates.append({"now": time_start, "aircraft": aircraft("3c6444", "4b1805")})
+    logger.loop()
+    assert logger.current_count == 2
+
+    # Aircraft without updates are seen until the timeout
+    timeout = config.getfloat("TIMEOUTS", "visible")
+    source.updates.append({"now": time_start + 1, "aircraft": aircraft("4400ab")})
+    logger.loop()
+    assert logger.current_count == 3
+    source.updates.append({"now": time_start + timeout, "aircraft": aircraft("4b1805")})
+    logger.loop()
+    assert logger.current_count == 3
+    source.updates.append({"now": time_start + timeout + 2, "aircraft": []})
+    logger.loop()
+    assert sorted(logger.visible) == ["4b1805"]
+    del logger, source
+    gc.collect()
+
+
+def record_values(records: List[Record]) -> Dict[Tuple, Tuple]:
+    """Returns the value and hex of each record by key and max/min"""
+    values: Dict[Tuple, Tuple] = {}
+    for r in records:
+        assert r.aircraft is not None
+        values[(r.record_key, r.is_max)] = (
+            getattr(r.aircraft.states, r.record_key),
+            r.aircraft.hex,
+        )
+    return values
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_records_match_nested_loop(config, seed: int) -> None:
+    rng = random.Random(seed)
+    logger = ADSBLogger(config)
+    reference = []
+    for r in logger.records:
+        record = Record()
+        record.record_key = r.record_key
+        record.is_max = r.is_max
+        reference.append(record)
+
+    def value() -> Optional[float]:
+        # Zero and equal values of several aircraft are frequent
+        return rng.choice([None, 0, 0.0, -1, 1, rng.randint(-3, 3), rng.random()])
+
+    for i in range(50):
+        current = []
+        for n in range(rng.randrange(6)):
+            aircraft = Aircraft(
+                f"{i:04x}{n:02x}", states=States(*[value() for _ in States.field_list])
+            )
+            aircraft.time_start = aircraft.time_end = int(time_start) + i
+            current.append(aircraft)
+
+        # Previous implementation: each aircraft compared with each record
+        for c in current:
+            for r in reference:
+                if r.compare_aircraft(c):
+                    r.assign_aircraft(c)
+
+        logger.time_json = int(time_start) + i
+        logger.current = current
+        logger.check_records()
+        for r, c in logger.new_records:
+            r.assign_aircraft(c)
+        assert record_values(logger.records) == record_values(reference)
+    del logger
+    gc.collect()
@@ -0,0 +1,98 @@
+import os
+import random
+from configparser import ConfigParser
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+import pytest
+
+from Aircraft import Aircraft
+from Database import Database
+
+# Local midnight at the start of a month
+month_start = datetime(2024, 3, 1)
+
+
+def random_flights(count: int) -> List[Aircraft]:
+    """Returns flights of the days around the start of the month and of today"""
+    random.seed(20)
+    now = datetime.now()
+    flights = []
+    for _ in range(count):
+        aircraft = Aircraft(
+            f"{random.randrange(40):06x}",
+            random.choice(["DLH1", "BAW3", "SWR4", "DABCD", None]),
+            random.choice(["D-AIBA", "D-ABCD", "G-EUPT", None]),
+            random.choice(["A320", "B738", None]),
+        )
+        day = random.choice([month_start, now])
+        aircraft.time_start = int(
+            datetime.timestamp(day + timedelta(hours=random.uniform(-72, 72)))
+        )
+        if aircraft.time_start < datetime.timestamp(now):
+            flights.append(aircraft)
+    return flights
+
+
+def open_database(path: str, partitioned: bool) -> Database:
+    config = ConfigParser()
+    config.read_dict(
+        {"PATHS": {"database": path}, "DATABASE": {"partitioned": str(partitioned)}}
+    )
+    return Database(config)
+
+
+@pytest.fixture(scope="module")
+def databases(tmp_path_factory) -> Iterator[Dict[bool, Database]]:
+    tmp_path = tmp_path_factory.mktemp("partitions")
+    flights = random_flights(500)
+    databases = {}
+    for partitioned in [False, True]:
+        database = open_database(str(tmp_path / f"{partitioned}.db"), partitioned)
+        database.write_flights(flights)
+        # Replaced flights are counted once
+        database.write_flights(flights[:100])
+        database.flush()
+        databases[partitioned] = database
+    yield databases
+    for database in databases.values():
+        database.close()
+
+
+def test_flights_in_monthly_partitions(databases: Dict[bool, Database]) -> None:
+    database = databases[True]
+    names = {"2024-02", "2024-03", datetime.now().strftime("%Y-%m")}
+    assert names <= set(database.partitions())
+    for name in database.partitions():
+        assert os.path.exists(database.partition_path(name))
+    count = database.db_cursor.execute("SELECT COUNT(*) FROM aircraft").fetchone()
+    assert count[0] == 0
+
+
+ranges = [
+    (0, 0),
+    # Days before and after the start of the month, and across it
+    (month_start.timestamp() - 24 * 3600, month_start.timestamp()),
+    (month_start.timestamp(), month_start.timestamp() + 24 * 3600),
+    (month_start.timestamp() - 36 * 3600, month_start.timestamp() + 36 * 3600),
+    (month_start.timestamp() + 3600, 0),
+]
+
+
+@pytest.mark.parametrize("timestamp_min, timestamp_max", ranges)
+def test_counts_match(databases, timestamp_min, timestamp_max) -> None:
+    assert databases[False].evaluate_counts(timestamp_min, timestamp_max) == databases[
+        True
+    ].evaluate_counts(timestamp_min, timestamp_max)
+
+
+@pytest.mark.parametrize("timestamp_min, timestamp_max", ranges)
+@pytest.mark.parametrize("key", ["flight", "registration", "type", "airline"])
+def test_flights_match(databases, key, timestamp_min, timestamp_max) -> None:
+    assert databases[False].evaluate_flights(
+        key, 10, timestamp_min, timestamp_max
+    ) == databases[True].evaluate_flights(key, 10, timestamp_min, timestamp_max)
+
+
+def test_days_match(databases: Dict[bool, Database]) -> None:
+    assert databases[False].evaluate_days(5) == databases[True].evaluate_days(5)
@@ -0,0 +1,128 @@
+import gzip
+import json
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import pytest
+
+from Database import Database
+from ReplayLogger import day_partitions, replay
+from Sources import ReplaySource
+
+# Local time, as the replay is partitioned by local days
+midnight = datetime(2024, 3, 2).timestamp()
+
+
+def snapshot(now: float) -> dict:
+    """Returns the snapshot of readsb with the aircraft seen at the time
+
+    DLH1 flies across midnight, SWR2 only after midnight, and AUA3 one day later.
+    """
+    aircraft = []
+    if midnight - 1800 <= now < midnight + 1800:
+        altitude = 1000 + (now - midnight + 1800) * 10
+        aircraft.append({"hex": "3c6444", "flight": "DLH1", "alt_baro": altitude})
+    if midnight + 600 <= now < midnight + 3600:
+        altitude = 40000 - (now - midnight - 600) * 10
+        aircraft.append({"hex": "4b1805", "flight": "SWR2", "alt_baro": altitude})
+    if now >= midnight + 86400:
+        aircraft.append({"hex": "4400ab", "flight": "AUA3", "alt_baro": 500})
+    return {"now": now, "aircraft": aircraft}
+
+
+def snapshot_times() -> List[float]:
+    return [midnight - 1800 + i * 30 for i in range(180)] + [
+        midnight + 86400 + 43200 + i * 30 for i in range(3)
+    ]
+
+
+def write_files(directory: str) -> List[str]:
+    """Writes the snapshots as chunks of tar1090 (gzip) and as single files
+
+    Each chunk has every other snapshot of 10 minutes, so the files overlap.
+    """
+    paths = []
+    times = snapshot_times()
+    for i in range(0, len(times), 20):
+        chunk, single = times[i:][:20:2], times[i:][1:20:2]
+        path = os.path.join(directory, f"chunk_{i}.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as chunk_file:
+            json.dump({"files": [snapshot(t) for t in chunk]}, chunk_file)
+        paths.append(path)
+        for t in single:
+            path = os.path.join(directory, f"{t:.0f}.json")
+            with open(path, "w", encoding="utf-8") as snapshot_file:
+                json.dump(snapshot(t), snapshot_file)
+            paths.append(path)
+    return paths
+
+
+def test_snapshots_in_order(tmp_path) -> None:
+    ranges = sorted(
+        r for r in map(ReplaySource.time_range, write_files(str(tmp_path))) if r
+    )
+    assert ranges[0] == (midnight - 1800, midnight - 1800 + 540, ranges[0][2])
+
+    source = ReplaySource([(first, path) for first, _, path in ranges], 0, midnight)
+    times = []
+    while not source.done:
+        data = source.fetch()
+        if data is not None:
+            times.append(data["now"])
+    assert times == [t for t in snapshot_times() if t < midnight]
+
+
+def test_day_partitions() -> None:
+    partitions = day_partitions(midnight - 1800, midnight + 86400)
+    assert [begin for begin, _ in partitions] == [
+        datetime(2024, 3, d).timestamp() for d in [1, 2, 3]
+    ]
+    assert all(end == begin for (_, end), (begin, _) in zip(partitions, partitions[1:]))
+
+
+@pytest.fixture
+def replayed(config, tmp_path) -> Tuple[int, Database]:
+    os.mkdir(tmp_path / "snapshots")
+    write_files(str(tmp_path / "snapshots"))
+    database = Database(config)
+    count = replay(config, database, [str(tmp_path / "snapshots")], 2)
+    return count, database
+
+
+def test_flights_of_days(config, replayed) -> None:
+    count, database = replayed
+    database.close()
+    with sqlite3.connect(config["PATHS"]["database"]) as connection:
+        flights: Dict[str, Tuple] = {
+            r[0]: r[1:]
+            for r in connection.execute(
+                "SELECT flight, time, alt_baro_count FROM aircraft"
+            )
+        }
+
+    # The flight across midnight is stored once, by the day of its start,
+    # with the samples of that day
+    assert count == 3
+    assert flights == {
+        "DLH1": (midnight - 1800, 60),
+        "SWR2": (midnight + 600, 100),
+        "AUA3": (midnight + 86400 + 43200, 3),
+    }
+
+
+def test_records_of_days(replayed) -> None:
+    _, database = replayed
+    records = {(r.record_key, r.is_max): r for r in database.read_records()}
+    database.close()
+
+    # Best records of all days, not of the last completed day
+    best = records[("alt_baro", True)]
+    assert best.aircraft is not None
+    assert (best.aircraft.flight, best.aircraft.states.alt_baro) == ("SWR2", 40000)
+    assert best.timestamp == midnight + 600
+    best = records[("alt_baro", False)]
+    assert best.aircraft is not None
+    assert (best.aircraft.flight, best.aircraft.states.alt_baro) == ("AUA3", 500)
+    assert best.timestamp == midnight + 86400 + 43200
@@ -0,0 +1,186 @@
+import random
+import sqlite3
+from configparser import ConfigParser
+from datetime import datetime, time
+from typing import Iterator, List
+
+import pytest
+
+from Database import Database
+
+# Statistics queries of the aircraft table before the rollup tables
+baseline_counts = [
+    "COUNT(id)",
+    "COUNT(DISTINCT hex)",
+    "COUNT(DISTINCT flight)",
+    "COUNT(DISTINCT type)",
+]
+baseline_flights = {
+    "flight": (
+        "SELECT flight, COUNT(flight) FROM aircraft "
+        "GROUP BY flight "
+        "ORDER BY COUNT(flight) DESC"
+    ),
+    "registration": (
+        "SELECT registration, COUNT(registration) FROM aircraft "
+        "GROUP BY registration "
+        "ORDER BY COUNT(registration) DESC"
+    ),
+    "type": (
+        "SELECT type, COUNT(type) FROM aircraft "
+        "GROUP BY type "
+        "ORDER BY COUNT(type) DESC"
+    ),
+    "airline": (
+        "SELECT substr(flight, 1, 3) as airline, COUNT(flight) as count, "
+        "REPLACE(registration,'-','') as registration_short, "
+        "REPLACE(flight,' ','') as flight_short FROM aircraft "
+        "WHERE registration_short is not NULL "
+        "AND registration_short is not flight_short "
+        "GROUP BY airline "
+        "ORDER BY count DESC"
+    ),
+}
+
+flight_insert = (
+    "REPLACE INTO aircraft (id, time, date, hex, registration, type, flight) "
+    "VALUES (?, ?, '', ?, ?, ?, ?)"
+)
+
+
+def random_rows(count: int, now: float, ids: List[str]) -> List[tuple]:
+    """Returns flights of the last days, replacing the flights of the ids"""
+    rows = []
+    for i in range(count):
+        registration = random.choice(["D-AIBA", "D-ABCD", "G-EUPT", "HBJCA", None])
+        flight = random.choice(
+            ["DLH1  ", "DLH2", "BAW3", "SWR4", "DABCD", "HBJCA", None]
+        )
+        row_id = ids[i] if i < len(ids) else f"{now}_{len(ids) + i}"
+        rows.append(
+            (
+                row_id,
+                int(now - random.uniform(0, 4 * 24 * 3600)),
+                f"{random.randrange(40):06x}",
+                registration,
+                random.choice(["A320", "B738", "E190", None]),
+                flight,
+            )
+        )
+    return rows
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch) -> Iterator[Database]:
+    random.seed(12)
+    now = datetime.timestamp(datetime.now())
+    config = ConfigParser()
+    config.read_dict({"PATHS": {"database": str(tmp_path / "adsb-logger.db")}})
+
+    # Database of the baseline, without migrations
+    with monkeypatch.context() as patch:
+        patch.setattr(Database, "migrations", [])
+        database = Database(config)
+        database.close()
+    rows = random_rows(300, now, [])
+    with sqlite3.connect(config["PATHS"]["database"]) as connection:
+        connection.executemany(flight_insert, rows)
+
+    # Migrated database, and replaced flights with other values of the keys
+    database = Database(config)
+    replaced = random_rows(200, now, [r[0] for r in random.sample(rows, 150)])
+    database.submit(lambda connection: connection.executemany(flight_insert, replaced))
+    database.flush()
+    yield database
+    database.close()
+
+
+def sorted_rows(statistics: List[List[str]]) -> List[tuple]:
+    # The order of equal counts is not defined
+    return sorted((tuple(r) for r in statistics), key=lambda r: (-r[1], str(r[0])))
+
+
+def test_days_match_baseline(database: Database) -> None:
+    def counts(timestamp_min: float, timestamp_max: float) -> list:
+        return list(
+            database.db_cursor.execute(
+                f"SELECT {', '.join(baseline_counts)} FROM aircraft "
+                f"WHERE time >= ? AND time < ?",
+                (timestamp_min, timestamp_max),
+            ).fetchone()
+        )
+
+    statistics = database.evaluate_days(5)
+    now = datetime.now()
+    assert statistics[1][1:] == counts(0, datetime.timestamp(now))
+    timestamp_min = datetime.timestamp(datetime.combine(now, time.min))
+    timestamp_max = datetime.timestamp(datetime.combine(now, time.max))
+    for day in range(5):
+        assert statistics[day + 2][1:] == counts(timestamp_min, timestamp_max)
+        timestamp_min -= 24 * 3600
+        timestamp_max -= 24 * 3600
+    # The rollup tables are used
+    assert (
+        statistics[1][1]
+        == database.db_cursor.execute(
+            "SELECT entries FROM rollup_days WHERE day = '*'"
+        ).fetchone()[0]
+    )
+
+
+@pytest.mark.parametrize("key", ["flight", "registration", "type", "airline"])
+def test_flights_match_baseline(database: Database, key: str) -> None:
+    baseline = [[r[0], r[1]] for r in database.db_cursor.execute(baseline_flights[key])]
+    statistics = database.evaluate_flights(key, 100)
+    assert sorted_rows(statistics[1:]) == sorted_rows(baseline)
+
+    # Only the order of equal counts may differ in the top flights
+    statistics = database.evaluate_flights(key, 5)
+    assert [r[1] for r in statistics[1:]] == [r[1] for r in baseline[:5]]
+
+
+def test_counters_match_flights(database: Database) -> None:
+    cursor = database.db_cursor
+    day = "date(time, 'unixepoch', 'localtime')"
+    days = cursor.execute(
+        f"SELECT {day}, COUNT(*) FROM aircraft GROUP BY 1 "
+        f"UNION ALL SELECT '*', COUNT(*) FROM aircraft"
+    ).fetchall()
+    assert sorted(cursor.execute("SELECT * FROM rollup_days")) == sorted(days)
+
+    values = []
+    for key, (value, condition) in database.rollup_keys.items():
+        value = value.format(row="aircraft")
+        condition = condition.format(row="aircraft")
+        for day_value in [day, "'*'"]:
+            values += cursor.execute(
+                f"SELECT {day_value}, '{key}', {value}, COUNT(*) FROM aircraft "
+                f"WHERE {condition} GROUP BY 1, 3"
+            ).fetchall()
+    assert sorted(cursor.execute("SELECT * FROM rollup_values")) == sorted(values)
+
+
+def test_cache_invalidated_by_writes(database: Database, monkeypatch) -> None:
+    queries = []
+    query_flights = database.query_flights
+
+    def query(*args) -> List[List[str]]:
+        queries.append(args)
+        return query_flights(*args)
+
+    monkeypatch.setattr(database, "query_flights", query)
+    statistics = database.evaluate_flights("flight", 3)
+    assert database.evaluate_flights("flight", 3) == statistics
+    assert len(queries) == 1
+
+    # Write of the logger, with another connection
+    now = int(datetime.timestamp(datetime.now())) - 60
+    with sqlite3.connect(database.path) as connection:
+        connection.execute("PRAGMA recursive_triggers = ON")
+        connection.executemany(
+            flight_insert,
+            [(f"{now}_{i}", now, f"{i:06x}", None, None, "NEW1") for i in range(100)],
+        )
+    statistics = database.evaluate_flights("flight", 3)
+    assert len(queries) == 2
+    assert statistics[1] == ["NEW1", 100]
@@ -0,0 +1,331 @@
+import base64
+import http.server
+import json
+import socket
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+
+import pytest
+
+from Sources import HTTPSource, MultiSource, StreamSource, open_source
+
+
+class StreamServer:
+    """Local stand-in for the JSON network port of readsb"""
+
+    def __init__(self) -> None:
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.connections: List[socket.socket] = []
+        self.accepted = threading.Event()
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self) -> None:
+        connection, _ = self.server.accept()
+        self.connections.append(connection)
+        self.accepted.set()
+
+    def send(self, data: bytes) -> None:
+        self.accepted.wait(5)
+        self.connections[-1].sendall(data)
+        # The source does not wait for data, so allow for the delivery
+        time.sleep(0.1)
+
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.close()
+        self.server.close()
+
+
+def line(hex: str, now: float, **fields) -> bytes:
+    return json.dumps({"hex": hex, "now": now, **fields}).encode() + b"\n"
+
+
+@pytest.fixture
+def server() -> Iterator[StreamServer]:
+    server = StreamServer()
+    yield server
+    server.close()
+
+
+def test_fetch_combines_updates(server: StreamServer) -> None:
+    source = StreamSource("127.0.0.1", server.port, 5)
+    assert source.fetch() is None
+
+    server.send(
+        line("3c6444", 100.0, alt_baro=1000)
+        + line("4b1805", 100.5)
+        + line("3c6444", 101.0, alt_baro=2000)
+        + b'{"hex": "440'
+    )
+    data = source.fetch()
+    assert data is not None
+    assert data["now"] == 101.0
+    aircraft = {a["hex"]: a for a in data["aircraft"]}
+    assert aircraft.keys() == {"3c6444", "4b1805"}
+    assert aircraft["3c6444"]["alt_baro"] == 2000
+
+    # The incomplete line is completed by the next update
+    server.send(b'0ab", "now": 102.0}\n')
+    data = source.fetch()
+    assert data is not None
+    assert [a["hex"] for a in data["aircraft"]] == ["4400ab"]
+    source.close()
+
+
+def test_fetch_lines_before_close(server: StreamServer) -> None:
+    source = StreamSource("127.0.0.1", server.port, 5)
+    source.fetch()
+
+    # The receiver sends its last lines and closes before the next fetch
+    server.send(line("3c6444", 100.0) + line("4b1805", 100.5))
+    server.connections[-1].close()
+    time.sleep(0.1)
+    data = source.fetch()
+    assert data is not None
+    assert sorted(a["hex"] for a in data["aircraft"]) == ["3c6444", "4b1805"]
+
+    with pytest.raises(ConnectionError):
+        source.fetch()
+    source.close()
+
+
+def test_fetch_unknown_host() -> None:
+    # Reserved top-level domain, never resolved
+    source = StreamSource("receiver.invalid", 30152, 1)
+    with pytest.raises(URLError):
+        source.fetch()
+    source.close()
+
+
+def test_fetch_connection_refused() -> None:
+    # Port of a closed server, the error is handled like a closed stream
+    server = socket.create_server(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+    server.close()
+    source = StreamSource("127.0.0.1", port, 1)
+    with pytest.raises(ConnectionError):
+        source.fetch()
+    source.close()
+
+
+class ReceiverServer(http.server.ThreadingHTTPServer):
+    """Local stand-in for the web server of a receiver with aircraft.json"""
+
+    # Persistent connections of the clients do not delay closing
+    daemon_threads = True
+
+    def __init__(self, snapshot: dict) -> None:
+        super().__init__(("127.0.0.1", 0), ReceiverHandler)
+        self.body = json.dumps(snapshot).encode()
+        self.base = f"http://127.0.0.1:{self.server_address[1]}"
+        self.url = f"{self.base}/data/aircraft.json"
+        # Responses of other paths with status and location
+        self.redirects: Dict[str, Tuple[int, str]] = {}
+        # Expected header for basic authentication, if required
+        self.authorization: Optional[str] = None
+        # Paths and authorization headers of all requests
+        self.requests: List[Tuple[str, Optional[str]]] = []
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class ReceiverHandler(http.server.BaseHTTPRequestHandler):
+    # Persistent connections, as used by HTTPSource
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        server: ReceiverServer = self.server  # type: ignore
+        authorization = self.headers.get("Authorization")
+        server.requests.append((self.path, authorization))
+        body = b""
+        if self.path in server.redirects:
+            status, location = server.redirects[self.path]
+            self.send_response(status)
+            self.send_header("Location", location)
+        elif authorization != server.authorization:
+            self.send_response(401)
+            self.send_header("WWW-Authenticate", 'Basic realm="receiver"')
+        else:
+            body = server.body
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def closed_url() -> str:
+    """Returns the URL of a port without server"""
+    server = socket.create_server(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+    server.close()
+    return f"http://127.0.0.1:{port}/data/aircraft.json"
+
+
+def fetch_multi(source: MultiSource) -> Optional[dict]:
+    """Fetches after all receivers have been polled"""
+    source.start()
+    time_end = time.monotonic() + 5
+    while not all(
+        s is not None or e is not None for s, e in zip(source.snapshots, source.errors)
+    ):
+        assert time.monotonic() < time_end, "Receivers not polled"
+        time.sleep(0.05)
+    return source.fetch()
+
+
+@pytest.fixture
+def multi_source() -> Iterator[Callable[[str], MultiSource]]:
+    sources: List[MultiSource] = []
+
+    def open_multi(url: str) -> MultiSource:
+        source = open_source(url, 1, 0.1)
+        assert isinstance(source, MultiSource)
+        sources.append(source)
+        return source
+
+    yield open_multi
+    for source in sources:
+        source.close()
+
+
+@pytest.fixture
+def receivers() -> Iterator[List[ReceiverServer]]:
+    receivers = [
+        ReceiverServer(
+            {
+                "now": 100.0,
+                "aircraft": [
+                    {"hex": "3c6444", "seen": 5.0, "alt_baro": 1000},
+                    {"hex": "4b1805", "seen": 0.5},
+                ],
+            }
+        ),
+        ReceiverServer(
+            {
+                "now": 101.0,
+                "aircraft": [
+                    {"hex": "3c6444", "seen": 1.0, "alt_baro": 1200},
+                    {"hex": "4400ab", "seen": 2.0},
+                ],
+            }
+        ),
+    ]
+    yield receivers
+    for receiver in receivers:
+        receiver.close()
+
+
+def test_multi_merges_by_hex(
+    receivers: List[ReceiverServer], multi_source: Callable[[str], MultiSource]
+) -> None:
+    source = multi_source(",".join(r.url for r in receivers))
+    data = fetch_multi(source)
+    assert data is not None
+    assert data["now"] == 101.0
+    aircraft = {a["hex"]: a for a in data["aircraft"]}
+    assert aircraft.keys() == {"3c6444", "4b1805", "4400ab"}
+    # Message received at 100.0 by the second receiver, at 95.0 by the first
+    assert aircraft["3c6444"]["alt_baro"] == 1200
+
+
+def test_multi_receiver_down(
+    receivers: List[ReceiverServer], multi_source: Callable[[str], MultiSource]
+) -> None:
+    source = multi_source(f"{receivers[0].url} {closed_url()}")
+    data = fetch_multi(source)
+    assert data is not None
+    assert sorted(a["hex"] for a in data["aircraft"]) == ["3c6444", "4b1805"]
+    assert source.errors[1] is not None
+
+    source = multi_source(f"{closed_url()} {closed_url()}")
+    with pytest.raises(URLError):
+        fetch_multi(source)
+
+
+def test_multi_close_stops_thread(
+    receivers: List[ReceiverServer], multi_source: Callable[[str], MultiSource]
+) -> None:
+    source = multi_source(",".join(r.url for r in receivers))
+    fetch_multi(source)
+    thread = source.thread
+    assert thread is not None and thread.is_alive()
+    source.close()
+    assert source.thread is None
+    assert not thread.is_alive()
+    assert not source.loop.is_running()
+
+
+def test_http_redirects(receivers: List[ReceiverServer]) -> None:
+    origin, other = receivers
+    origin.redirects["/moved"] = (301, "/data/aircraft.json")
+    origin.redirects["/temporary"] = (307, other.url)
+    source = HTTPSource(f"{origin.base}/moved", 1)
+    for _ in range(2):
+        assert source.fetch() == json.loads(origin.body)
+    source.close()
+
+    # Permanent redirects are followed by the next polls as well
+    assert [path for path, _ in origin.requests] == [
+        "/moved",
+        "/data/aircraft.json",
+        "/data/aircraft.json",
+    ]
+
+    source = HTTPSource(f"{origin.base}/temporary", 1)
+    for _ in range(2):
+        assert source.fetch() == json.loads(other.body)
+    source.close()
+    assert [path for path, _ in origin.requests[3:]] == ["/temporary"] * 2
+    assert [path for path, _ in other.requests] == ["/data/aircraft.json"] * 2
+
+
+def test_http_redirect_loop(receivers: List[ReceiverServer]) -> None:
+    origin = receivers[0]
+    origin.redirects["/loop"] = (302, "/loop")
+    source = HTTPSource(f"{origin.base}/loop", 1)
+    with pytest.raises(HTTPError):
+        source.fetch()
+    source.close()
+    assert len(origin.requests) == HTTPSource.redirects_max + 1
+
+    origin.redirects["/ftp"] = (302, "ftp://127.0.0.1/aircraft.json")
+    source = HTTPSource(f"{origin.base}/ftp", 1)
+    with pytest.raises(URLError):
+        source.fetch()
+    source.close()
+
+
+def test_http_basic_authentication(receivers: List[ReceiverServer]) -> None:
+    origin, other = receivers
+    # Credentials of the URL are percent-encoded
+    origin.authorization = "Basic " + base64.b64encode(b"adsb:p@ss:word").decode()
+    url = origin.url.replace("http://", "http://adsb:p%40ss:word@")
+    source = HTTPSource(url, 1)
+    assert source.url == origin.url
+    assert source.fetch() == json.loads(origin.body)
+    source.close()
+
+    source = HTTPSource(origin.url, 1)
+    with pytest.raises(HTTPError) as e:
+        source.fetch()
+    assert e.value.code == 401
+    source.close()
+
+    # Credentials are not sent to other hosts
+    origin.redirects["/temporary"] = (302, other.url)
+    source = HTTPSource(url.replace("/data/aircraft.json", "/temporary"), 1)
+    for _ in range(2):
+        assert source.fetch() == json.loads(other.body)
+    source.close()
+    assert origin.requests[-1] == ("/temporary", origin.authorization)
+    assert other.requests == [("/data/aircraft.json", None)] * 2
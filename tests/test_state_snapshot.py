@@ -0,0 +1,91 @@
+from typing import List
+
+import pytest
+
+from Aircraft import Aircraft
+from Record import Record
+from States import States
+from StateSnapshot import StateSnapshot
+
+time_json = 1700000000.0
+
+
+def tracked_flights() -> List[Aircraft]:
+    tracked = Aircraft("3c6444", "DLH1", "D-AIAB", "A320", States(alt_baro=1000))
+    tracked.time_start, tracked.time_end = 1699999000, 1699999900
+    sample = Aircraft("3c6444", states=States(alt_baro=1200, gs=300))
+    sample.time_start = sample.time_end = 1699999900
+    tracked.merge(sample)
+    return [tracked.compact(), Aircraft("4b1805", time_start=1699999500).compact()]
+
+
+def records() -> List[Record]:
+    records = []
+    for s in States.key_list:
+        for is_max in [False, True]:
+            record = Record()
+            record.record_key = s
+            record.is_max = is_max
+            records.append(record)
+    records[1].aircraft = Aircraft("3c6444", "DLH1", states=States(alt_baro=1200))
+    records[1].timestamp = 1699999900
+    return records
+
+
+@pytest.fixture
+def snapshot(tmp_path) -> StateSnapshot:
+    snapshot = StateSnapshot(str(tmp_path / "adsb-logger.snapshot"))
+    snapshot.write(snapshot.dump(time_json, "adsb.db", 5, tracked_flights(), records()))
+    return snapshot
+
+
+def test_round_trip(snapshot: StateSnapshot) -> None:
+    state = snapshot.load("adsb.db", 5, time_json - 60)
+    assert state is not None
+    tracked, loaded_records = state
+    assert tracked == tracked_flights()
+    assert tracked[0].aggregates is not None
+    assert tracked[0].aggregates.values[:4] == [1000, 1200, 1200, 2]
+    assert [
+        (r.record_key, r.is_max, r.timestamp, r.is_stored, r.aircraft)
+        for r in loaded_records
+    ] == [
+        (r.record_key, r.is_max, r.timestamp, r.is_stored, r.aircraft)
+        for r in records()
+    ]
+
+
+def test_missing_snapshot(tmp_path) -> None:
+    snapshot = StateSnapshot(str(tmp_path / "adsb-logger.snapshot"))
+    assert snapshot.load("adsb.db", 5, 0) is None
+    snapshot.remove()
+
+
+@pytest.mark.parametrize(
+    "position", [0, 10, StateSnapshot.header.size + 5, -1], ids=str
+)
+def test_corrupted_snapshot(snapshot: StateSnapshot, position: int) -> None:
+    with open(snapshot.path, "rb") as snapshot_file:
+        data = bytearray(snapshot_file.read())
+    data[position] ^= 0xFF
+    snapshot.write(bytes(data))
+    assert snapshot.load("adsb.db", 5, 0) is None
+
+
+def test_incomplete_snapshot(snapshot: StateSnapshot) -> None:
+    with open(snapshot.path, "rb") as snapshot_file:
+        data = snapshot_file.read()
+    for length in [0, StateSnapshot.header.size - 1, len(data) - 1]:
+        snapshot.write(data[:length])
+        assert snapshot.load("adsb.db", 5, 0) is None
+
+
+def test_invalid_snapshot(snapshot: StateSnapshot) -> None:
+    # Outdated, or written for another database or schema
+    assert snapshot.load("adsb.db", 5, time_json + 1) is None
+    assert snapshot.load("other.db", 5, 0) is None
+    assert snapshot.load("adsb.db", 6, 0) is None
+    assert snapshot.load("adsb.db", 5, time_json) is not None
+
+    snapshot.remove()
+    assert snapshot.load("adsb.db", 5, 0) is None
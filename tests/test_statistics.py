@@ -0,0 +1,58 @@
+import json
+import sqlite3
+import threading
+from typing import Iterator, Tuple
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from Database import Database
+from StatisticsService import StatisticsService
+
+
+@pytest.fixture
+def service(config) -> Iterator[Tuple[StatisticsService, str]]:
+    Database(config).close()
+    service = StatisticsService(config)
+    thread = threading.Thread(target=service.serve, args=(0,), daemon=True)
+    thread.start()
+    while service.server is None:
+        thread.join(0.01)
+    yield service, f"http://127.0.0.1:{service.server.server_address[1]}"
+    service.server.shutdown()
+    thread.join()
+    service.close()
+
+
+def status(url: str) -> int:
+    try:
+        with urlopen(url, timeout=5) as response:
+            json.load(response)
+            return response.status
+    except HTTPError as e:
+        return e.code
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["from=inf", "from=-inf", "from=nan", "to=1e20", "from=-1e20", "from=x"],
+)
+def test_invalid_timestamp(service, query: str) -> None:
+    _, url = service
+    assert status(f"{url}/counts?{query}") == 400
+    assert status(f"{url}/top/flight?{query}") == 400
+    # The handler still serves other requests
+    assert status(f"{url}/counts?from=0") == 200
+
+
+def test_failed_evaluation(service, monkeypatch) -> None:
+    service, url = service
+
+    def evaluate(arguments: tuple) -> list:
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(service, "evaluate", evaluate)
+    assert status(f"{url}/counts") == 500
+    monkeypatch.undo()
+    assert status(f"{url}/counts") == 200
@@ -0,0 +1,175 @@
+import random
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from Aircraft import Aircraft
+from Tracker import FlightTracker
+
+unique_flight = 600
+
+
+class LinearTracker:
+    """Previous implementation: list of tracked flights, scanned for each aircraft"""
+
+    def __init__(self) -> None:
+        self.tracked: List[Aircraft] = []
+
+    def find(self, aircraft: Aircraft, time_min: float) -> Optional[Aircraft]:
+        for t in reversed(self.tracked):
+            if t.time_start > time_min and t.is_identical(aircraft):  # type: ignore
+                return t
+        return None
+
+    def add(self, aircraft: Aircraft) -> Aircraft:
+        self.tracked.append(aircraft)
+        return aircraft
+
+    def merge(self, tracked: Aircraft, aircraft: Aircraft) -> None:
+        tracked.merge(aircraft)
+
+    def expire(self, time_min: float) -> List[Aircraft]:
+        expired = [t for t in self.tracked if t.time_start < time_min]  # type: ignore
+        self.tracked = [t for t in self.tracked if t not in expired]
+        return expired
+
+
+def aircraft(
+    hex: Optional[str],
+    flight: Optional[str] = None,
+    registration: Optional[str] = None,
+    ac_type: Optional[str] = None,
+    *,
+    now: int = 0,
+) -> Aircraft:
+    return Aircraft(hex, flight, registration, ac_type, time_start=now, time_end=now)
+
+
+def identity(aircraft: Aircraft) -> Tuple:
+    return (
+        aircraft.hex,
+        aircraft.flight,
+        aircraft.registration,
+        aircraft.ac_type,
+        aircraft.time_start,
+        aircraft.time_end,
+    )
+
+
+def random_aircraft(rng: random.Random, now: int) -> Aircraft:
+    """Returns an aircraft from a small pool, often with unknown or empty values"""
+
+    def value(choices: List[Optional[str]]) -> Optional[str]:
+        return rng.choice([None, None, ""] + choices)
+
+    return aircraft(
+        value(["3c6444", "4b1805", "4400ab"]),
+        value(["DLH1", "SWR2", "AUA3"]),
+        value(["D-AIAB", "HB-JCA", "OE-LBA"]),
+        value(["A320", "B738"]),
+        now=now,
+    )
+
+
+def merge(tracker, current: List[Aircraft], now: int) -> List[Optional[Tuple]]:
+    """Merges the aircraft as the logger does and returns the matched flights"""
+    matches: List[Optional[Tuple]] = []
+    for c in current:
+        t = tracker.find(c, now - unique_flight)
+        matches.append(None if t is None else identity(t))
+        if t is None:
+            tracker.add(c)
+        else:
+            tracker.merge(t, c)
+    return matches
+
+
+def copies(current: List[Aircraft]) -> List[Aircraft]:
+    # Merging also completes the unknown values of the aircraft
+    return [
+        aircraft(c.hex, c.flight, c.registration, c.ac_type, now=c.time_start or 0)
+        for c in current
+    ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_tracker_matches_linear_scan(seed: int) -> None:
+    rng = random.Random(seed)
+    linear = LinearTracker()
+    tracker = FlightTracker()
+    for now in range(0, 3000, 10):
+        current = [random_aircraft(rng, now) for _ in range(rng.randrange(8))]
+        assert merge(tracker, copies(current), now) == merge(
+            linear, copies(current), now
+        )
+        if now % 100 == 0:
+            time_min = now - unique_flight
+            assert [identity(t) for t in tracker.expire(time_min)] == [
+                identity(t) for t in linear.expire(time_min)
+            ]
+        assert [identity(t) for t in tracker] == [identity(t) for t in linear.tracked]
+
+
+def test_find_wildcards() -> None:
+    tracker = FlightTracker()
+    known = tracker.add(aircraft("3c6444", "DLH1", "D-AIAB", now=0))
+    unknown_hex = tracker.add(aircraft(None, "SWR2", now=10))
+    empty = tracker.add(aircraft(None, now=20))
+
+    # Flights with unknown values match any aircraft, the most recent one first
+    assert tracker.find(aircraft("3c6444", "DLH1"), -1) is empty
+    assert tracker.find(aircraft(None), -1) is empty
+    assert tracker.find(aircraft("3c6444", "DLH1"), 15) is empty
+    assert tracker.find(aircraft("3c6444", "DLH1"), 20) is None
+    tracker.expire(15)
+    assert tracker.find(aircraft("3c6444", "DLH1", "D-AIAB"), 5) is empty
+    assert known not in list(tracker) and unknown_hex not in list(tracker)
+
+
+def test_find_empty_values() -> None:
+    tracker = FlightTracker()
+    empty_hex = tracker.add(aircraft("", "SWR2", now=0))
+    tracker.add(aircraft("3c6444", "DLH1", now=10))
+
+    # Empty strings are values, which do not match other values
+    assert tracker.find(aircraft("", "SWR2"), -1) is empty_hex
+    assert tracker.find(aircraft("4b1805", "SWR2"), -1) is None
+    assert tracker.find(aircraft(None, "SWR2"), -1) is empty_hex
+    assert tracker.find(aircraft("", "DLH1"), -1) is None
+
+
+@pytest.mark.parametrize("var", ["hex", "flight", "registration"])
+def test_find_after_identifier_change(var: str) -> None:
+    values: Dict[str, Optional[str]] = {
+        "hex": "3c6444",
+        "flight": "DLH1",
+        "registration": "D-AIAB",
+    }
+    changed = {**values, var: "4b1805"}
+
+    def identified(values: Dict[str, Optional[str]], now: int = 0) -> Aircraft:
+        return aircraft(
+            values["hex"], values["flight"], values["registration"], now=now
+        )
+
+    tracker = FlightTracker()
+    tracked = tracker.add(identified({**values, var: None}))
+    assert tracker.find(identified(values), -1) is tracked
+    assert tracker.find(identified(changed), -1) is tracked
+
+    # The merge sets the value, which has to replace the wildcard in the index
+    assert tracker.merge(tracked, identified(values, 10))
+    assert tracker.find(identified(values), -1) is tracked
+    assert tracker.find(identified(changed), -1) is None
+    assert not tracker.merge(tracked, identified(values, 20))
+    assert tracker.expire(1) == [tracked]
+    assert tracker.find(identified(values), -1) is None
+
+
+def test_expire_in_start_order() -> None:
+    tracker = FlightTracker()
+    for now in [30, 10, 20, 40]:
+        tracker.add(aircraft(f"{now:06x}", now=now))
+    assert [t.time_start for t in tracker] == [10, 20, 30, 40]
+    assert [t.time_start for t in tracker.expire(35)] == [10, 20, 30]
+    assert [t.time_start for t in tracker] == [40]